@@ -2,21 +2,30 @@ from __future__ import annotations
 
 import argparse
 import datetime
-import difflib
 import logging
-from pyclbr import Class
+import sys
 from typing import List
 
-import docker
-
-from logic.dockerfile_obj import Dockerfile
-from smell_solvers.smell_solver import SmellSolver
+from logic.dockerfile_obj import HADOLINT_CODES, INVALID_CODES, Dockerfile
+from logic.fix_engine import FixEngine
+from logic.lint_cache import configure_lint_cache
+from logic.prefetch import MAX_WORKERS, PrefetchPlanner
+from logic.report import REPORT_EXTENSIONS, REPORT_FORMATS, make_report
+from smell_solvers.registry import get_registry
 from utils.cache_handler import clear_cache
+from utils.dockerhub_api import LATEST_TAG_SOURCES, configure_latest_tag_source
+from utils.package_index import PACKAGE_INDEX_PATH, configure_package_index
+from utils.registry_api import REGISTRY_URL
+from utils.series_table import configure_series_table
+from utils.snapshot import SNAPSHOT_PATH, SnapshotError, configure_snapshot
+from utils.tag_index import configure_tag_index
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s :: %(levelname)s :: %(message)s')
 logger = logging.getLogger(__name__.split('.')[0])
 logger.setLevel(logging.DEBUG)
 
+STDIN_PATH = '-'
+
 
 def get_argparser() -> argparse.ArgumentParser:
     """
@@ -30,6 +39,45 @@ def get_argparser() -> argparse.ArgumentParser:
                         dest='cache',
                         required=False,
                         help='If selected, clears the cache of pulled image')
+    parser.add_argument('--latest-tag-source',
+                        metavar='source',
+                        dest='latest_tag_source',
+                        choices=LATEST_TAG_SOURCES,
+                        default='hub',
+                        required=False,
+                        help='How the tag equivalent to "latest" is found (DL3006, DL3007): "hub" looks for the tags '
+                             'with the same digest in the DockerHub tags, "registry" compares the manifest digests '
+                             'of the version tags through the registry API (default: hub)')
+    parser.add_argument('--registry-url',
+                        metavar='url',
+                        dest='registry_url',
+                        default=REGISTRY_URL,
+                        required=False,
+                        help=f'URL of the registry used by "--latest-tag-source registry" (default: {REGISTRY_URL})')
+    parser.add_argument('--snapshot',
+                        metavar='snapshot_file',
+                        dest='snapshot',
+                        nargs='?',
+                        const=SNAPSHOT_PATH,
+                        required=False,
+                        help='Run the DockerHub and Launchpad lookups offline, from a snapshot file made with '
+                             '"dockleaner_data.py export-snapshot" (default: the one installed with '
+                             '"dockleaner_data.py import-snapshot")')
+    parser.add_argument('--package-index',
+                        metavar='index_file',
+                        dest='package_index',
+                        nargs='?',
+                        const=PACKAGE_INDEX_PATH,
+                        required=False,
+                        help='Look up the package versions (DL3008) of the series of an archive mirror in a package '
+                             'index made with "dockleaner_data.py build-package-index" instead of Launchpad '
+                             f'(default: {PACKAGE_INDEX_PATH})')
+    parser.add_argument('--lint-cache-dir',
+                        metavar='cache_dir',
+                        dest='lint_cache_dir',
+                        required=False,
+                        help='Directory where the lint and parse results are cached by content, so that identical '
+                             'Dockerfiles are linted only once across runs (default: results cached in memory only)')
     parser.add_argument('--overwrite', '-o',
                         action='store_true',
                         dest='overwrite',
@@ -47,13 +95,34 @@ def get_argparser() -> argparse.ArgumentParser:
                         nargs='+',
                         required=False,
                         help='Specify one or more specific rules to fix')
+    parser.add_argument('--report', '-r',
+                        metavar='report_format',
+                        dest='report',
+                        choices=REPORT_FORMATS,
+                        default='none',
+                        help='Format of the report of the fixes: ' + ', '.join(REPORT_FORMATS) + ' (default: none). '
+                             'The report is written next to the Dockerfile ("-log.diff", "-log.json" or "-log.html"), '
+                             'or to stdout instead of the fixed Dockerfile with "--path -"')
+    parser.add_argument('--prefetch-workers',
+                        metavar='n_workers',
+                        dest='prefetch_workers',
+                        type=int,
+                        default=MAX_WORKERS,
+                        help='Number of concurrent remote lookups resolved before fixing (default: '
+                             f'{MAX_WORKERS}). Set 0 to resolve them one at a time while fixing')
+    parser.add_argument('--patch',
+                        action='store_const',
+                        const='unified',
+                        dest='report',
+                        help='Same as "--report unified"')
 
     required = parser.add_argument_group('required arguments')
     required.add_argument('--path', '-p',
                           metavar='filepath',
                           dest='path',
                           required=True,
-                          help='The path of the Dockerfile')
+                          help='The path of the Dockerfile. Use "-" to read it from stdin and write the result '
+                               'to stdout, without writing any file')
 # todo: if not date provided, use current as default
     required.add_argument('--last-edit', '-d',
                           metavar='dockerfile_date',
@@ -79,54 +148,63 @@ def date_string(s: str) -> datetime:
         raise argparse.ArgumentTypeError(msg)
 
 
-def get_class(kls: str) -> Class:
+def get_ignored_rules(to_fix: List = None, ignored: List = None) -> List[str]:
     """
-    Retrieve the instance of a specific class
-    :param kls: class filepath
-    :return: a Class object
+    Compute the rules that the solver must skip
+    :param to_fix: rules to fix exclusively, if any. The other known rules are not checked at all, except the ones
+        reporting an invalid Dockerfile
+    :param ignored: rules to ignore, used only when to_fix is not given
+    :return: list of rule codes to not fix
     """
-    parts = kls.split('.')
-    module = ".".join(parts[:-1])
-    m = __import__(module)
-    for comp in parts[1:]:
-        m = getattr(m, comp)
-    return m
+    if to_fix:
+        logger.info("Fixing only: %s", to_fix)
+        known = sorted(set(HADOLINT_CODES).union(get_registry().codes()))
+        return [r for r in known if r not in to_fix and r not in INVALID_CODES]
+    elif ignored:
+        logger.info("Ignoring rules: %s", ignored)
+        return list(ignored)
+
+    return list()
 
 
-def fix_dockerfile(dockerfile: Dockerfile, ignored_rules: List) -> None:
+def fix_dockerfile(dockerfile: Dockerfile, ignored_rules: List, record_edits: bool = False,
+                   prefetch_workers: int = MAX_WORKERS) -> int:
     """
     Fix the given Dockerfile
     :param dockerfile: Dockerfile to fix
     :param ignored_rules: list of rules to not fix
+    :param record_edits: if True, the edits made by each fix are recorded in dockerfile.edits
+    :param prefetch_workers: number of concurrent remote lookups resolved before fixing. 0 disables the prefetch
+    :return: number of fixed smells
     """
-    RULES_PATH = 'smell_solvers.rules.'
-    solver = SmellSolver()
+    if prefetch_workers > 0:
+        PrefetchPlanner(dockerfile, ignored_rules, prefetch_workers).run()
 
-    keys = list(dockerfile.smells_dict.keys())
-    fixed_lines = []
-    dict_changed = True
-    while dict_changed:
-        dict_changed = False
+    engine = FixEngine(dockerfile, ignored_rules, record_edits=record_edits)
+    return engine.run()
 
-        for pos in keys:
-            smells = dockerfile.smells_dict[pos]
-            for smell in smells:
-                if solver.strategy_exists(smell.code) and smell.code not in ignored_rules:
-                    logger.info(f'Fixing smell {smell.code} on line {smell.line}')
-                    # Dynamically choose the strategy
-                    solver.strategy = get_class(RULES_PATH + smell.code + '.' + smell.code)()
-                    solver.fix_smell(dockerfile, pos)
-                    fixed_lines.append(smell.line)
 
-            # Check if dictionary line position changed after fix
-            if dockerfile.lines_changed:
-                keys = list(set(dockerfile.smells_dict.keys()) - set(fixed_lines))
-                dict_changed = True
-                dockerfile.lines_changed = False
-                break
+def use_memory_caches() -> None:
+    """
+    Keep the state and the caches of the remote lookups in the process only, so that no file is written
+    """
+    # the HTTP client is imported by the remote lookups only, to keep the startup fast
+    from utils.http_client import configure_http_client
+    from utils.rate_limiter import configure_rate_limits
+
+    configure_rate_limits(state_dir=None)
+    configure_http_client(store_dir=None)
+    configure_tag_index(index_dir=None)
+    configure_series_table(table_dir=None)
+
 
-            if dict_changed:
-                break
+def log_http_stats() -> None:
+    """
+    Log the stats of the HTTP client, if a remote lookup used it
+    """
+    http_client = sys.modules.get('utils.http_client')
+    if http_client is not None:
+        http_client.log_http_stats()
 
 
 def produce_dockerfile(dockerfile: Dockerfile, overwrite: bool) -> None:
@@ -144,48 +222,87 @@ def produce_dockerfile(dockerfile: Dockerfile, overwrite: bool) -> None:
             logger.info(f'You can find the resulting Dockerfile at: {filepath}')
 
 
-def produce_log(filepath) -> None:
+def produce_stream(dockerfile: Dockerfile, report_format: str) -> None:
     """
-    Generate the log of Dockerfile fixes
-    :param filepath: path of the original Dockerfile
+    Write the fixed Dockerfile, or the report of its fixes, to stdout
+    :param dockerfile: fixed Dockerfile
+    :param report_format: format of the report. If 'none', the fixed Dockerfile is written
     """
-    original_dockerfile = open(filepath).readlines()
-    fixed_dockerfile = open(filepath + '-fixed').readlines()
+    report = make_report(report_format, dockerfile.original_lines, dockerfile.lines, dockerfile.edits, 'Dockerfile')
+    if report is None:
+        sys.stdout.writelines(dockerfile.lines)
+    else:
+        sys.stdout.write(report)
+    sys.stdout.flush()
 
-    diff = difflib.HtmlDiff().make_file(original_dockerfile, fixed_dockerfile, filepath, filepath + '-fixed', charset='utf-8')
-    with open(filepath + '-log.html', 'w', encoding='utf8') as file:
-        file.write(diff)
 
+def produce_log(dockerfile: Dockerfile, report_format: str) -> None:
+    """
+    Generate the log of Dockerfile fixes from the original and the fixed lines kept in memory
+    :param dockerfile: fixed Dockerfile
+    :param report_format: format of the report. Nothing is written if 'none'
+    """
+    report = make_report(report_format, dockerfile.original_lines, dockerfile.lines, dockerfile.edits,
+                         dockerfile.filepath)
+    if report is None:
+        return
+
+    filepath = dockerfile.filepath + REPORT_EXTENSIONS[report_format]
+    with open(filepath, 'w', encoding='utf8') as file:
+        file.write(report)
+    logger.info(f'You can find the report of the fixes at: {filepath}')
 
-if __name__ == '__main__':
-    try:
-        docker.from_env().info()
-    except:
-        logger.error("Docker daemon is not available. Please install and start Docker before running the tool.")
 
+if __name__ == '__main__':
     parser = get_argparser()
     args = parser.parse_args()
 
     if args.cache:
         clear_cache()
 
+    if args.lint_cache_dir:
+        configure_lint_cache(cache_dir=args.lint_cache_dir)
+
+    configure_latest_tag_source(args.latest_tag_source, args.registry_url)
+
+    if args.snapshot:
+        try:
+            configure_snapshot(args.snapshot)
+        except (OSError, SnapshotError) as e:
+            parser.error(f'cannot use the snapshot: {e}')
+
+    if args.package_index:
+        try:
+            configure_package_index(args.package_index)
+        except (OSError, SnapshotError) as e:
+            parser.error(f'cannot use the package index: {e}')
+
     fix_and_overwrite = True if args.overwrite else False
 
-    ignored_rules = list()
-    if args.to_fix:
-        logger.info("Fixing only: %s", args.to_fix)
-        ignored_rules = [r for r in SmellSolver()._available_strategies if r not in args.to_fix]
-    elif args.ignored:
-        logger.info("Ignoring rules: %s", args.ignored)
-        ignored_rules = args.ignored
+    ignored_rules = get_ignored_rules(args.to_fix, args.ignored)
+
+    record_edits = args.report == 'json'
+
+    if args.path == STDIN_PATH:
+        use_memory_caches()
+        dockerfile = Dockerfile(args.path, args.date, sys.stdin.read(), ignored_rules)
+
+        if dockerfile.smells_dict:
+            fix_dockerfile(dockerfile, ignored_rules, record_edits, args.prefetch_workers)
+        else:
+            logger.info(f'Your Dockerfile has no smells.')
 
-    dockerfile = Dockerfile(args.path, args.date)
+        produce_stream(dockerfile, args.report)
+        log_http_stats()
+        sys.exit(0)
+
+    dockerfile = Dockerfile(args.path, args.date, ignored_rules=ignored_rules)
 
     if dockerfile.smells_dict:
-        fix_dockerfile(dockerfile, ignored_rules)
+        fix_dockerfile(dockerfile, ignored_rules, record_edits, args.prefetch_workers)
         produce_dockerfile(dockerfile, fix_and_overwrite)
-
-        if not fix_and_overwrite:
-            produce_log(args.path)
+        produce_log(dockerfile, args.report)
     else:
         logger.info(f'Your Dockerfile has no smells.')
+
+    log_http_stats()
@@ -0,0 +1,352 @@
+from __future__ import annotations
+
+import argparse
+import datetime
+import glob
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Tuple
+
+from dockleaner import date_string, fix_dockerfile, get_ignored_rules, produce_dockerfile, produce_log
+from logic.dockerfile_obj import Dockerfile
+from logic.lint_cache import configure_lint_cache
+from logic.linter import FLUSH_LATENCY, BatchLinter
+from logic.report import REPORT_EXTENSIONS, REPORT_FORMATS
+from utils.cache_handler import clear_cache
+from utils.dockerhub_api import LATEST_TAG_SOURCES, configure_latest_tag_source
+from utils.http_client import log_http_stats
+from utils.package_index import PACKAGE_INDEX_PATH, configure_package_index
+from utils.registry_api import REGISTRY_URL
+from utils.snapshot import SNAPSHOT_PATH, SnapshotError, configure_snapshot
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s :: %(levelname)s :: %(message)s')
+logger = logging.getLogger(__name__.split('.')[0])
+logger.setLevel(logging.DEBUG)
+
+GLOB_CHARS = '*?['
+THREADS = 8
+
+# linter shared by the threads of a worker process, set by init_worker
+_linter = None
+
+
+def get_argparser() -> argparse.ArgumentParser:
+    """
+    Get the configured argument parser
+    """
+
+    parser = argparse.ArgumentParser(description='Fix the smells of many Dockerfiles in parallel')
+    parser.add_argument('targets',
+                        metavar='target',
+                        nargs='*',
+                        help='Dockerfile, directory (searched recursively) or glob pattern')
+    parser.add_argument('--manifest', '-m',
+                        metavar='manifest_file',
+                        dest='manifest',
+                        required=False,
+                        help='File listing one Dockerfile per line, optionally followed by ",YYYY-MM-DD"')
+    parser.add_argument('--workers', '-w',
+                        metavar='n_workers',
+                        dest='workers',
+                        type=positive_int,
+                        default=os.cpu_count(),
+                        help='Number of worker processes (default: number of CPUs)')
+    parser.add_argument('--threads', '-t',
+                        metavar='n_threads',
+                        dest='threads',
+                        type=int,
+                        default=THREADS,
+                        help=f'Number of Dockerfiles fixed at once by each worker process (default: {THREADS})')
+    parser.add_argument('--batch-size', '-b',
+                        metavar='batch_size',
+                        dest='batch_size',
+                        type=int,
+                        required=False,
+                        help='Maximum number of Dockerfiles linted by a single hadolint call '
+                             '(default: the number of threads)')
+    parser.add_argument('--flush-latency',
+                        metavar='seconds',
+                        dest='flush_latency',
+                        type=float,
+                        default=FLUSH_LATENCY,
+                        help='Maximum time a lint request waits for its batch to fill up before hadolint is called '
+                             f'(default: {FLUSH_LATENCY})')
+    parser.add_argument('--cache', '-c',
+                        action='store_true',
+                        dest='cache',
+                        required=False,
+                        help='If selected, clears the cache of pulled image')
+    parser.add_argument('--latest-tag-source',
+                        metavar='source',
+                        dest='latest_tag_source',
+                        choices=LATEST_TAG_SOURCES,
+                        default='hub',
+                        required=False,
+                        help='How the tag equivalent to "latest" is found (DL3006, DL3007): "hub" looks for the tags '
+                             'with the same digest in the DockerHub tags, "registry" compares the manifest digests '
+                             'of the version tags through the registry API (default: hub)')
+    parser.add_argument('--registry-url',
+                        metavar='url',
+                        dest='registry_url',
+                        default=REGISTRY_URL,
+                        required=False,
+                        help=f'URL of the registry used by "--latest-tag-source registry" (default: {REGISTRY_URL})')
+    parser.add_argument('--snapshot',
+                        metavar='snapshot_file',
+                        dest='snapshot',
+                        nargs='?',
+                        const=SNAPSHOT_PATH,
+                        required=False,
+                        help='Run the DockerHub and Launchpad lookups offline, from a snapshot file made with '
+                             '"dockleaner_data.py export-snapshot" (default: the one installed with '
+                             '"dockleaner_data.py import-snapshot")')
+    parser.add_argument('--package-index',
+                        metavar='index_file',
+                        dest='package_index',
+                        nargs='?',
+                        const=PACKAGE_INDEX_PATH,
+                        required=False,
+                        help='Look up the package versions (DL3008) of the series of an archive mirror in a package '
+                             'index made with "dockleaner_data.py build-package-index" instead of Launchpad '
+                             f'(default: {PACKAGE_INDEX_PATH})')
+    parser.add_argument('--lint-cache-dir',
+                        metavar='cache_dir',
+                        dest='lint_cache_dir',
+                        required=False,
+                        help='Directory where the lint and parse results are cached by content, so that identical '
+                             'Dockerfiles are linted only once across runs (default: results cached in memory only)')
+    parser.add_argument('--overwrite', '-o',
+                        action='store_true',
+                        dest='overwrite',
+                        required=False,
+                        help='Set TRUE to overwrite the target Dockerfiles after the fix')
+    parser.add_argument('--ignore', '-i',
+                        metavar='rules_to_ignore',
+                        dest='ignored',
+                        nargs='+',
+                        required=False,
+                        help='The rules that the solver must ignore')
+    parser.add_argument('--rule',
+                        metavar='rules_to_fix',
+                        dest='to_fix',
+                        nargs='+',
+                        required=False,
+                        help='Specify one or more specific rules to fix')
+    parser.add_argument('--report', '-r',
+                        metavar='report_format',
+                        dest='report',
+                        choices=REPORT_FORMATS,
+                        default='none',
+                        help='Format of the report written next to each fixed Dockerfile: '
+                             + ', '.join(REPORT_FORMATS) + ' (default: none)')
+    parser.add_argument('--verbose', '-v',
+                        action='store_true',
+                        dest='verbose',
+                        required=False,
+                        help='Show the log of each fix. By default only warnings and errors are shown')
+
+    required = parser.add_argument_group('required arguments')
+    required.add_argument('--last-edit', '-d',
+                          metavar='dockerfile_date',
+                          dest='date',
+                          required=True,
+                          type=date_string,
+                          help='Default last edit date of the Dockerfiles. Format "YYYY-MM-DD".')
+
+    return parser
+
+
+def positive_int(s: str) -> int:
+    """
+    Get a strictly positive number from the given string
+    :param s: number string
+    :return: the number
+    """
+    try:
+        value = int(s)
+    except ValueError:
+        value = 0
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"Not a positive number: '{s}'.")
+    return value
+
+
+def is_dockerfile_name(filename: str) -> bool:
+    """
+    Check if the given file name looks like a Dockerfile
+    :param filename: name of the file
+    :return: True/False
+    """
+    # the outputs of a previous run
+    if filename.endswith(('-fixed',) + tuple(REPORT_EXTENSIONS.values())):
+        return False
+
+    lower_name = filename.lower()
+    return lower_name.startswith('dockerfile') or lower_name.endswith('.dockerfile')
+
+
+def collect_targets(targets: List[str], manifest: str, date: datetime) -> List[Tuple[str, datetime]]:
+    """
+    Expand the given targets into the list of Dockerfiles to fix
+    :param targets: Dockerfiles, directories or glob patterns
+    :param manifest: path of a manifest file with one "path[,YYYY-MM-DD]" entry per line
+    :param date: default last edit date
+    :return: list of (path, last edit date) pairs, without duplicates
+    """
+    jobs = list()
+
+    for target in targets:
+        if any(c in target for c in GLOB_CHARS):
+            paths = sorted(p for p in glob.glob(target, recursive=True) if os.path.isfile(p))
+        elif os.path.isdir(target):
+            paths = list()
+            for root, dirs, files in os.walk(target):
+                dirs.sort()
+                paths.extend(os.path.join(root, f) for f in sorted(files) if is_dockerfile_name(f))
+        else:
+            paths = [target]
+
+        jobs.extend((p, date) for p in paths)
+
+    if manifest:
+        with open(manifest, encoding='utf8') as file:
+            for entry in file:
+                entry = entry.strip()
+                if not entry or entry.startswith('#'):
+                    continue
+
+                path, _, entry_date = entry.partition(',')
+                jobs.append((path.strip(), date_string(entry_date.strip()) if entry_date.strip() else date))
+
+    seen = set()
+    unique_jobs = list()
+    for path, job_date in jobs:
+        if path not in seen:
+            seen.add(path)
+            unique_jobs.append((path, job_date))
+
+    return unique_jobs
+
+
+def init_worker(verbose: bool, batch_size: int, flush_latency: float, lint_cache_dir: str,
+                latest_tag_source: str = 'hub', registry_url: str = REGISTRY_URL, snapshot: str = None,
+                package_index: str = None) -> None:
+    """
+    Initialize a worker process of the pool
+    :param verbose: if False, only warnings and errors are logged
+    :param batch_size: maximum number of Dockerfiles linted by a single hadolint call
+    :param flush_latency: maximum time a lint request waits for its batch to fill up
+    :param lint_cache_dir: directory of the on-disk lint cache, shared by the workers. None to not use it
+    :param latest_tag_source: how the tag equivalent to latest is found, see configure_latest_tag_source
+    :param registry_url: URL of the registry of the 'registry' source
+    :param snapshot: snapshot file of the offline lookups. None to use the network
+    :param package_index: package index file of the package version lookups, memory-mapped by each worker. None to
+        use Launchpad
+    """
+    global _linter
+
+    if not verbose:
+        logging.disable(logging.INFO)
+    _linter = BatchLinter(batch_size, flush_latency)
+    if lint_cache_dir:
+        configure_lint_cache(cache_dir=lint_cache_dir)
+    configure_latest_tag_source(latest_tag_source, registry_url)
+    configure_snapshot(snapshot)
+    configure_package_index(package_index)
+
+
+def fix_chunk(jobs: List[Tuple[str, datetime]], ignored_rules: List[str], overwrite: bool, report_format: str,
+              threads: int) -> List[str]:
+    """
+    Fix a chunk of Dockerfiles with a pool of threads, whose lint requests are batched. Run in a worker process.
+    :param jobs: list of (path, last edit date) pairs
+    :param ignored_rules: list of rules to not fix
+    :param overwrite: boolean that represent the need to overwrite or not the original files
+    :param report_format: format of the report of the fixes
+    :param threads: number of Dockerfiles fixed at once
+    :return: the summary lines of the jobs, in the same order
+    """
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        summary = list(pool.map(lambda job: fix_job(job[0], job[1], ignored_rules, overwrite, report_format), jobs))
+    log_http_stats()
+    return summary
+
+
+def fix_job(path: str, date: datetime, ignored_rules: List[str], overwrite: bool, report_format: str) -> str:
+    """
+    Fix a single Dockerfile. Run in a thread of a worker process of the pool.
+    :param path: path of the Dockerfile
+    :param date: last edit date of the Dockerfile
+    :param ignored_rules: list of rules to not fix
+    :param overwrite: boolean that represent the need to overwrite or not the original file
+    :param report_format: format of the report of the fixes
+    :return: the summary line of the job
+    """
+    start = time.perf_counter()
+    try:
+        dockerfile = Dockerfile(path, date, ignored_rules=ignored_rules, linter=_linter)
+        smells = sum(len(s) for s in dockerfile.smells_dict.values())
+
+        fixed = 0
+        if dockerfile.smells_dict:
+            fixed = fix_dockerfile(dockerfile, ignored_rules, report_format == 'json')
+            produce_dockerfile(dockerfile, overwrite)
+            produce_log(dockerfile, report_format)
+        status = 'OK'
+    except Exception as e:
+        logger.error(f'!!! Cannot fix {path}: {e}')
+        smells = fixed = 0
+        status = 'ERROR'
+
+    elapsed = time.perf_counter() - start
+    return f'{status}\t{path}\tsmells={smells}\tfixed={fixed}\ttime={elapsed:.2f}s'
+
+
+if __name__ == '__main__':
+    parser = get_argparser()
+    args = parser.parse_args()
+
+    if not args.targets and not args.manifest:
+        parser.error('at least one target or a manifest file is required')
+
+    if args.cache:
+        clear_cache()
+
+    if args.snapshot:
+        # checked before the workers open it
+        try:
+            configure_snapshot(args.snapshot)
+        except (OSError, SnapshotError) as e:
+            parser.error(f'cannot use the snapshot: {e}')
+
+    if args.package_index:
+        try:
+            configure_package_index(args.package_index)
+        except (OSError, SnapshotError) as e:
+            parser.error(f'cannot use the package index: {e}')
+
+    ignored_rules = get_ignored_rules(args.to_fix, args.ignored)
+    jobs = collect_targets(args.targets, args.manifest, args.date)
+    logger.info(f'Fixing {len(jobs)} Dockerfiles with {args.workers} workers of {args.threads} threads')
+
+    threads = max(1, args.threads)
+    batch_size = args.batch_size or threads
+    chunk_size = max(threads, len(jobs) // (args.workers * 8))
+    chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(args.verbose, batch_size, args.flush_latency, args.lint_cache_dir,
+                                       args.latest_tag_source, args.registry_url, args.snapshot,
+                                       args.package_index)) as pool:
+        n_chunks = len(chunks)
+        summaries = pool.map(fix_chunk,
+                             chunks,
+                             [ignored_rules] * n_chunks,
+                             [args.overwrite] * n_chunks,
+                             [args.report] * n_chunks,
+                             [threads] * n_chunks)
+        for chunk_summaries in summaries:
+            for summary in chunk_summaries:
+                print(summary, flush=True)
@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import argparse
+import datetime
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from logic.prefetch import MAX_WORKERS
+from utils.docker_utils import KNOWN_DISTROS
+from utils.dockerhub_api import LATEST_TAG_SOURCES, configure_latest_tag_source, export_repository
+from utils.http_client import log_http_stats
+from utils.launchpad_api import LaunchpadAPIException, export_binaries, export_series, fetch_distro_series
+from utils.package_index import ARCHITECTURES, PACKAGE_INDEX_PATH, build_package_index
+from utils.registry_api import REGISTRY_URL
+from utils.series_table import SERIES_TABLE_DIR, refresh_series_table
+from utils.snapshot import META_KEY, SNAPSHOT_PATH, SNAPSHOT_VERSION, SnapshotError, SnapshotReader, write_snapshot
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s :: %(levelname)s :: %(message)s')
+logger = logging.getLogger(__name__.split('.')[0])
+logger.setLevel(logging.DEBUG)
+
+
+def get_argparser() -> argparse.ArgumentParser:
+    """
+    Get the configured argument parser
+    """
+
+    parser = argparse.ArgumentParser(description='Manage the remote data used by the fixes',
+                                     fromfile_prefix_chars='@')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    export = commands.add_parser('export-snapshot',
+                                 help='Fetch the DockerHub and Launchpad data of the given images, series and '
+                                      'packages into a snapshot file')
+    export.add_argument('--output', '-o',
+                        metavar='snapshot_file',
+                        dest='output',
+                        required=True,
+                        help='Path of the snapshot file to write')
+    export.add_argument('--images',
+                        metavar='image',
+                        dest='images',
+                        nargs='+',
+                        default=[],
+                        help='Images whose tags are exported (DL3006, DL3007), e.g. "python" or "bitnami/redis". '
+                             'The distributions of --series are added')
+    export.add_argument('--series',
+                        metavar='distro:series',
+                        dest='series',
+                        nargs='+',
+                        default=[],
+                        help='Distribution series whose packages are exported (DL3008), e.g. "ubuntu:focal"')
+    export.add_argument('--packages',
+                        metavar='package',
+                        dest='packages',
+                        nargs='+',
+                        default=[],
+                        help='Packages whose versions are exported for each of the --series')
+    export.add_argument('--latest-tag-source',
+                        metavar='source',
+                        dest='latest_tag_source',
+                        choices=LATEST_TAG_SOURCES,
+                        default='hub',
+                        help='Also export the tags equivalent to "latest" found in the registry with "registry" '
+                             '(default: hub)')
+    export.add_argument('--registry-url',
+                        metavar='url',
+                        dest='registry_url',
+                        default=REGISTRY_URL,
+                        help=f'URL of the registry used by "--latest-tag-source registry" (default: {REGISTRY_URL})')
+    export.add_argument('--workers', '-w',
+                        metavar='n_workers',
+                        dest='workers',
+                        type=int,
+                        default=MAX_WORKERS,
+                        help=f'Number of concurrent remote lookups (default: {MAX_WORKERS})')
+
+    install = commands.add_parser('import-snapshot',
+                                  help='Check a snapshot file and install it as the one used by "--snapshot"')
+    install.add_argument('snapshot',
+                         metavar='snapshot_file',
+                         help='Snapshot file made with export-snapshot')
+    install.add_argument('--target',
+                         metavar='path',
+                         dest='target',
+                         default=SNAPSHOT_PATH,
+                         help=f'Where the snapshot is installed (default: {SNAPSHOT_PATH})')
+
+    refresh = commands.add_parser('refresh-series',
+                                  help='Fetch again the series of the given distributions, kept for a week in '
+                                       f'{SERIES_TABLE_DIR}')
+    refresh.add_argument('distros',
+                         metavar='distro',
+                         nargs='*',
+                         default=KNOWN_DISTROS,
+                         help='Distributions to refresh (default: ' + ', '.join(KNOWN_DISTROS) + ')')
+
+    index = commands.add_parser('build-package-index',
+                                help='Index the package versions of the Packages files of Ubuntu archive mirrors or '
+                                     'snapshot directories, for "--package-index"')
+    index.add_argument('archives',
+                       metavar='archive_dir',
+                       nargs='+',
+                       help='Mirror or snapshot directory containing dists/<suite>/Release and Packages(.gz/.xz) '
+                            'files. With several copies of a suite, e.g. dated snapshots, a version is dated by the '
+                            'oldest copy listing it')
+    index.add_argument('--output', '-o',
+                       metavar='index_file',
+                       dest='output',
+                       default=PACKAGE_INDEX_PATH,
+                       help=f'Path of the index file to write (default: {PACKAGE_INDEX_PATH})')
+    index.add_argument('--arch',
+                       metavar='architecture',
+                       dest='architectures',
+                       nargs='+',
+                       default=ARCHITECTURES,
+                       help='Architectures indexed (default: ' + ', '.join(ARCHITECTURES) + ')')
+    index.add_argument('--distro',
+                       metavar='distro',
+                       dest='distro',
+                       default='ubuntu',
+                       help='Distribution of the archive (default: ubuntu)')
+
+    return parser
+
+
+def parse_series(series: List[str]) -> Dict[str, List[str]]:
+    """
+    Group the given series by distribution
+    :param series: series in the format <distro_name>:<distro_series>, e.g. ubuntu:focal
+    :return: the series of each distribution
+    """
+    distros = dict()
+    for entry in series:
+        distro, _, serie = entry.partition(':')
+        if not distro or not serie:
+            raise argparse.ArgumentTypeError(f'Not a valid series (expected format "distro:series"): "{entry}"')
+        distros.setdefault(distro.lower(), [])
+        if serie not in distros[distro.lower()]:
+            distros[distro.lower()].append(serie)
+
+    return distros
+
+
+def export_snapshot(path: str, images: List[str], series: List[str], packages: List[str],
+                    workers: int = MAX_WORKERS) -> Dict:
+    """
+    Fetch the data of the DockerHub and Launchpad lookups of the given images, series and packages and write them
+    to a snapshot file
+    :param path: path of the snapshot file
+    :param images: images whose tag history is exported
+    :param series: series in the format <distro_name>:<distro_series>
+    :param packages: packages whose publications are exported for each series
+    :param workers: number of concurrent remote lookups
+    :return: the description of the snapshot
+    :raise RuntimeError: if some data cannot be fetched. No file is written
+    """
+    start = time.perf_counter()
+    distros = parse_series(series)
+    # get_distro_serie resolves the 'latest' tag of the distribution images
+    images = list(dict.fromkeys(images + list(distros.keys())))
+
+    tasks = [(export_repository, (image,)) for image in images]
+    tasks.extend((export_series, (distro,)) for distro in distros)
+    tasks.extend((export_binaries, (distro, distro_series, package))
+                 for distro, distro_series in distros.items() for package in dict.fromkeys(packages))
+
+    records = dict()
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [(pool.submit(func, *args), func, args) for func, args in tasks]
+        for future, func, args in futures:
+            try:
+                records.update(future.result())
+            except Exception as e:
+                logger.error(f'!!! Cannot export {func.__name__}{args}: {e}')
+                failures += 1
+
+    if failures:
+        raise RuntimeError(f'{failures} of {len(tasks)} exports failed, the snapshot is not written')
+
+    meta = {
+        'version': SNAPSHOT_VERSION,
+        'created': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'images': images,
+        'series': [f'{distro}:{serie}' for distro, distro_series in distros.items() for serie in distro_series],
+        'packages': list(dict.fromkeys(packages)),
+    }
+    records[META_KEY] = meta
+    size = write_snapshot(path, records)
+    logger.info(f'Exported {len(records) - 1} records to {path} ({size / 1024:.1f} KiB) '
+                f'in {time.perf_counter() - start:.2f}s')
+    return meta
+
+
+def import_snapshot(path: str, target: str = SNAPSHOT_PATH) -> Dict:
+    """
+    Check the given snapshot file and install it, replacing the previous one atomically
+    :param path: snapshot file made with export_snapshot
+    :param target: where the snapshot is installed
+    :return: the description of the snapshot
+    :raise SnapshotError: if the file is not a valid snapshot
+    """
+    reader = SnapshotReader(path)
+    try:
+        reader.verify()
+        meta = reader.meta
+        records = len(reader)
+    finally:
+        reader.close()
+
+    directory = os.path.dirname(os.path.abspath(target))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(fd)
+    shutil.copyfile(path, tmp_path)
+    os.replace(tmp_path, target)
+
+    logger.info(f'Installed the snapshot of {meta.get("created", "?")} at {target}: {records} records, '
+                f'{len(meta.get("images", []))} images, {len(meta.get("series", []))} series, '
+                f'{len(meta.get("packages", []))} packages')
+    return meta
+
+
+if __name__ == '__main__':
+    parser = get_argparser()
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'export-snapshot':
+            if not args.images and not args.series:
+                parser.error('at least one image or series is required')
+            configure_latest_tag_source(args.latest_tag_source, args.registry_url)
+            export_snapshot(args.output, args.images, args.series, args.packages, args.workers)
+            log_http_stats()
+        elif args.command == 'import-snapshot':
+            import_snapshot(args.snapshot, args.target)
+        elif args.command == 'build-package-index':
+            build_package_index(args.archives, args.output, args.distro.lower(), args.architectures)
+        else:
+            for distro in args.distros:
+                refresh_series_table(distro.lower(), fetch_distro_series)
+    except (SnapshotError, RuntimeError, argparse.ArgumentTypeError, LaunchpadAPIException) as e:
+        logger.error(f'!!! {e}')
+        sys.exit(1)
@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import socketserver
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+from dockleaner import date_string, fix_dockerfile, get_ignored_rules
+from logic.dockerfile_obj import Dockerfile, InvalidDockerfileError
+from logic.lint_cache import configure_lint_cache
+from logic.report import json_report, unified_report
+from utils.package_index import PACKAGE_INDEX_PATH, configure_package_index
+from utils.snapshot import SNAPSHOT_PATH, SnapshotError, configure_snapshot
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s :: %(levelname)s :: %(message)s')
+logger = logging.getLogger(__name__.split('.')[0])
+logger.setLevel(logging.DEBUG)
+
+MAX_CONTENT_LENGTH = 1024 * 1024
+
+
+class BadRequestError(Exception):
+    """Raised when the body of a request is not valid"""
+    pass
+
+
+def get_argparser() -> argparse.ArgumentParser:
+    """
+    Get the configured argument parser
+    """
+
+    parser = argparse.ArgumentParser(description='Serve Dockerfile fixes over HTTP/JSON')
+    parser.add_argument('--host',
+                        metavar='host',
+                        dest='host',
+                        default='127.0.0.1',
+                        help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port',
+                        metavar='port',
+                        dest='port',
+                        type=int,
+                        default=8765,
+                        help='Port to listen on (default: 8765)')
+    parser.add_argument('--socket', '-s',
+                        metavar='socket_path',
+                        dest='socket',
+                        required=False,
+                        help='Listen on the given unix socket instead of a TCP port')
+    parser.add_argument('--snapshot',
+                        metavar='snapshot_file',
+                        dest='snapshot',
+                        nargs='?',
+                        const=SNAPSHOT_PATH,
+                        required=False,
+                        help='Run the DockerHub and Launchpad lookups offline, from a snapshot file made with '
+                             '"dockleaner_data.py export-snapshot" (default: the one installed with '
+                             '"dockleaner_data.py import-snapshot")')
+    parser.add_argument('--package-index',
+                        metavar='index_file',
+                        dest='package_index',
+                        nargs='?',
+                        const=PACKAGE_INDEX_PATH,
+                        required=False,
+                        help='Look up the package versions (DL3008) of the series of an archive mirror in a package '
+                             'index made with "dockleaner_data.py build-package-index" instead of Launchpad '
+                             f'(default: {PACKAGE_INDEX_PATH})')
+    parser.add_argument('--lint-cache-dir',
+                        metavar='cache_dir',
+                        dest='lint_cache_dir',
+                        required=False,
+                        help='Directory where the lint and parse results are cached by content, so that identical '
+                             'Dockerfiles are linted only once across requests and restarts (default: results '
+                             'cached in memory only)')
+
+    return parser
+
+
+def fix_content(content: str, date: str, rules: List[str] = None, ignored: List[str] = None,
+                filename: str = 'Dockerfile', edits: bool = False) -> Dict:
+    """
+    Fix the given Dockerfile content
+    :param content: content of the Dockerfile
+    :param date: last edit date of the Dockerfile. Format "YYYY-MM-DD"
+    :param rules: rules to fix exclusively, if any
+    :param ignored: rules to ignore, used only when rules is not given
+    :param filename: name of the Dockerfile, used in the diff
+    :param edits: if True, the result also lists the edits made by each fix
+    :return: dictionary with the fixed content, the unified diff and the fix stats
+    """
+    start = time.perf_counter()
+    last_edit = date_string(date)
+    ignored_rules = get_ignored_rules(rules, ignored)
+
+    dockerfile = Dockerfile(filename, last_edit, content, ignored_rules)
+    smells = sum(len(s) for s in dockerfile.smells_dict.values())
+
+    fixed = 0
+    if dockerfile.smells_dict:
+        fixed = fix_dockerfile(dockerfile, ignored_rules, edits)
+
+    result = {
+        'fixed': ''.join(dockerfile.lines),
+        'diff': unified_report(dockerfile.original_lines, dockerfile.lines, filename),
+        'smells': smells,
+        'fixed_smells': fixed
+    }
+    if edits:
+        result['edits'] = json.loads(json_report(dockerfile.edits, filename))['edits']
+    result['time'] = time.perf_counter() - start
+
+    return result
+
+
+class FixRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handle the requests to the server.
+
+    GET /health returns the server status.
+    POST /fix accepts a JSON object with the keys "content", "date" (format "YYYY-MM-DD") and, optionally,
+    "rules", "ignore", "filename" and "edits". It returns the fixed content, its unified diff and, if "edits" is
+    true, the list of the edits made by each fix.
+    """
+
+    server_version = 'dockleaner'
+
+    def do_GET(self) -> None:
+        if self.path == '/health':
+            self.__send_json(200, {'status': 'ok'})
+        else:
+            self.__send_json(404, {'error': f'Unknown path {self.path}'})
+
+    def do_POST(self) -> None:
+        if self.path != '/fix':
+            self.__send_json(404, {'error': f'Unknown path {self.path}'})
+            return
+
+        try:
+            request = self.__read_json()
+            result = fix_content(request['content'], request['date'], request.get('rules'),
+                                 request.get('ignore'), request.get('filename', 'Dockerfile'),
+                                 bool(request.get('edits')))
+        except (BadRequestError, argparse.ArgumentTypeError, InvalidDockerfileError) as e:
+            self.__send_json(400, {'error': str(e)})
+            return
+        except Exception as e:
+            logger.exception('Cannot fix the requested Dockerfile')
+            self.__send_json(500, {'error': str(e)})
+            return
+
+        self.__send_json(200, result)
+
+    def address_string(self) -> str:
+        # client_address is empty on unix sockets
+        return self.client_address[0] if self.client_address else self.server.server_address
+
+    def __read_json(self) -> Dict:
+        length = int(self.headers.get('Content-Length', 0))
+        if length <= 0 or length > MAX_CONTENT_LENGTH:
+            raise BadRequestError(f'Invalid Content-Length: {length}')
+
+        try:
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError as e:
+            raise BadRequestError(f'Invalid JSON body: {e}')
+
+        if not isinstance(request, dict) or not isinstance(request.get('content'), str) or 'date' not in request:
+            raise BadRequestError('The body must be an object with the keys "content" and "date"')
+        if not isinstance(request['date'], str):
+            raise BadRequestError('"date" must be a string in the format "YYYY-MM-DD"')
+        for key in ('rules', 'ignore'):
+            value = request.get(key)
+            if value is not None and (not isinstance(value, list) or not all(isinstance(r, str) for r in value)):
+                raise BadRequestError(f'"{key}" must be a list of rule codes, e.g. ["DL3006"]')
+        if not isinstance(request.get('filename', 'Dockerfile'), str):
+            raise BadRequestError('"filename" must be a string')
+
+        return request
+
+    def __send_json(self, status: int, body: Dict) -> None:
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+if __name__ == '__main__':
+    parser = get_argparser()
+    args = parser.parse_args()
+
+    if args.lint_cache_dir:
+        configure_lint_cache(cache_dir=args.lint_cache_dir)
+
+    if args.snapshot:
+        try:
+            configure_snapshot(args.snapshot)
+        except (OSError, SnapshotError) as e:
+            parser.error(f'cannot use the snapshot: {e}')
+
+    if args.package_index:
+        try:
+            configure_package_index(args.package_index)
+        except (OSError, SnapshotError) as e:
+            parser.error(f'cannot use the package index: {e}')
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = ThreadingUnixHTTPServer(args.socket, FixRequestHandler)
+        logger.info(f'Listening on unix socket {args.socket}')
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), FixRequestHandler)
+        logger.info(f'Listening on http://{args.host}:{args.port}')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
@@ -0,0 +1,602 @@
+from __future__ import annotations
+
+import re
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from logic.smell import Smell
+
+# Messages and levels of the rules, as reported by hadolint
+MESSAGES = {
+    'DL3003': ('Use WORKDIR to switch to a directory', 'warning'),
+    'DL3006': ('Always tag the version of an image explicitly', 'warning'),
+    'DL3007': ('Using latest is prone to errors if the image will ever update. Pin the version explicitly to a '
+               'release tag', 'warning'),
+    'DL3008': ('Pin versions in apt get install. Instead of `apt-get install <package>` use '
+               '`apt-get install <package>=<version>`', 'warning'),
+    'DL3009': ('Delete the apt lists (/var/lib/apt/lists) after installing something', 'info'),
+    'DL3014': ('Use the `-y` switch to avoid manual input `apt-get -y install <package>`', 'warning'),
+    'DL3015': ('Avoid additional packages by specifying `--no-install-recommends`', 'info'),
+    'DL3020': ('Use COPY instead of ADD for files and folders', 'error'),
+    'DL3025': ('Use arguments JSON notation for CMD and ENTRYPOINT arguments', 'warning'),
+    'DL3042': ('Avoid use of cache directory with pip. Use `pip install --no-cache-dir <package>`', 'warning'),
+    'DL3047': ('Avoid use of wget without progress bar. Use `wget --progress=dot:giga <url>`. Or consider using '
+               '`-q` or `-nv` (shorthands for `--quiet` or `--no-verbose`).', 'info'),
+    'DL3048': ('Invalid label key.', 'style'),
+    'DL3059': ('Multiple consecutive `RUN` instructions. Consider consolidation.', 'info'),
+    'DL4000': ('MAINTAINER is deprecated', 'error'),
+    'DL4006': ('Set the SHELL option -o pipefail before RUN with a pipe in it. If you are using /bin/sh in an '
+               'alpine image or if your shell is symlinked to busybox then consider explicitly setting your SHELL '
+               'to /bin/ash, or disable this check', 'warning'),
+}
+
+ARCHIVE_EXTENSIONS = ('.tar', '.Z', '.bz2', '.gz', '.lz', '.lzma', '.tZ', '.tb2', '.tbz', '.tbz2', '.tgz', '.tlz',
+                      '.tpz', '.txz', '.xz')
+RESERVED_LABEL_NAMESPACES = ('com.docker.', 'io.docker.', 'org.dockerproject.')
+NON_POSIX_SHELLS = ('pwsh', 'powershell', 'cmd')
+TRUTHY_VALUES = ('1', 'true', 'yes', 'on')
+
+_SHELL_OPERATORS = ('&&', '||', '|&', ';;', '|', '&', ';', '(', ')', '\n')
+_REDIRECTIONS = ('&>>', '<<<', '>>', '<<', '>&', '<&', '&>', '>|', '<>', '>', '<')
+_RESERVED_WORDS = {'if', 'then', 'else', 'elif', 'fi', 'do', 'done', 'while', 'until', '!', '{', '}', 'time'}
+_SKIPPED_COMMANDS = {'for', 'select', 'case', 'esac'}
+_ASSIGNMENT = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*\+?=')
+_LABEL_KEY = re.compile(r'^[a-z][a-z0-9._/-]*$')
+_PIP = re.compile(r'^pip[0-9.]*$')
+_PIPEFAIL = re.compile(r'-[a-zA-Z]*o pipefail')
+
+
+class DetectorError(Exception):
+    """Raised when an instruction cannot be analyzed in process, e.g. a RUN with unbalanced quotes"""
+    pass
+
+
+class Instruction:
+    """
+    Instruction of a Dockerfile, as seen by the detectors: the parsed command plus its stage and its shell commands
+    """
+    __slots__ = ('cmd', 'onbuild', 'line', 'value', 'flags', 'json', 'stage', '_commands')
+
+    def __init__(self, command, stage: int) -> None:
+        self.onbuild = command.cmd.upper() == 'ONBUILD'
+        self.cmd = (command.sub_cmd if self.onbuild else command.cmd).upper()
+        self.line = command.start_line
+        self.value = command.value
+        self.flags = command.flags
+        self.json = command.json
+        self.stage = stage
+        self._commands = None
+
+    @property
+    def commands(self) -> List[List[str]]:
+        """
+        :return: the simple commands (argument lists) run by a RUN instruction
+        """
+        if self._commands is None:
+            if self.json:
+                self._commands = [list(self.value)]
+            else:
+                self._commands = shell_commands(' '.join(self.value))
+        return self._commands
+
+
+def shell_commands(script: str) -> List[List[str]]:
+    """
+    Split a shell script into its simple commands, including the ones in subshells and command substitutions.
+    The words are unquoted and the leading variable assignments are dropped: a command made only of assignments
+    is an empty list.
+    :param script: shell script
+    :return: list of the arguments of each command, program name first
+    """
+    commands = list()
+    current = list()
+    skip = False
+    tokens = _tokenize(script)
+    i = 0
+    while i < len(tokens):
+        kind, text, substitutions = tokens[i]
+        i += 1
+
+        for inner in substitutions:
+            commands.extend(shell_commands(inner))
+
+        if kind == 'redirection':
+            # the target of the redirection is not an argument
+            if i < len(tokens) and tokens[i][0] == 'word':
+                for inner in tokens[i][2]:
+                    commands.extend(shell_commands(inner))
+                i += 1
+            continue
+
+        if kind == 'operator':
+            if current and not skip:
+                commands.append(_drop_assignments(current))
+            current = list()
+            skip = False
+            continue
+
+        if not current and text in _RESERVED_WORDS:
+            continue
+        if not current and text in _SKIPPED_COMMANDS:
+            skip = True
+        current.append(text)
+
+    if current and not skip:
+        commands.append(_drop_assignments(current))
+    return commands
+
+
+def _drop_assignments(words: List[str]) -> List[str]:
+    position = 0
+    while position < len(words) and _ASSIGNMENT.match(words[position]):
+        position += 1
+    return words[position:]
+
+
+def _tokenize(script: str) -> List[Tuple[str, str, List[str]]]:
+    """
+    :return: list of (kind, text, substitutions) tokens, where kind is 'word', 'operator' or 'redirection' and
+        substitutions are the scripts of the command substitutions found in a word
+    """
+    tokens = list()
+    word = list()
+    substitutions = list()
+    in_word = False
+    i = 0
+    n = len(script)
+
+    def end_word():
+        nonlocal word, substitutions, in_word
+        if in_word:
+            tokens.append(('word', ''.join(word), substitutions))
+        word = list()
+        substitutions = list()
+        in_word = False
+
+    while i < n:
+        c = script[i]
+
+        if c in ' \t':
+            end_word()
+            i += 1
+        elif c == '#' and not in_word:
+            while i < n and script[i] != '\n':
+                i += 1
+        elif c == '\\':
+            if i + 1 < n and script[i + 1] != '\n':
+                word.append(script[i + 1])
+                in_word = True
+            i += 2
+        elif c == "'":
+            end = script.find("'", i + 1)
+            if end < 0:
+                raise DetectorError('Unbalanced single quote')
+            word.append(script[i + 1:end])
+            in_word = True
+            i = end + 1
+        elif c == '"':
+            i = _read_double_quoted(script, i + 1, word, substitutions)
+            in_word = True
+        elif c == '$' and script.startswith('$(', i):
+            end = _find_closing(script, i + 2)
+            if not script.startswith('$((', i):
+                substitutions.append(script[i + 2:end])
+            word.append(script[i:end + 1])
+            in_word = True
+            i = end + 1
+        elif c == '`':
+            end = script.find('`', i + 1)
+            if end < 0:
+                raise DetectorError('Unbalanced backquote')
+            substitutions.append(script[i + 1:end])
+            word.append(script[i:end + 1])
+            in_word = True
+            i = end + 1
+        else:
+            redirection = next((r for r in _REDIRECTIONS if script.startswith(r, i)), None)
+            if redirection and not (redirection == '&>' and script.startswith('&&', i)):
+                # file descriptor numbers belong to the redirection, e.g. 2>&1
+                if in_word and ''.join(word).isdigit():
+                    word = list()
+                    in_word = False
+                end_word()
+                tokens.append(('redirection', redirection, list()))
+                i += len(redirection)
+                continue
+
+            operator = next((o for o in _SHELL_OPERATORS if script.startswith(o, i)), None)
+            if operator:
+                end_word()
+                tokens.append(('operator', operator, list()))
+                i += len(operator)
+                continue
+
+            word.append(c)
+            in_word = True
+            i += 1
+
+    end_word()
+    return tokens
+
+
+def _read_double_quoted(script: str, i: int, word: List[str], substitutions: List[str]) -> int:
+    n = len(script)
+    while i < n:
+        c = script[i]
+        if c == '"':
+            return i + 1
+        if c == '\\' and i + 1 < n:
+            word.append(script[i + 1] if script[i + 1] in '"\\$`' else script[i:i + 2])
+            i += 2
+        elif script.startswith('$(', i):
+            end = _find_closing(script, i + 2)
+            if not script.startswith('$((', i):
+                substitutions.append(script[i + 2:end])
+            word.append(script[i:end + 1])
+            i = end + 1
+        elif c == '`':
+            end = script.find('`', i + 1)
+            if end < 0:
+                raise DetectorError('Unbalanced backquote')
+            substitutions.append(script[i + 1:end])
+            word.append(script[i:end + 1])
+            i = end + 1
+        else:
+            word.append(c)
+            i += 1
+    raise DetectorError('Unbalanced double quote')
+
+
+def _find_closing(script: str, i: int) -> int:
+    depth = 1
+    quote = None
+    while i < len(script):
+        c = script[i]
+        if quote:
+            if c == quote:
+                quote = None
+            elif c == '\\' and quote == '"':
+                i += 1
+        elif c in '\'"':
+            quote = c
+        elif c == '\\':
+            i += 1
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    raise DetectorError('Unbalanced command substitution')
+
+
+def get_instructions(parsed_lines: Dict) -> List[Instruction]:
+    """
+    :param parsed_lines: parsed commands of a Dockerfile, by start line
+    :return: the instructions of the Dockerfile in line order, with their stage number
+    """
+    instructions = list()
+    stage = -1
+    for line in sorted(parsed_lines.keys()):
+        command = parsed_lines[line]
+        if command.cmd.upper() == 'FROM':
+            stage += 1
+        instructions.append(Instruction(command, max(stage, 0)))
+    return instructions
+
+
+def detect(parsed_lines: Dict, codes: Iterable[str]) -> List[Smell]:
+    """
+    Detect the smells of the given rules without running hadolint
+    :param parsed_lines: parsed commands of the Dockerfile, by start line
+    :param codes: rules to check. All of them must have a detector
+    :return: list of the detected smells, in line order
+    """
+    instructions = get_instructions(parsed_lines)
+    smells = list()
+    for code in codes:
+        message, _ = MESSAGES[code]
+        smells.extend(Smell(line, code, message) for line in sorted(set(DETECTORS[code](instructions))))
+    smells.sort(key=lambda s: s.line)
+    return smells
+
+
+def supports(codes: Iterable[str]) -> bool:
+    """
+    :return: True if all the given rules can be detected in process
+    """
+    return all(code in DETECTORS for code in codes)
+
+
+DETECTORS: Dict[str, Callable[[List[Instruction]], Iterable[int]]] = dict()
+
+
+def detector(code: str):
+    """
+    Register the decorated function as the detector of the given rule.
+    A detector receives the instructions of the Dockerfile and yields the lines of the smells of its rule.
+    """
+    def register(func):
+        DETECTORS[code] = func
+        return func
+    return register
+
+
+def _name(command: List[str]) -> str:
+    return command[0] if command else ''
+
+
+def _args(command: List[str]) -> List[str]:
+    return command[1:]
+
+
+def _is_apt_get_install(command: List[str]) -> bool:
+    return _name(command) == 'apt-get' and 'install' in _args(command)
+
+
+def _short_flags(command: List[str]) -> str:
+    return ''.join(arg[1:] for arg in _args(command) if arg.startswith('-') and not arg.startswith('--'))
+
+
+def _long_flags(command: List[str]) -> List[str]:
+    return [arg[2:].split('=', 1)[0] for arg in _args(command) if arg.startswith('--')]
+
+
+def _runs(instructions: List[Instruction], onbuild: bool = True) -> Iterable[Instruction]:
+    return (i for i in instructions if i.cmd == 'RUN' and (onbuild or not i.onbuild))
+
+
+def _has_cache_mount(instruction: Instruction, target: str) -> bool:
+    return any(flag.startswith('--mount=') and 'type=cache' in flag and f'target={target}' in flag.split(',')
+               for flag in instruction.flags)
+
+
+@detector('DL3003')
+def detect_dl3003(instructions: List[Instruction]) -> Iterable[int]:
+    for run in _runs(instructions, onbuild=False):
+        if any(_name(command) == 'cd' for command in run.commands):
+            yield run.line
+
+
+@detector('DL3006')
+def detect_dl3006(instructions: List[Instruction]) -> Iterable[int]:
+    aliases = set()
+    for instruction in instructions:
+        if instruction.cmd != 'FROM' or instruction.onbuild or not instruction.value:
+            continue
+
+        image = instruction.value[0]
+        if (':' not in image and '@' not in image and image != 'scratch' and not image.startswith('$')
+                and image not in aliases):
+            yield instruction.line
+
+        if len(instruction.value) >= 3 and instruction.value[1].upper() == 'AS':
+            aliases.add(instruction.value[2])
+
+
+@detector('DL3007')
+def detect_dl3007(instructions: List[Instruction]) -> Iterable[int]:
+    for instruction in instructions:
+        if instruction.cmd == 'FROM' and not instruction.onbuild and instruction.value:
+            image = instruction.value[0]
+            if '@' not in image and image.partition(':')[2] == 'latest':
+                yield instruction.line
+
+
+@detector('DL3008')
+def detect_dl3008(instructions: List[Instruction]) -> Iterable[int]:
+    for run in _runs(instructions):
+        for command in run.commands:
+            if not _is_apt_get_install(command):
+                continue
+
+            packages = list()
+            skip_next = False
+            for arg in _args(command):
+                if skip_next:
+                    skip_next = False
+                elif arg in ('-t', '--target-release'):
+                    skip_next = True
+                elif not arg.startswith('-') and arg != 'install':
+                    packages.append(arg)
+
+            if any('=' not in p and '/' not in p and not p.endswith('.deb') for p in packages):
+                yield run.line
+                break
+
+
+@detector('DL3009')
+def detect_dl3009(instructions: List[Instruction]) -> Iterable[int]:
+    # only the final stage and the stages used as base of other stages are checked
+    aliases = dict()
+    checked_stages = set()
+    last_stage = 0
+    for instruction in instructions:
+        if instruction.cmd != 'FROM' or instruction.onbuild or not instruction.value:
+            continue
+        last_stage = instruction.stage
+        if instruction.value[0] in aliases:
+            checked_stages.add(aliases[instruction.value[0]])
+        if len(instruction.value) >= 3 and instruction.value[1].upper() == 'AS':
+            aliases[instruction.value[2]] = instruction.stage
+    checked_stages.add(last_stage)
+
+    for run in _runs(instructions):
+        if run.stage not in checked_stages or _has_cache_mount(run, '/var/lib/apt/lists'):
+            continue
+
+        has_update = any(_name(c) in ('apt-get', 'apt') and 'update' in _args(c) for c in run.commands)
+        has_cleanup = any(_name(c) == 'rm' and ('-rf' in _args(c) or '/var/lib/apt/lists/*' in _args(c))
+                          for c in run.commands)
+        if has_update and not has_cleanup:
+            yield run.line
+
+
+@detector('DL3014')
+def detect_dl3014(instructions: List[Instruction]) -> Iterable[int]:
+    for run in _runs(instructions):
+        for command in run.commands:
+            if not _is_apt_get_install(command):
+                continue
+
+            short_flags = _short_flags(command)
+            long_flags = _long_flags(command)
+            has_yes = ('y' in short_flags or 'yes' in long_flags or 'assume-yes' in long_flags
+                       or short_flags.count('q') >= 2 or long_flags.count('quiet') >= 2 or '-q=2' in command)
+            if not has_yes:
+                yield run.line
+                break
+
+
+@detector('DL3015')
+def detect_dl3015(instructions: List[Instruction]) -> Iterable[int]:
+    for run in _runs(instructions):
+        for command in run.commands:
+            if (_is_apt_get_install(command) and '--no-install-recommends' not in command
+                    and 'APT::Install-Recommends=false' not in command):
+                yield run.line
+                break
+
+
+@detector('DL3020')
+def detect_dl3020(instructions: List[Instruction]) -> Iterable[int]:
+    for instruction in instructions:
+        if instruction.cmd != 'ADD' or instruction.onbuild:
+            continue
+
+        sources = instruction.value[:-1]
+        if not all(s.startswith(('http://', 'https://')) or s.endswith(ARCHIVE_EXTENSIONS) for s in sources):
+            yield instruction.line
+
+
+@detector('DL3025')
+def detect_dl3025(instructions: List[Instruction]) -> Iterable[int]:
+    for instruction in instructions:
+        if instruction.onbuild or instruction.json:
+            continue
+
+        if instruction.cmd in ('CMD', 'ENTRYPOINT') and instruction.value:
+            yield instruction.line
+        elif instruction.cmd == 'HEALTHCHECK' and instruction.value and instruction.value[0].upper() == 'CMD':
+            yield instruction.line
+
+
+@detector('DL3042')
+def detect_dl3042(instructions: List[Instruction]) -> Iterable[int]:
+    aliases = dict()
+    no_cache_stages = set()
+    for instruction in instructions:
+        if instruction.cmd == 'FROM' and not instruction.onbuild and instruction.value:
+            # a stage built from a previous stage inherits its environment
+            if aliases.get(instruction.value[0]) in no_cache_stages:
+                no_cache_stages.add(instruction.stage)
+            if len(instruction.value) >= 3 and instruction.value[1].upper() == 'AS':
+                aliases[instruction.value[2]] = instruction.stage
+            continue
+
+        if instruction.cmd == 'ENV' and not instruction.onbuild:
+            env = dict(zip(instruction.value[0::2], instruction.value[1::2]))
+            if 'PIP_NO_CACHE_DIR' in env:
+                if env['PIP_NO_CACHE_DIR'].strip('"\'').lower() in TRUTHY_VALUES:
+                    no_cache_stages.add(instruction.stage)
+                else:
+                    no_cache_stages.discard(instruction.stage)
+            continue
+
+        if (instruction.cmd != 'RUN' or instruction.stage in no_cache_stages
+                or _has_cache_mount(instruction, '/root/.cache/pip')):
+            continue
+
+        for command in instruction.commands:
+            name = _name(command)
+            args = _args(command)
+            is_pip = _PIP.match(name) and 'install' in args
+            is_python_pip = (name.startswith('python') and
+                             any(args[i:i + 3] == ['-m', 'pip', 'install'] for i in range(len(args))))
+            if (is_pip or is_python_pip) and '--no-cache-dir' not in args:
+                yield instruction.line
+                break
+
+
+@detector('DL3047')
+def detect_dl3047(instructions: List[Instruction]) -> Iterable[int]:
+    for run in _runs(instructions):
+        for command in run.commands:
+            if _name(command) != 'wget':
+                continue
+
+            short_flags = _short_flags(command)
+            long_flags = _long_flags(command)
+            quiet = (any(f in short_flags for f in 'qoa') or '-nv' in command
+                     or any(f in long_flags for f in ('progress', 'quiet', 'no-verbose', 'output-file',
+                                                      'append-output')))
+            if not quiet:
+                yield run.line
+                break
+
+
+def is_valid_label_key(key: str) -> bool:
+    """
+    :return: True if the given label key follows the Docker recommendations checked by DL3048
+    """
+    return (bool(_LABEL_KEY.match(key)) and key[-1].isalnum() and '..' not in key and '--' not in key
+            and not key.startswith(RESERVED_LABEL_NAMESPACES))
+
+
+@detector('DL3048')
+def detect_dl3048(instructions: List[Instruction]) -> Iterable[int]:
+    for instruction in instructions:
+        if instruction.cmd != 'LABEL' or instruction.onbuild:
+            continue
+
+        keys = [key.strip('"\'') if len(key) >= 2 and key[0] == key[-1] else key
+                for key in instruction.value[0::2]]
+        if not all(is_valid_label_key(key) for key in keys):
+            yield instruction.line
+
+
+@detector('DL3059')
+def detect_dl3059(instructions: List[Instruction]) -> Iterable[int]:
+    previous = None
+    for instruction in instructions:
+        if instruction.cmd != 'RUN' or instruction.onbuild:
+            previous = None
+            continue
+
+        if (previous is not None and previous.flags == instruction.flags
+                and len(previous.commands) <= 1 and len(instruction.commands) <= 1):
+            yield instruction.line
+        previous = instruction
+
+
+@detector('DL4000')
+def detect_dl4000(instructions: List[Instruction]) -> Iterable[int]:
+    for instruction in instructions:
+        if instruction.cmd == 'MAINTAINER' and not instruction.onbuild:
+            yield instruction.line
+
+
+@detector('DL4006')
+def detect_dl4006(instructions: List[Instruction]) -> Iterable[int]:
+    pipefail = False
+    for instruction in instructions:
+        if instruction.onbuild:
+            continue
+
+        if instruction.cmd == 'FROM':
+            pipefail = False
+        elif instruction.cmd == 'SHELL' and instruction.value:
+            pipefail = (instruction.value[0] in NON_POSIX_SHELLS
+                        or bool(_PIPEFAIL.search(' '.join(instruction.value))))
+        elif instruction.cmd == 'RUN' and not instruction.json and not pipefail:
+            if _has_pipe(' '.join(instruction.value)):
+                yield instruction.line
+
+
+def _has_pipe(script: str) -> bool:
+    for kind, text, substitutions in _tokenize(script):
+        if kind == 'operator' and text in ('|', '|&'):
+            return True
+        if any(_has_pipe(inner) for inner in substitutions):
+            return True
+    return False
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import re
+from bisect import bisect_right, insort
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional
+
+from logic.detectors import DetectorError, shell_commands
+
+# tools whose RUN instructions are indexed
+TOOLS = ('apt-get', 'pip', 'wget')
+
+_PIP = re.compile(r'^pip[0-9.]*$')
+_PYTHON = re.compile(r'^python[0-9.]*$')
+
+
+class Stage(NamedTuple):
+    """Build stage of a Dockerfile"""
+    number: int
+    start_line: int
+    image: str
+    alias: Optional[str]
+
+
+class DockerfileIndex:
+    """
+    Index of the parsed instructions of a Dockerfile: the build stages with their base image, the instructions by
+    type and the RUN instructions calling apt-get, pip or wget.
+    The instructions are kept sorted by line, so the lookups by line (stage, nearest instruction, current WORKDIR or
+    SHELL) are bisections instead of scans of the lines.
+    After an edit, update() moves the instructions kept by the edit and indexes only the ones parsed again.
+    """
+
+    def __init__(self, parsed_lines: Dict) -> None:
+        """
+        :param parsed_lines: parsed commands of the Dockerfile, by start line
+        """
+        self.parsed_lines = parsed_lines
+        self._stages: List[Stage] = list()
+        self._stage_starts: List[int] = list()
+        self._by_type: Dict[str, List] = defaultdict(list)
+        self._type_lines: Dict[str, List[int]] = defaultdict(list)
+        self._tool_runs: Dict[str, List] = defaultdict(list)
+
+        for line in sorted(parsed_lines.keys()):
+            command = parsed_lines[line]
+            cmd = command.cmd.upper()
+            self._by_type[cmd].append(command)
+            self._type_lines[cmd].append(line)
+
+            if cmd == 'FROM':
+                self.__add_stage(command)
+            elif cmd == 'RUN':
+                for tool in self.__called_tools(command):
+                    self._tool_runs[tool].append(command)
+
+    def update(self, parsed_lines: Dict, moved: Dict[int, int], added: List[int]) -> None:
+        """
+        Update the index after an edit of the Dockerfile
+        :param parsed_lines: parsed commands of the edited Dockerfile, by start line
+        :param moved: new start line of each instruction kept by the edit, by its start line before the edit. The
+            instructions missing from it were deleted or parsed again
+        :param added: start lines of the instructions parsed again, which are the only ones indexed
+        """
+        type_lines = defaultdict(list)
+        for cmd, lines in self._type_lines.items():
+            type_lines[cmd] = [moved[line] for line in lines if line in moved]
+        tool_lines = defaultdict(list)
+        for tool, commands in self._tool_runs.items():
+            tool_lines[tool] = [moved[c.start_line] for c in commands if c.start_line in moved]
+
+        for line in added:
+            command = parsed_lines[line]
+            cmd = command.cmd.upper()
+            insort(type_lines[cmd], line)
+            if cmd == 'RUN':
+                for tool in self.__called_tools(command):
+                    insort(tool_lines[tool], line)
+
+        self.parsed_lines = parsed_lines
+        self._type_lines = type_lines
+        self._by_type = defaultdict(list, {cmd: [parsed_lines[line] for line in lines]
+                                           for cmd, lines in type_lines.items()})
+        self._tool_runs = defaultdict(list, {tool: [parsed_lines[line] for line in lines]
+                                             for tool, lines in tool_lines.items()})
+        self._stages = list()
+        self._stage_starts = list()
+        for command in self._by_type.get('FROM', []):
+            self.__add_stage(command)
+
+    @property
+    def stages(self) -> List[Stage]:
+        return self._stages
+
+    def stage_at(self, line: int) -> Optional[Stage]:
+        """
+        :param line: line number of the Dockerfile
+        :return: the stage containing the line, or None if the line precedes the first FROM
+        """
+        i = bisect_right(self._stage_starts, line) - 1
+        return self._stages[i] if i >= 0 else None
+
+    def base_image(self, line: int) -> Optional[str]:
+        """
+        :param line: line number of the Dockerfile
+        :return: base image of the stage containing the line. A stage built from a previous stage has the base image
+            of that stage
+        """
+        stage = self.stage_at(line)
+        if stage is None:
+            return None
+
+        image = stage.image
+        aliases = {s.alias: s for s in self._stages[:stage.number] if s.alias}
+        # a stage can only refer to the previous ones, so the resolution ends
+        while image.lower() in aliases:
+            image = aliases.pop(image.lower()).image
+        return image
+
+    def instructions(self, cmd: str) -> List:
+        """
+        :param cmd: instruction type, e.g. RUN
+        :return: parsed commands of the given type, in line order
+        """
+        return self._by_type.get(cmd.upper(), [])
+
+    def last_before(self, cmd: str, line: int, same_stage: bool = False):
+        """
+        :param cmd: instruction type, e.g. WORKDIR
+        :param line: line number of the Dockerfile
+        :param same_stage: if set, only the instructions of the stage of the line are considered
+        :return: the last parsed command of the given type starting before the line, or None
+        """
+        cmd = cmd.upper()
+        i = bisect_right(self._type_lines.get(cmd, []), line - 1) - 1
+        if i < 0:
+            return None
+
+        command = self._by_type[cmd][i]
+        if same_stage:
+            stage = self.stage_at(line)
+            if stage is None or command.start_line < stage.start_line:
+                return None
+        return command
+
+    def runs_calling(self, tool: str) -> List:
+        """
+        :param tool: one of TOOLS
+        :return: parsed RUN commands calling the given tool, in line order
+        """
+        return self._tool_runs.get(tool, [])
+
+    def workdir(self, line: int) -> Optional[str]:
+        """
+        :return: the WORKDIR set in the stage of the line before it, or None
+        """
+        command = self.last_before('WORKDIR', line, same_stage=True)
+        return ' '.join(command.value).strip() if command else None
+
+    def shell(self, line: int) -> Optional[List[str]]:
+        """
+        :return: the SHELL set in the stage of the line before it, or None
+        """
+        command = self.last_before('SHELL', line, same_stage=True)
+        return list(command.value) if command else None
+
+    def __add_stage(self, command) -> None:
+        value = command.value
+        alias = value[2].lower() if len(value) >= 3 and value[1].lower() == 'as' else None
+        self._stages.append(Stage(len(self._stages), command.start_line, value[0] if value else '', alias))
+        self._stage_starts.append(command.start_line)
+
+    @staticmethod
+    def __called_tools(command) -> List[str]:
+        if command.json:
+            commands = [list(command.value)]
+        else:
+            try:
+                commands = shell_commands(' '.join(command.value))
+            except DetectorError:
+                # not tokenizable: fall back to the words of the command
+                commands = [' '.join(command.value).split()]
+
+        tools = list()
+        for words in commands:
+            if not words:
+                continue
+            if words[0] == 'apt-get':
+                tools.append('apt-get')
+            elif _PIP.match(words[0]) or _PYTHON.match(words[0]) and words[1:3] == ['-m', 'pip']:
+                tools.append('pip')
+            elif words[0] == 'wget':
+                tools.append('wget')
+        # each RUN is indexed once per tool
+        return list(dict.fromkeys(tools))
@@ -1,18 +1,39 @@
 from __future__ import annotations
 
+import io
 import logging
-import os
-import sys
+import re
+from bisect import bisect_left
 from datetime import datetime
-from typing import List, Dict
+from typing import Callable, List, Dict
 import json
-import dockerfile as dockerfile_parser
-import subprocess
 from collections import defaultdict
-from pykson import Pykson
-from logic.smell import Smell
 import ntpath
 
+from logic.detectors import DetectorError, detect
+from logic.dockerfile_index import DockerfileIndex
+from logic.lint_cache import get_lint_cache
+from logic.line_buffer import LineBuffer
+from logic.linter import lint_content
+from logic.smell import Smell
+
+logger = logging.getLogger(__name__.split('.')[0])
+logger.setLevel(logging.DEBUG)
+
+# hadolint codes reporting a Dockerfile that cannot be parsed. They are never ignored
+INVALID_CODES = ['DL1000', 'DL3061']
+# hadolint rule codes, ignored when fixing only some rules. The ShellCheck codes and the rules missing here are still
+# checked
+HADOLINT_CODES = ['DL1001', 'DL3000', 'DL3001', 'DL3002', 'DL3003', 'DL3004', 'DL3006', 'DL3007', 'DL3008', 'DL3009',
+                  'DL3010', 'DL3011', 'DL3012', 'DL3013', 'DL3014', 'DL3015', 'DL3016', 'DL3018', 'DL3019', 'DL3020',
+                  'DL3021', 'DL3022', 'DL3023', 'DL3024', 'DL3025', 'DL3026', 'DL3027', 'DL3028', 'DL3029', 'DL3030',
+                  'DL3032', 'DL3033', 'DL3034', 'DL3035', 'DL3036', 'DL3037', 'DL3038', 'DL3040', 'DL3041', 'DL3042',
+                  'DL3043', 'DL3044', 'DL3045', 'DL3046', 'DL3047', 'DL3048', 'DL3049', 'DL3050', 'DL3051', 'DL3052',
+                  'DL3053', 'DL3054', 'DL3055', 'DL3056', 'DL3057', 'DL3058', 'DL3059', 'DL3060', 'DL3061', 'DL3062',
+                  'DL4000', 'DL4001', 'DL4003', 'DL4004', 'DL4005', 'DL4006']
+# parser directives, at the top of the Dockerfile
+_DIRECTIVE = re.compile(r'#\s*(\w+)\s*=')
+
 
 class InvalidDockerfileError(Exception):
     """Raised when the selected file is not a Dockerfile"""
@@ -20,23 +41,66 @@ class InvalidDockerfileError(Exception):
 
 
 class Dockerfile:
-    def __init__(self, filepath: str, last_edit: datetime):
+    def __init__(self, filepath: str, last_edit: datetime, content: str = None, ignored_rules: List[str] = None,
+                 linter: Callable[[str, List[str]], List[Dict]] = None):
+        """
+        :param filepath: path of the Dockerfile. Use '-' for content not read from a file
+        :param last_edit: last edit date of the Dockerfile
+        :param content: content of the Dockerfile. If not given, it is read from filepath
+        :param ignored_rules: rules not checked by hadolint, on the first lint and on every re-lint
+        :param linter: function that lints a content, skipping the given rules, and returns the smells reported by
+            hadolint as JSON objects. By default, hadolint is called on each lint through stdin
+        """
         self._filepath = filepath
         self._filename = self.__get_filename(filepath)
         self._last_edit = last_edit
-        self._lines = self.__get_lines(filepath)
-        self._parsed_lines = self.__get_parsed_lines(filepath)
+        self._lines = LineBuffer(self.__get_lines(filepath) if content is None
+                                 else io.StringIO(content, newline=None).readlines())
+        self._original_lines = list(self._lines)
+        self._edits = list()
+        self._parsed_lines = None
+        self._index = None
         self._lines_changed = False
-        self._smells_dict = self.__check_smells(filepath)
+        self._smells_stale = False
+        self._transaction = None
+        self._ignored_rules = [r for r in (ignored_rules or []) if r not in INVALID_CODES]
+        self._linter = linter or lint_content
+        self._detector_codes = None
+        self._smells_detected = False
+        self._smells_dict = self.__check_smells(''.join(self._lines))
 
     @property
-    def lines(self) -> List[str]:
+    def lines(self) -> LineBuffer:
         return self._lines
 
+    @property
+    def original_lines(self) -> List[str]:
+        return self._original_lines
+
+    @property
+    def edits(self) -> List:
+        """
+        Edits made by the fixes, recorded only when requested to the fix engine
+        """
+        return self._edits
+
     @property
     def parsed_lines(self) -> Dict:
+        # parsed on first use: the text-only rules do not need the parser
+        if self._parsed_lines is None:
+            self._parsed_lines = self.__get_parsed_lines(''.join(self._lines))
         return self._parsed_lines
 
+    @property
+    def index(self) -> DockerfileIndex:
+        """
+        Index of the stages and instructions of the current content, updated by each recorded edit
+        """
+        parsed_lines = self.parsed_lines
+        if self._index is None or self._index.parsed_lines is not parsed_lines:
+            self._index = DockerfileIndex(parsed_lines)
+        return self._index
+
     @property
     def lines_changed(self) -> bool:
         return self._lines_changed
@@ -45,6 +109,20 @@ class Dockerfile:
     def lines_changed(self, changed) -> None:
         self._lines_changed = changed
 
+    @property
+    def smells_stale(self) -> bool:
+        """
+        True if the smells were remapped after an edit, without re-linting the new content
+        """
+        return self._smells_stale
+
+    @property
+    def smells_detected(self) -> bool:
+        """
+        True if the current smells were found by the in-process detectors instead of hadolint
+        """
+        return self._smells_detected
+
     @property
     def filepath(self) -> str:
         return self._filepath
@@ -57,24 +135,192 @@ class Dockerfile:
     def smells_dict(self) -> dict:
         return self._smells_dict
 
+    @property
+    def ignored_rules(self) -> List[str]:
+        return self._ignored_rules
+
     def update_smells_dict(self, ignore: List = None) -> None:
         """
         Update the smells dictionary.
         Call it when the lines number of the Dockerfile change.
+        The Dockerfile is re-linted in memory, without writing it to disk.
+        :param ignore: rules to skip in this lint only, in addition to the ignored rules of the Dockerfile
         """
-        filepath = self.__produce_temp_dockerfile()
-        # refresh parsed lines
-        self._parsed_lines = self.__get_parsed_lines(filepath)
-        self._smells_dict = self.__check_smells(filepath, ignore)
-        os.remove(filepath)
+        self.__update_parsed_lines()
+        self._smells_dict = self.__check_smells(''.join(self._lines), ignore)
         self._lines_changed = True
+        self._smells_stale = False
+        self._lines.mark()
+
+    def use_detectors(self, codes: List[str] = None) -> None:
+        """
+        Detect the smells of the given rules with the in-process detectors on the next updates of the smells, instead
+        of running hadolint. The smells of the other rules are not reported until hadolint runs again.
+        :param codes: rules to check. All of them must have a detector. If None, hadolint is used again
+        """
+        self._detector_codes = list(codes) if codes is not None else None
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._transaction is not None
+
+    def begin(self) -> None:
+        """
+        Start a transaction: the edits recorded until commit() are re-linted together, once
+        """
+        self._transaction = set()
+
+    def record_edit(self, ignore: List = None) -> None:
+        """
+        Record that the lines of the Dockerfile were edited by a fix.
+        In a transaction, the smells are moved to the current position of their lines and the re-lint is deferred to
+        commit(). Otherwise, the Dockerfile is re-linted right away.
+        :param ignore: rules to skip in the re-lint of the edit, in addition to the ignored rules of the Dockerfile
+        """
+        if self._transaction is None:
+            self.update_smells_dict(ignore)
+            return
 
-    def __produce_temp_dockerfile(self) -> str:
-        filepath = sys.path[0] + f'/temp/{self._filename}'
-        with open(filepath, 'w') as file:
-            for line in self._lines:
-                file.write(line)
-        return filepath
+        self._transaction.update(ignore or [])
+        self.remap_smells()
+
+    def commit(self) -> bool:
+        """
+        End the transaction, re-linting the Dockerfile once if edits were recorded
+        :return: True if the Dockerfile was re-linted
+        """
+        ignore = self._transaction or set()
+        self._transaction = None
+        if not self._smells_stale:
+            return False
+
+        self.update_smells_dict(sorted(ignore))
+        return True
+
+    def remap_smells(self) -> None:
+        """
+        Move the smells to the current position of their lines, after lines were inserted or deleted, without
+        re-linting the Dockerfile. The smells of deleted or rewritten lines are dropped, and their line is set to None.
+        The smells created or solved by the edit are found by the next re-lint.
+        """
+        self._smells_stale = True
+        if not self._lines.edited:
+            return
+
+        self.__update_parsed_lines()
+
+        smells_dict = defaultdict(list)
+        for pos, smells in self._smells_dict.items():
+            new_pos = self._lines.map_line(pos)
+            for smell in smells:
+                smell.line = new_pos
+                if new_pos is not None:
+                    smells_dict[new_pos].append(smell)
+
+        self._smells_dict = smells_dict
+        self._lines.mark()
+
+    def __update_parsed_lines(self) -> None:
+        """
+        Update the parsed lines and the index to the edits recorded by the lines since their last mark: the
+        instructions whose lines were not edited are moved to their new position, and only the lines left of the edited
+        instructions, plus the inserted or replaced ones, are parsed again
+        """
+        lines = self._lines
+        old_parsed_lines = self._parsed_lines
+        if old_parsed_lines is None or not lines.edited:
+            return
+
+        edited_from = lines.edited_from
+        changed = lines.changed_lines()
+        # the line numbers of the parser are the ones of the lines only if each line holds a single one
+        if any(lines[line - 1].count('\n') > 1 for line in changed):
+            self._parsed_lines = None
+            return
+
+        touched = set(changed)
+        moved = dict()
+        parsed_lines = dict()
+        # (start, end) of the kept instructions, in line order as the parsed lines
+        kept = list()
+        for start, command in old_parsed_lines.items():
+            if command.end_line < edited_from:
+                moved[start] = start
+                parsed_lines[start] = command
+                kept.append((start, command.end_line))
+                continue
+
+            new_start = lines.map_line(start)
+            new_end = lines.map_line(command.end_line)
+            if (new_start is not None and new_end is not None and new_end - new_start == command.end_line - start
+                    and not self.__any_between(changed, new_start, new_end)):
+                moved[start] = new_start
+                parsed_lines[new_start] = command._replace(start_line=new_start, end_line=new_end)
+                kept.append((new_start, new_end))
+            else:
+                touched.update(line for line in map(lines.map_line, range(start, command.end_line + 1))
+                               if line is not None)
+
+        added = list()
+        if touched:
+            if self.__has_escape_directive():
+                self._parsed_lines = None
+                return
+
+            # the lines between two kept instructions are parsed again if they contain an edited line
+            starts = [start for start, _ in kept]
+            segments = set()
+            for line in touched:
+                i = bisect_left(starts, line)
+                segments.add((kept[i - 1][1] + 1 if i > 0 else 1, starts[i] - 1 if i < len(starts) else len(lines)))
+            for first, last in sorted(segments):
+                segment = self.__parse_segment(first, last)
+                if segment is None:
+                    self._parsed_lines = None
+                    return
+                parsed_lines.update(segment)
+                added.extend(segment.keys())
+            # in line order, as parsed
+            parsed_lines = dict(sorted(parsed_lines.items()))
+
+        if self._index is not None and self._index.parsed_lines is old_parsed_lines:
+            self._index.update(parsed_lines, moved, sorted(added))
+        self._parsed_lines = parsed_lines
+
+    def __parse_segment(self, first: int, last: int) -> Dict:
+        """
+        Parse the lines of the Dockerfile from first to last
+        :return: the parsed commands, by start line in the Dockerfile, or None if the lines cannot be parsed apart from
+            the rest of the Dockerfile
+        """
+        segment = self._lines[first - 1:last]
+        # an instruction continued on the next lines, or a comment read as a parser directive at the top of the lines
+        if segment[-1].rstrip().endswith('\\') or (first > 1 and _DIRECTIVE.match(segment[0])):
+            return None
+        try:
+            parsed_lines = self.__get_parsed_lines(''.join(segment))
+        except InvalidDockerfileError:
+            return None
+
+        offset = first - 1
+        return {start + offset: command._replace(start_line=start + offset, end_line=command.end_line + offset)
+                for start, command in parsed_lines.items()}
+
+    def __has_escape_directive(self) -> bool:
+        # the escape character it sets is not known to the lines parsed apart
+        for line in self._lines:
+            directive = _DIRECTIVE.match(line)
+            if directive is None:
+                return False
+            if directive.group(1).lower() == 'escape':
+                return True
+        return False
+
+    @staticmethod
+    def __any_between(lines: List[int], first: int, last: int) -> bool:
+        # lines is sorted
+        i = bisect_left(lines, first)
+        return i < len(lines) and lines[i] <= last
 
     def __get_filename(self, filepath: str) -> str:
         head, tail = ntpath.split(filepath)
@@ -84,37 +330,65 @@ class Dockerfile:
         with open(filepath, encoding="utf8") as f:
             return f.readlines()
 
-    def __get_parsed_lines(self, filepath: str) -> Dict[str, dockerfile_parser.Command]:
+    def __get_parsed_lines(self, content: str) -> Dict[str, dockerfile_parser.Command]:
+        cache = get_lint_cache()
+        key = cache.parse_key(content)
+        cached = cache.get(key)
+        if cached is not None:
+            return dict(cached)
+
+        import dockerfile as dockerfile_parser
+
         parsed_dict = dict()
         try:
-            for cmd in dockerfile_parser.parse_file(filepath):
+            for cmd in dockerfile_parser.parse_string(content):
                 parsed_dict[cmd.start_line] = cmd
+            cache.put(key, dict(parsed_dict))
             return parsed_dict
         except dockerfile_parser.GoParseError as res:
             raise InvalidDockerfileError(res)
         except dockerfile_parser.GoIOError as res:
             raise InvalidDockerfileError(res)
 
-    def __check_smells(self, filepath: str, ignore: List = None) -> Dict:
-        # Retrieve hadolint result
-        output = subprocess.run(['hadolint', '-f', 'json', filepath], stdout=subprocess.PIPE)
-        result = output.stdout.decode('utf-8')
+    def __check_smells(self, content: str, ignore: List = None) -> Dict:
+        # Retrieve hadolint result. Ignored rules are not checked at all by hadolint
+        ignored_rules = [r for r in set(self._ignored_rules).union(ignore or []) if r not in INVALID_CODES]
+        if self._detector_codes is not None:
+            smells_dict = self.__detect_smells(ignored_rules)
+            if smells_dict is not None:
+                return smells_dict
 
-        result_json = json.loads(result)
+        self._smells_detected = False
+        cache = get_lint_cache()
+        key = cache.lint_key(content, ignored_rules)
+        result_json = cache.get(key)
+        if result_json is None:
+            result_json = self._linter(content, ignored_rules)
+            cache.put(key, result_json)
 
         # Set default value as an empty list
         smells_dict = defaultdict(list)
 
         # Put smells in a dictionary like line_position => [smells]
         for smell_json in result_json:
-            if smell_json['code'] in ['DL1000', 'DL3061']:
-                raise InvalidDockerfileError(result)
-
-            if ignore and smell_json['code'] in ignore:
-                #logging.info("Skipping", smell_json['code'])
-                continue
+            if smell_json['code'] in INVALID_CODES:
+                raise InvalidDockerfileError(json.dumps(result_json))
 
-            smell = Pykson().from_json(smell_json, Smell, accept_unknown=True)
+            smell = Smell.from_json(smell_json)
             smells_dict[smell.line].append(smell)
 
         return smells_dict
+
+    def __detect_smells(self, ignored_rules: List[str]) -> Dict:
+        # The detectors work on the parsed lines of the strategies, updated by the edits. None if hadolint is needed
+        try:
+            smells = detect(self.parsed_lines, [c for c in self._detector_codes if c not in ignored_rules])
+        except DetectorError as e:
+            logger.debug(f'In-process detection failed, falling back to hadolint: {e}')
+            return None
+
+        self._smells_detected = True
+        smells_dict = defaultdict(list)
+        for smell in smells:
+            smells_dict[smell.line].append(smell)
+        return smells_dict
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING, List, NamedTuple, Set, Tuple
+
+from logic import detectors
+from logic.dockerfile_obj import Dockerfile
+from logic.report import compute_edits
+from smell_solvers.registry import get_registry
+from smell_solvers.smell_solver import SmellSolver
+from utils.docker_utils import BuildInfrastructureError
+from utils.dockerhub_api import DockerHubAPIException, ImageNotFoundException
+from utils.launchpad_api import LaunchpadAPIException
+from utils.registry_api import RegistryAPIException
+
+if TYPE_CHECKING:
+    from logic.smell import Smell
+
+logger = logging.getLogger(__name__.split('.')[0])
+logger.setLevel(logging.DEBUG)
+
+MAX_PASSES = 50
+# failures of the remote lookups of a fix: the smell is left unfixed and the other smells are fixed
+LOOKUP_ERRORS = (BuildInfrastructureError, DockerHubAPIException, ImageNotFoundException, LaunchpadAPIException,
+                 RegistryAPIException)
+
+SmellKey = Tuple[str, str, int]
+
+
+class PassStats(NamedTuple):
+    """Statistics of a single pass of the fix engine"""
+    number: int
+    pending: int
+    # smells whose fix edited the lines
+    fixed: int
+    relinted: bool
+
+
+class FixEngine:
+    """
+    Worklist-based fix engine.
+
+    Each pass builds the worklist from the current smells of the Dockerfile and fixes them in line order.
+    Smells are tracked by a stable identity (rule code, content of the smelly line and occurrence number of that
+    pair), so they are never visited twice even when the fixes shift the line numbers.
+    Each pass is a transaction of the Dockerfile: the fixes record their edits, which move the pending smells to the
+    new position of their lines, and the Dockerfile is re-linted once when the pass commits, to find the smells
+    created or solved by the fixes. A strategy whose edits conflict with the other fixes is applied alone: the pass
+    commits right after it, or before it if other edits are pending. When a fix re-lints the Dockerfile on its own,
+    the rest of the worklist is stale and the pass ends.
+    When all the fixable rules have an in-process detector, the re-lints inside the fix loop use the detectors instead
+    of hadolint, which runs once more as a final check when the loop would stop: the passes go on if it reports
+    smells the detectors did not find.
+    The engine stops when a pass ends without re-linting, when there are no more smells to visit, or after
+    max_passes passes.
+    A fix whose remote lookup fails (e.g. offline) is skipped: its smell is left unfixed. A smell is counted as fixed
+    only if its fix edited the lines.
+    If record_edits is set, the edits made by each fix are appended to the edits of the Dockerfile.
+    """
+
+    def __init__(self, dockerfile: Dockerfile, ignored_rules: List[str], max_passes: int = MAX_PASSES,
+                 record_edits: bool = False) -> None:
+        self._dockerfile = dockerfile
+        self._ignored_rules = set(ignored_rules or [])
+        self._max_passes = max_passes
+        self._record_edits = record_edits
+        self._solver = SmellSolver()
+        self._registry = get_registry()
+        self._visited: Set[SmellKey] = set()
+        self._passes: List[PassStats] = list()
+
+    @property
+    def passes(self) -> List[PassStats]:
+        return self._passes
+
+    @property
+    def fixed(self) -> int:
+        return sum(p.fixed for p in self._passes)
+
+    def run(self) -> int:
+        """
+        Fix the smells of the Dockerfile until nothing changes
+        :return: number of fixed smells
+        """
+        codes = [c for c in self._registry.codes() if c not in self._ignored_rules]
+        if detectors.supports(codes):
+            self._dockerfile.use_detectors(codes)
+
+        try:
+            self.__run_passes()
+        finally:
+            self._dockerfile.use_detectors(None)
+
+        logger.info(f'Fixed {self.fixed} smells in {len(self._passes)} passes')
+        return self.fixed
+
+    def __run_passes(self) -> None:
+        while len(self._passes) < self._max_passes:
+            worklist = self.__build_worklist()
+            if not worklist:
+                if self.__final_check():
+                    continue
+                break
+
+            stats = self.__run_pass(len(self._passes) + 1, worklist)
+            self._passes.append(stats)
+            logger.debug(f'Pass {stats.number}: {stats.fixed}/{stats.pending} smells fixed, '
+                         f're-linted: {stats.relinted}')
+
+            if not stats.relinted and not self.__final_check():
+                break
+        else:
+            logger.warning(f'Stopped after {self._max_passes} passes, some smells may be left unfixed')
+
+    def __final_check(self) -> bool:
+        """
+        Lint the Dockerfile with hadolint if its current smells come from the detectors
+        :return: True if hadolint was run, so the smells must be visited again
+        """
+        if not self._dockerfile.smells_detected:
+            return False
+
+        self._dockerfile.use_detectors(None)
+        self._dockerfile.update_smells_dict()
+        self._dockerfile.lines_changed = False
+        return True
+
+    def __run_pass(self, number: int, worklist: List[Tuple[SmellKey, Smell]]) -> PassStats:
+        fixed = 0
+        self._dockerfile.begin()
+        for key, smell in worklist:
+            # the line of the smell was deleted by a previous fix of the pass
+            if smell.line is None:
+                self._visited.add(key)
+                continue
+
+            # a conflicting fix needs the smells of the committed content: it is left to the next pass
+            conflicts = self._registry.get(smell.code).conflicts
+            if conflicts and self._dockerfile.smells_stale:
+                break
+
+            self._visited.add(key)
+            line = smell.line
+            logger.info(f'Fixing smell {smell.code} on line {line}')
+            before = list(self._dockerfile.lines) if self._record_edits else None
+            self._solver.use_strategy(smell.code)
+            version = self._dockerfile.lines.version
+            try:
+                self._solver.fix_smell(self._dockerfile, line)
+            except LOOKUP_ERRORS as e:
+                logger.error(f'!!! Cannot fix smell {smell.code} on line {line}. {e}')
+                continue
+            # the strategies that cannot solve a smell log it and leave the lines unchanged
+            if self._dockerfile.lines.version == version:
+                continue
+            fixed += 1
+
+            if before is not None:
+                self._dockerfile.edits.extend(compute_edits(smell.code, line, before, list(self._dockerfile.lines)))
+
+            # the remaining line positions are stale after a re-lint, or after the edits of a conflicting fix
+            if self._dockerfile.lines_changed or (conflicts and self._dockerfile.smells_stale):
+                break
+
+        relinted = self._dockerfile.commit() or self._dockerfile.lines_changed
+        self._dockerfile.lines_changed = False
+        return PassStats(number, len(worklist), fixed, relinted)
+
+    def __build_worklist(self) -> List[Tuple[SmellKey, Smell]]:
+        lines = self._dockerfile.lines
+        occurrences = dict()
+        worklist = list()
+
+        for pos in sorted(self._dockerfile.smells_dict.keys()):
+            for smell in self._dockerfile.smells_dict[pos]:
+                if smell.code in self._ignored_rules or not self._solver.strategy_exists(smell.code):
+                    continue
+
+                text = lines[pos - 1].strip() if 0 < pos <= len(lines) else ''
+                occurrence = occurrences.get((smell.code, text), 0)
+                occurrences[(smell.code, text)] = occurrence + 1
+
+                key = (smell.code, text, occurrence)
+                if key not in self._visited:
+                    worklist.append((key, smell))
+
+        return worklist
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+from bisect import bisect_right
+from collections.abc import MutableSequence
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+CHUNK_SIZE = 1024
+
+
+class LineBuffer(MutableSequence):
+    """
+    Mutable sequence of the lines of a Dockerfile, used as a list by the strategies.
+
+    The lines are stored in chunks of at most CHUNK_SIZE lines, so inserting or deleting a line costs
+    O(CHUNK_SIZE + number of chunks) instead of O(number of lines).
+    The edits are recorded in an edit log, so that a line number from before the edits can be mapped to the current
+    one with map_line(). mark() starts a new log. Replacing a line with the same content is not an edit.
+    """
+
+    def __init__(self, lines: Iterable[str] = ()) -> None:
+        self._chunks: List[List[str]] = list()
+        self._starts: Optional[List[int]] = None
+        self._length = 0
+        self._log: List[Tuple[int, int]] = list()
+        self._version = 0
+        self.__rebuild(list(lines))
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[str]:
+        for chunk in self._chunks:
+            yield from chunk
+
+    def __repr__(self) -> str:
+        return f'LineBuffer({list(self)!r})'
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (LineBuffer, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            if step != 1 or start >= stop:
+                return list(self)[index]
+            # read from the chunk of the first line only
+            chunk, offset = self.__locate(start)
+            lines = list()
+            while len(lines) < stop - start:
+                lines.extend(self._chunks[chunk][offset:offset + stop - start - len(lines)])
+                chunk, offset = chunk + 1, 0
+            return lines
+        chunk, offset = self.__locate(index)
+        return self._chunks[chunk][offset]
+
+    def __setitem__(self, index, value) -> None:
+        if isinstance(index, slice):
+            lines = list(self)
+            start, stop, step = index.indices(len(lines))
+            lines[index] = value
+            if step == 1:
+                # recorded as the removal of the replaced lines followed by the insertion of the new ones
+                removed = max(0, stop - start)
+                added = len(lines) - len(self) + removed
+                if removed:
+                    self.__record(start, -removed)
+                if added:
+                    self.__record(start, added)
+            self.__rebuild(lines)
+            return
+
+        chunk, offset = self.__locate(index)
+        if self._chunks[chunk][offset] == value:
+            return
+        self._chunks[chunk][offset] = value
+        self.__record(self.__starts()[chunk] + offset, 0)
+
+    def __delitem__(self, index) -> None:
+        if isinstance(index, slice):
+            lines = list(self)
+            removed = range(len(lines))[index]
+            del lines[index]
+            for i in sorted(removed, reverse=True):
+                self.__record(i, -1)
+            self.__rebuild(lines)
+            return
+
+        chunk, offset = self.__locate(index)
+        position = self.__starts()[chunk] + offset
+        del self._chunks[chunk][offset]
+        if not self._chunks[chunk] and len(self._chunks) > 1:
+            del self._chunks[chunk]
+            self._starts = None
+        else:
+            self.__shift_starts(chunk, -1)
+        self._length -= 1
+        self.__record(position, -1)
+
+    def insert(self, index: int, value: str) -> None:
+        # same clamping as list.insert
+        if index < 0:
+            index = max(0, index + self._length)
+        index = min(index, self._length)
+
+        if index == self._length:
+            chunk = len(self._chunks) - 1
+            offset = len(self._chunks[chunk])
+        else:
+            chunk, offset = self.__locate(index)
+        self._chunks[chunk].insert(offset, value)
+        if len(self._chunks[chunk]) > 2 * CHUNK_SIZE:
+            full = self._chunks[chunk]
+            self._chunks[chunk:chunk + 1] = [full[:CHUNK_SIZE], full[CHUNK_SIZE:]]
+            self._starts = None
+        else:
+            self.__shift_starts(chunk, 1)
+        self._length += 1
+        self.__record(index, 1)
+
+    def mark(self) -> None:
+        """
+        Clear the edit log: the following edits are mapped from the current line numbers
+        """
+        self._log = list()
+
+    @property
+    def edited(self) -> bool:
+        """
+        True if lines were changed, inserted or deleted since the last mark
+        """
+        return bool(self._log)
+
+    @property
+    def version(self) -> int:
+        """
+        Number of edits of the lines since their creation, not reset by mark()
+        """
+        return self._version
+
+    @property
+    def edited_from(self) -> Optional[int]:
+        """
+        First line number (1-based) that may have moved or changed since the last mark, None if nothing was edited
+        """
+        return min(position for position, _ in self._log) + 1 if self._log else None
+
+    def map_line(self, line: int) -> Optional[int]:
+        """
+        Map a line number from before the edits recorded since the last mark to the current one
+        :param line: line number (1-based) at the last mark
+        :return: current line number, or None if the line was deleted or its content was replaced
+        """
+        index = line - 1
+        for position, delta in self._log:
+            if delta == 0:
+                if index == position:
+                    return None
+            elif delta > 0:
+                if index >= position:
+                    index += delta
+            elif position <= index < position - delta:
+                return None
+            elif index >= position - delta:
+                index += delta
+        return index + 1
+
+    def changed_lines(self) -> List[int]:
+        """
+        :return: current line numbers (1-based) of the lines inserted or replaced since the last mark, sorted
+        """
+        changed = list()
+        for position, delta in self._log:
+            if delta == 0:
+                changed.append(position)
+            elif delta > 0:
+                changed = [i + delta if i >= position else i for i in changed]
+                changed.extend(range(position, position + delta))
+            else:
+                changed = [i + delta if i >= position - delta else i for i in changed
+                           if not position <= i < position - delta]
+        return sorted({i + 1 for i in changed})
+
+    def __record(self, position: int, delta: int) -> None:
+        # delta is the number of inserted (> 0) or deleted (< 0) lines at position, 0 if the line was replaced
+        self._log.append((position, delta))
+        self._version += 1
+
+    def __rebuild(self, lines: List[str]) -> None:
+        self._chunks = [lines[i:i + CHUNK_SIZE] for i in range(0, len(lines), CHUNK_SIZE)] or [list()]
+        self._length = len(lines)
+        self._starts = None
+
+    def __starts(self) -> List[int]:
+        if self._starts is None:
+            starts = list()
+            total = 0
+            for chunk in self._chunks:
+                starts.append(total)
+                total += len(chunk)
+            self._starts = starts
+        return self._starts
+
+    def __shift_starts(self, chunk: int, delta: int) -> None:
+        # update the start of the chunks following the edited one, instead of computing them again
+        if self._starts is not None and chunk + 1 < len(self._starts):
+            self._starts[chunk + 1:] = [start + delta for start in self._starts[chunk + 1:]]
+
+    def __locate(self, index: int) -> Tuple[int, int]:
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('line index out of range')
+
+        if len(self._chunks) == 1:
+            return 0, index
+        starts = self.__starts()
+        chunk = bisect_right(starts, index) - 1
+        # skip the chunks left empty by deletions
+        while index - starts[chunk] >= len(self._chunks[chunk]):
+            chunk += 1
+        return chunk, index - starts[chunk]
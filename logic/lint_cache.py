@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, List
+
+logger = logging.getLogger(__name__.split('.')[0])
+logger.setLevel(logging.DEBUG)
+
+LINT_CACHE_MAXSIZE = 1024
+
+_MISSING = object()
+
+
+@functools.lru_cache(maxsize=None)
+def hadolint_version() -> str:
+    """
+    :return: fingerprint of the installed hadolint, part of the lint keys. It changes whenever the binary is replaced,
+        without spawning hadolint just to ask its version
+    """
+    path = shutil.which('hadolint')
+    if not path:
+        return ''
+    stat = os.stat(path)
+    return f'{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def hadolint_config_files() -> List[str]:
+    """
+    :return: paths of the configuration files hadolint may read, in its lookup order: the working directory, the XDG
+        configuration directory, then the home directory
+    """
+    home = os.path.expanduser('~')
+    config_home = os.environ.get('XDG_CONFIG_HOME') or os.path.join(home, '.config')
+    return [os.path.join(os.getcwd(), '.hadolint.yaml'), os.path.join(os.getcwd(), '.hadolint.yml'),
+            os.path.join(config_home, 'hadolint.yaml'), os.path.join(config_home, 'hadolint.yml'),
+            os.path.join(home, '.hadolint', 'hadolint.yaml'), os.path.join(home, 'hadolint', 'config.yaml'),
+            os.path.join(home, '.hadolint.yaml'), os.path.join(home, '.hadolint.yml')]
+
+
+def hadolint_config() -> str:
+    """
+    :return: digest of the configuration of hadolint, part of the lint keys: the content of every configuration file
+        hadolint may read and the HADOLINT_* environment variables. It is computed on each call, since the working
+        directory, the files and the environment may change during a run
+    """
+    digest = hashlib.sha256()
+    for path in hadolint_config_files():
+        try:
+            with open(path, 'rb') as file:
+                content = file.read()
+        except OSError:
+            continue
+        digest.update(path.encode('utf-8') + b'\0' + hashlib.sha256(content).digest())
+    for name in sorted(name for name in os.environ if name.startswith('HADOLINT_')):
+        digest.update(f'{name}={os.environ[name]}'.encode('utf-8') + b'\0')
+    return digest.hexdigest()
+
+
+class LintCache:
+    """
+    Content-addressed LRU cache of the hadolint results and of the parsed instructions of Dockerfiles, so that an
+    identical text is never linted or parsed twice, e.g. by the re-lints of a fix sequence or by identical Dockerfiles
+    in a batch. The cache is shared by all the threads of the process.
+    If cache_dir is given, the entries are also stored on disk as pickle files and shared between processes and runs.
+    """
+
+    def __init__(self, maxsize: int = LINT_CACHE_MAXSIZE, cache_dir: str = None) -> None:
+        self._maxsize = maxsize
+        self._cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def lint_key(content: str, ignored_rules: List[str]) -> str:
+        """
+        :return: key of the hadolint result of the given content, with the given rules ignored, by the installed hadolint
+            with its current configuration
+        """
+        digest = hashlib.sha256()
+        digest.update(content.encode('utf-8'))
+        digest.update(b'\0' + hadolint_version().encode('utf-8'))
+        digest.update(b'\0' + hadolint_config().encode('utf-8'))
+        digest.update(b'\0' + ','.join(sorted(set(ignored_rules))).encode('utf-8'))
+        return 'lint-' + digest.hexdigest()
+
+    @staticmethod
+    def parse_key(content: str) -> str:
+        """
+        :return: key of the parsed instructions of the given content
+        """
+        return 'parse-' + hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Any:
+        """
+        :return: the cached value, or None if missing
+        """
+        with self._lock:
+            value = self._entries.get(key, _MISSING)
+            if value is not _MISSING:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        value = self.__load(key)
+        with self._lock:
+            if value is _MISSING:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.__store(key, value)
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        """
+        Cache the given value. Cached values are shared: never change them
+        """
+        with self._lock:
+            self.__store(key, value)
+        self.__dump(key, value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __store(self, key: str, value: Any) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+    def __disk_path(self, key: str) -> str:
+        return os.path.join(self._cache_dir, key[-2:], key + '.pickle')
+
+    def __load(self, key: str) -> Any:
+        if not self._cache_dir:
+            return _MISSING
+
+        try:
+            with open(self.__disk_path(key), 'rb') as file:
+                return pickle.load(file)
+        except FileNotFoundError:
+            return _MISSING
+        except Exception as e:
+            logger.warning(f'Cannot read the cached lint result {key}: {e}')
+            return _MISSING
+
+    def __dump(self, key: str, value: Any) -> None:
+        if not self._cache_dir:
+            return
+
+        path = self.__disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # written to a temporary file and renamed, so that concurrent readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as file:
+                pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f'Cannot write the cached lint result {key}: {e}')
+
+
+_lint_cache = LintCache()
+
+
+def get_lint_cache() -> LintCache:
+    """
+    :return: the lint cache of the process
+    """
+    return _lint_cache
+
+
+def configure_lint_cache(maxsize: int = LINT_CACHE_MAXSIZE, cache_dir: str = None) -> LintCache:
+    """
+    Replace the lint cache of the process
+    :param maxsize: maximum number of entries kept in memory
+    :param cache_dir: directory of the on-disk entries. If None, the entries are kept only in memory
+    :return: the new lint cache
+    """
+    global _lint_cache
+    _lint_cache = LintCache(maxsize, cache_dir)
+    return _lint_cache
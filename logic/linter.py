@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__.split('.')[0])
+logger.setLevel(logging.DEBUG)
+
+BATCH_SIZE = 16
+FLUSH_LATENCY = 0.05
+
+
+class LintError(Exception):
+    """Raised when hadolint does not return a valid JSON result"""
+    pass
+
+
+def hadolint_command(ignored_rules: List[str]) -> List[str]:
+    """
+    :param ignored_rules: rules not checked by hadolint
+    :return: the hadolint command with JSON output, without the files to lint
+    """
+    command = ['hadolint', '-f', 'json']
+    for rule in sorted(set(ignored_rules)):
+        command.extend(['--ignore', rule])
+    return command
+
+
+def lint_content(content: str, ignored_rules: List[str]) -> List[Dict]:
+    """
+    Lint a single Dockerfile, passing its content to hadolint through stdin
+    :param content: content of the Dockerfile
+    :param ignored_rules: rules not checked by hadolint
+    :return: list of the smells reported by hadolint, as JSON objects
+    """
+    output = subprocess.run(hadolint_command(ignored_rules) + ['-'], input=content.encode('utf-8'),
+                            stdout=subprocess.PIPE)
+    try:
+        return json.loads(output.stdout.decode('utf-8'))
+    except ValueError as e:
+        raise LintError(f'Invalid hadolint output: {e}')
+
+
+class _LintRequest:
+    __slots__ = ('content', 'enqueued', 'done', 'result', 'error')
+
+    def __init__(self, content: str) -> None:
+        self.content = content
+        self.enqueued = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchLinter:
+    """
+    Linter shared by the threads that fix many Dockerfiles at once.
+    The lint requests, both the first lint and the re-lints after the fixes, are queued and sent to a single hadolint
+    process per batch, one temporary file per Dockerfile. The results are split back by file.
+    A batch is sent when it holds batch_size requests, or when its oldest request waited flush_latency seconds.
+    Requests with different ignored rules go to different batches, since the flags apply to all the files of a call.
+    Use an instance as the linter of a Dockerfile.
+    """
+
+    def __init__(self, batch_size: int = BATCH_SIZE, flush_latency: float = FLUSH_LATENCY) -> None:
+        self._batch_size = max(1, batch_size)
+        self._flush_latency = flush_latency
+        self._cond = threading.Condition()
+        self._pending = dict()
+        self._flusher = None
+        self._batches = 0
+        self._files = 0
+
+    @property
+    def stats(self) -> Tuple[int, int]:
+        """
+        :return: number of hadolint calls and number of linted Dockerfiles
+        """
+        return self._batches, self._files
+
+    def __call__(self, content: str, ignored_rules: List[str]) -> List[Dict]:
+        """
+        Queue the lint of a Dockerfile and wait for the result of its batch
+        :param content: content of the Dockerfile
+        :param ignored_rules: rules not checked by hadolint
+        :return: list of the smells reported by hadolint, as JSON objects
+        """
+        key = tuple(sorted(set(ignored_rules)))
+        request = _LintRequest(content)
+
+        batch = None
+        with self._cond:
+            group = self._pending.setdefault(key, list())
+            group.append(request)
+            if len(group) >= self._batch_size:
+                batch = self._pending.pop(key)
+            else:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self.__flush_loop, name='hadolint-flusher', daemon=True)
+                    self._flusher.start()
+                self._cond.notify()
+
+        # a full batch is linted right away by the thread that filled it
+        if batch:
+            self.__lint_batch(key, batch)
+
+        request.done.wait()
+        if request.error:
+            raise request.error
+        return request.result
+
+    def __flush_loop(self) -> None:
+        while True:
+            for key, batch in self.__wait_due_batches():
+                self.__lint_batch(key, batch)
+
+    def __wait_due_batches(self) -> List[Tuple[Tuple, List[_LintRequest]]]:
+        with self._cond:
+            while True:
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+
+                now = time.monotonic()
+                deadline = min(group[0].enqueued for group in self._pending.values()) + self._flush_latency
+                if deadline > now:
+                    self._cond.wait(deadline - now)
+                    continue
+
+                due = [key for key, group in self._pending.items() if group[0].enqueued + self._flush_latency <= now]
+                return [(key, self._pending.pop(key)) for key in due]
+
+    def __lint_batch(self, ignored_rules: Tuple, batch: List[_LintRequest]) -> None:
+        try:
+            with tempfile.TemporaryDirectory(prefix='dockleaner-') as tmp_dir:
+                paths = list()
+                for i, request in enumerate(batch):
+                    path = os.path.join(tmp_dir, f'{i}.Dockerfile')
+                    with open(path, 'w', encoding='utf8') as file:
+                        file.write(request.content)
+                    paths.append(path)
+
+                output = subprocess.run(hadolint_command(list(ignored_rules)) + paths, stdout=subprocess.PIPE)
+
+            try:
+                result_json = json.loads(output.stdout.decode('utf-8'))
+            except ValueError as e:
+                raise LintError(f'Invalid hadolint output: {e}')
+
+            results = {path: list() for path in paths}
+            for smell_json in result_json:
+                results[smell_json['file']].append(smell_json)
+            for path, request in zip(paths, batch):
+                request.result = results[path]
+
+            with self._cond:
+                self._batches += 1
+                self._files += len(batch)
+            logger.debug(f'Linted {len(batch)} Dockerfiles with one hadolint call')
+        except Exception as e:
+            for request in batch:
+                request.error = e
+        finally:
+            for request in batch:
+                request.done.set()
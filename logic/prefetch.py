@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, NamedTuple, Set, Tuple
+
+from logic.dockerfile_obj import Dockerfile
+from smell_solvers.registry import get_registry
+
+logger = logging.getLogger(__name__.split('.')[0])
+logger.setLevel(logging.DEBUG)
+
+MAX_WORKERS = 8
+
+
+class Lookup(NamedTuple):
+    """
+    Remote lookup needed by the fix of a smell, i.e. a call to a memoized function of utils.
+    then, if set, receives the result of the lookup and returns the lookups depending on it.
+    """
+    func: Callable
+    args: Tuple
+    then: Callable[[Any], List['Lookup']] = None
+
+
+class PrefetchPlanner:
+    """
+    Collect the remote lookups that the strategies of the selected rules will need and resolve them concurrently,
+    in waves, before any edit happens. The results are kept by the memoized utils functions, so the strategies
+    find them ready when they fix the smells.
+    """
+
+    def __init__(self, dockerfile: Dockerfile, ignored_rules: List[str], max_workers: int = MAX_WORKERS) -> None:
+        self._dockerfile = dockerfile
+        self._ignored_rules = set(ignored_rules or [])
+        self._max_workers = max_workers
+
+    def plan(self) -> List[Lookup]:
+        """
+        :return: the lookups needed by the smells of the Dockerfile, without duplicates
+        """
+        registry = get_registry()
+        lookups = list()
+        for pos in sorted(self._dockerfile.smells_dict.keys()):
+            for smell in self._dockerfile.smells_dict[pos]:
+                if smell.code in self._ignored_rules or not registry.exists(smell.code):
+                    continue
+                try:
+                    lookups.extend(registry.get(smell.code).plan(self._dockerfile, pos))
+                except Exception as e:
+                    logger.warning(f'Cannot plan the lookups of {smell.code} on line {pos}: {e}')
+
+        return self.__unique(lookups, set())
+
+    def run(self) -> int:
+        """
+        Resolve all the planned lookups
+        :return: number of resolved lookups
+        """
+        start = time.perf_counter()
+        seen = set()
+        wave = self.__unique(self.plan(), seen)
+        resolved = 0
+        waves = 0
+
+        if not wave:
+            return 0
+
+        with ThreadPoolExecutor(max_workers=self._max_workers) as pool:
+            while wave:
+                waves += 1
+                futures = [(pool.submit(lookup.func, *lookup.args), lookup) for lookup in wave]
+
+                next_wave = list()
+                for future, lookup in futures:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # not memoized: the strategy will face the same error when fixing the smell
+                        logger.warning(f'Prefetch of {lookup.func.__name__}{lookup.args} failed: {e}')
+                        continue
+
+                    resolved += 1
+                    if lookup.then:
+                        next_wave.extend(lookup.then(result))
+
+                wave = self.__unique(next_wave, seen)
+
+        logger.info(f'Prefetched {resolved} lookups in {waves} waves ({time.perf_counter() - start:.2f}s)')
+        return resolved
+
+    @staticmethod
+    def __unique(lookups: List[Lookup], seen: Set) -> List[Lookup]:
+        unique = list()
+        for lookup in lookups:
+            key = (lookup.func, lookup.args)
+            if key not in seen:
+                seen.add(key)
+                unique.append(lookup)
+        return unique
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import difflib
+import json
+from typing import List, NamedTuple
+
+REPORT_FORMATS = ['none', 'unified', 'json', 'html']
+REPORT_EXTENSIONS = {'unified': '-log.diff', 'json': '-log.json', 'html': '-log.html'}
+
+
+class Edit(NamedTuple):
+    """
+    Lines changed by the fix of a smell.
+    start and end (1-based, inclusive) are the replaced range in the Dockerfile as it was when the fix was applied.
+    For pure insertions, end is start - 1.
+    """
+    code: str
+    smell_line: int
+    start: int
+    end: int
+    removed: List[str]
+    added: List[str]
+
+
+def compute_edits(code: str, smell_line: int, before: List[str], after: List[str]) -> List[Edit]:
+    """
+    Compute the edits made by the fix of a smell
+    :param code: code of the fixed rule
+    :param smell_line: line of the fixed smell
+    :param before: lines before the fix
+    :param after: lines after the fix
+    :return: list of edits, empty if the fix did not change anything
+    """
+    if before == after:
+        return []
+
+    matcher = difflib.SequenceMatcher(None, before, after, autojunk=False)
+    return [Edit(code, smell_line, i1 + 1, i2, before[i1:i2], after[j1:j2])
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+
+def unified_report(original_lines: List[str], fixed_lines: List[str], filepath: str) -> str:
+    """
+    :return: unified diff between the original and the fixed Dockerfile
+    """
+    return ''.join(difflib.unified_diff(original_lines, fixed_lines, filepath, filepath + '-fixed'))
+
+
+def json_report(edits: List[Edit], filepath: str) -> str:
+    """
+    :return: compact JSON object listing the edits made by each fix
+    """
+    return json.dumps({
+        'file': filepath,
+        'edits': [{'rule': e.code, 'smell_line': e.smell_line, 'start': e.start, 'end': e.end,
+                   'removed': e.removed, 'added': e.added} for e in edits]
+    }, separators=(',', ':')) + '\n'
+
+
+def html_report(original_lines: List[str], fixed_lines: List[str], filepath: str) -> str:
+    """
+    :return: HTML page with the side-by-side diff between the original and the fixed Dockerfile
+    """
+    return difflib.HtmlDiff().make_file(original_lines, fixed_lines, filepath, filepath + '-fixed', charset='utf-8')
+
+
+def make_report(report_format: str, original_lines: List[str], fixed_lines: List[str], edits: List[Edit],
+                filepath: str) -> str:
+    """
+    Build the report of the fixes in the given format
+    :param report_format: one of REPORT_FORMATS
+    :param original_lines: lines of the original Dockerfile
+    :param fixed_lines: lines of the fixed Dockerfile
+    :param edits: edits made by the fixes, used by the 'json' format
+    :param filepath: path of the Dockerfile
+    :return: the report, or None for the 'none' format
+    """
+    if report_format == 'unified':
+        return unified_report(original_lines, fixed_lines, filepath)
+    elif report_format == 'json':
+        return json_report(edits, filepath)
+    elif report_format == 'html':
+        return html_report(original_lines, fixed_lines, filepath)
+    return None
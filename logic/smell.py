@@ -1,7 +1,27 @@
-from pykson import JsonObject, IntegerField, StringField
+from __future__ import annotations
 
-class Smell(JsonObject):
-    line = IntegerField()
-    code = StringField()
-    message = StringField()
-    
\ No newline at end of file
+from typing import Dict
+
+
+class Smell:
+    """
+    Smell reported by hadolint
+    """
+    __slots__ = ('line', 'code', 'message')
+
+    def __init__(self, line: int = None, code: str = None, message: str = None) -> None:
+        self.line = line
+        self.code = code
+        self.message = message
+
+    @classmethod
+    def from_json(cls, smell_json: Dict) -> Smell:
+        """
+        Build a smell from a finding of the hadolint JSON output. Unknown keys (e.g. column, level) are ignored
+        :param smell_json: decoded JSON object of the finding
+        :return: the smell
+        """
+        return cls(smell_json.get('line'), smell_json.get('code'), smell_json.get('message'))
+
+    def __repr__(self) -> str:
+        return f'Smell(line={self.line!r}, code={self.code!r}, message={self.message!r})'
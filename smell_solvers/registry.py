@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import importlib
+import logging
+import sys
+import threading
+from os import listdir, scandir
+from os.path import abspath, dirname, isfile, join
+from typing import Callable, Dict, List
+
+from smell_solvers.strategy import Strategy
+
+logger = logging.getLogger(__name__.split('.')[0])
+logger.setLevel(logging.DEBUG)
+
+RULES_PATH = join(dirname(abspath(__file__)), 'rules')
+RULES_MODULE = 'smell_solvers.rules.'
+ENTRY_POINTS_GROUP = 'dockleaner.rules'
+
+
+class StrategyRegistry:
+    """
+    Registry of the available strategies, indexed by rule code.
+
+    The built-in rules are found by listing the 'rules' folder, and third-party rules by the entry points of the
+    'dockleaner.rules' group (the name of the entry point is the rule code, e.g. "DL3013 = my_rules.dl3013:DL3013").
+    Entry points are looked up only when a rule is not built-in or the full list of rules is requested.
+    A rule module is imported only when its rule is first needed, and a single, stateless instance of each strategy
+    is shared by all the fixes.
+    """
+
+    def __init__(self) -> None:
+        self._loaders: Dict[str, Callable[[], type]] = dict()
+        self._instances: Dict[str, Strategy] = dict()
+        self._lock = threading.Lock()
+        self._entry_points_loaded = False
+
+    def discover(self) -> None:
+        """
+        Register the built-in rules
+        """
+        for f in sorted(listdir(RULES_PATH)):
+            if isfile(join(RULES_PATH, f)) and f.endswith('.py'):
+                code = f.split('.')[0]
+                self.register(code, self.__module_loader(code))
+
+    def discover_entry_points(self) -> None:
+        """
+        Register the rules exposed through entry points. Run only once
+        """
+        if self._entry_points_loaded:
+            return
+        self._entry_points_loaded = True
+
+        for entry_point in _get_entry_points(ENTRY_POINTS_GROUP):
+            if entry_point.name in self._loaders:
+                logger.warning(f'Rule {entry_point.name} from {entry_point.value} is already registered, skipping it')
+                continue
+            self.register(entry_point.name, entry_point.load)
+
+    def register(self, code: str, loader: Callable[[], type]) -> None:
+        """
+        Register the strategy of a rule
+        :param code: code of the rule
+        :param loader: function returning the Strategy class of the rule. It is called on first use
+        """
+        self._loaders[code] = loader
+        self._instances.pop(code, None)
+
+    def codes(self) -> List[str]:
+        """
+        :return: list of the codes of the registered rules
+        """
+        self.discover_entry_points()
+        return list(self._loaders)
+
+    def exists(self, code: str) -> bool:
+        """
+        Check if a strategy is registered for the given rule
+        :param code: code of the rule
+        :return: True/False
+        """
+        if code not in self._loaders:
+            self.discover_entry_points()
+        return code in self._loaders
+
+    def get(self, code: str) -> Strategy:
+        """
+        Get the strategy solving the given rule
+        :param code: code of the rule
+        :return: the Strategy object shared by all the fixes of the rule
+        """
+        strategy = self._instances.get(code)
+        if strategy is None:
+            with self._lock:
+                strategy = self._instances.get(code)
+                if strategy is None:
+                    if code not in self._loaders:
+                        self.discover_entry_points()
+                    strategy = self._loaders[code]()()
+                    self._instances[code] = strategy
+        return strategy
+
+    @staticmethod
+    def __module_loader(code: str) -> Callable[[], type]:
+        return lambda: getattr(importlib.import_module(RULES_MODULE + code), code)
+
+
+def _declares_entry_points(group: str) -> bool:
+    """
+    Check if an installed distribution may declare entry points of the given group, by reading the entry_points.txt
+    files on sys.path. It spares importlib.metadata, which parses the metadata of every distribution and costs a large
+    part of the startup, when no plugin is installed
+    :param group: entry point group
+    :return: False only if no distribution declares the group
+    """
+    header = f'[{group}]'
+    for path in sys.path:
+        if isfile(path):
+            # zipped distributions are not scanned
+            return True
+        try:
+            entries = scandir(path or '.')
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if not entry.name.endswith(('.dist-info', '.egg-info')):
+                    continue
+                try:
+                    with open(join(entry.path, 'entry_points.txt'), encoding='utf-8') as file:
+                        if header in file.read():
+                            return True
+                except OSError:
+                    continue
+    return False
+
+
+def _get_entry_points(group: str) -> List:
+    if not _declares_entry_points(group):
+        return []
+
+    try:
+        from importlib import metadata
+    except ImportError:  # Python 3.7
+        try:
+            import importlib_metadata as metadata
+        except ImportError:
+            return []
+
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        return list(entry_points.select(group=group))
+    return list(entry_points.get(group, []))
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> StrategyRegistry:
+    """
+    Get the registry shared by the whole process. The rules are discovered on first use.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            registry = StrategyRegistry()
+            registry.discover()
+            _registry = registry
+        return _registry
@@ -25,16 +25,14 @@ class DL3003(Strategy):
         The commands composed with && are not fixed by this rule.
     """
 
+    conflicts = False
+
     def fix(self, dockerfile: Dockerfile, smell_pos: int) -> None:
         lines = dockerfile.lines
 
         position = smell_pos - 1
 
-        prev_workdir = None
-        for line in reversed(lines[:position]):
-            if line.strip().startswith('WORKDIR'):
-                prev_workdir = line.replace('WORKDIR', '').strip()
-                break
+        prev_workdir = dockerfile.index.workdir(smell_pos)
 
         line = lines[position]
         if re.match("RUN +CD ", line.strip(), flags=re.IGNORECASE) is not None:
@@ -45,22 +43,24 @@ class DL3003(Strategy):
                 if not new_workdir.replace('WORKDIR', '').strip() == prev_workdir:
                     lines[position] = new_workdir
                 else:
-                    lines[position] = ''
+                    del lines[position]
             else:
                 logger.info("Yes &&")
                 new_workdir = re.sub("RUN +CD", 'WORKDIR', line.split("&&")[0], count=1, flags=re.IGNORECASE) + "\n"
                 # check if the previous WORKDIR is the same as the new one
                 if not new_workdir.replace('WORKDIR', '').strip() == prev_workdir:
                     lines[position] = new_workdir
+                    run_pos = position + 1
                 else:
-                    lines[position] = ''
+                    del lines[position]
+                    run_pos = position
                 # check if the RUN command is on the next line
                 if line.split("&&", 1)[1].strip().endswith("\\"):
-                    lines[position + 1] = "RUN " + lines[position + 1].lstrip()
+                    lines[run_pos] = "RUN " + lines[run_pos].lstrip()
                 else:
-                    lines.insert(position + 1, "RUN " + line.split("&&", 1)[1])
+                    lines.insert(run_pos, "RUN " + line.split("&&", 1)[1])
                 # logger.info(lines)
 
-            dockerfile.update_smells_dict()
+            dockerfile.record_edit()
         else:
             logger.error("!!! Cannot solve DL3003 rule. The line does not match the format 'RUN cd ...'")
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
+from typing import List
+
 from logic.dockerfile_obj import Dockerfile
+from logic.prefetch import Lookup
 from smell_solvers.strategy import Strategy
 from utils.dockerhub_api import get_latest_tag
 import logging
@@ -17,11 +20,15 @@ class DL3007(Strategy):
     "You can never rely that the latest tags is a specific version."
     """
 
+    def plan(self, dockerfile: Dockerfile, smell_pos: int) -> List[Lookup]:
+        image_info = self.__get_image_info(dockerfile.lines, smell_pos - 1)
+        return [Lookup(get_latest_tag, (image_info.split(':')[0],))]
+
     def fix(self, dockerfile: Dockerfile, smell_pos: int) -> None:
         command_pos = smell_pos - 1
         lines = dockerfile.lines
 
-        image_info = lines[command_pos].replace('\t', ' ', 1).split(' ')[1].strip()
+        image_info = self.__get_image_info(lines, command_pos)
         image = image_info.split(':')[0]
         tag = get_latest_tag(image)
 
@@ -30,3 +37,6 @@ class DL3007(Strategy):
             lines[command_pos] = lines[command_pos].replace(image_info, new_image, 1)
         else:
             logger.error(f'!!! Cannot solve DL3007 rule. Cannot found an equivalent version tag for "{image_info}"')
+
+    def __get_image_info(self, lines: List[str], command_pos: int) -> str:
+        return lines[command_pos].replace('\t', ' ', 1).split(' ')[1].strip()
@@ -2,11 +2,14 @@ from __future__ import annotations
 
 import logging
 import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
 
 from logic.dockerfile_obj import Dockerfile
+from logic.prefetch import MAX_WORKERS, Lookup
 from smell_solvers.strategy import Strategy
-from utils.docker_utils import get_distro_info, is_valid_dockerfile_command, validate_package
+from utils.docker_utils import find_unavailable_packages, get_distro_info, is_valid_dockerfile_command
 from utils.launchpad_api import get_package_binary_version, pkgs_repo_available
 
 logger = logging.getLogger(__name__.split('.')[0])
@@ -30,14 +33,36 @@ class DL3008(Strategy):
         TODO:/bin/bash -c "apt-get update && apt-cache madison \$(apt-cache search '' | sort -d | awk '{print \$1}')"
     """
 
+    def plan(self, dockerfile: Dockerfile, smell_pos: int) -> List[Lookup]:
+        date = dockerfile.last_edit
+        image_info = dockerfile.index.base_image(smell_pos)
+        if not image_info:
+            return []
+
+        packages = [package for _, package in self.__collect_packages(dockerfile.lines, smell_pos)]
+
+        def plan_packages(distro: str, serie: str, available: bool) -> List[Lookup]:
+            if not available:
+                return []
+            return [Lookup(get_package_binary_version, (distro, serie, package, date)) for package in packages]
+
+        def plan_repo(distro_info: str) -> List[Lookup]:
+            if not distro_info:
+                return []
+            distro, serie = distro_info.split(':')[0], distro_info.split(':')[1]
+            return [Lookup(pkgs_repo_available, (distro, serie),
+                           lambda available: plan_packages(distro, serie, available))]
+
+        return [Lookup(get_distro_info, (image_info,), plan_repo)]
+
     def fix(self, dockerfile: Dockerfile, smell_pos: int) -> None:
         date = dockerfile.last_edit
         lines = dockerfile.lines
 
-        # Get nearest FROM
-        for line in reversed(lines[:smell_pos]):
-            if line.strip().upper().startswith('FROM'):
-                image_info = line.strip().split(" ")[1]
+        image_info = dockerfile.index.base_image(smell_pos)
+        if not image_info:
+            logger.error(f'!!! Cannot solve DL3008 rule. No FROM instruction found')
+            return
 
         # Get distro info
         distro_info = get_distro_info(image_info)
@@ -52,6 +77,26 @@ class DL3008(Strategy):
             logger.error(f'!!! Cannot solve DL3008 rule. Package repositories not available for "{image_info}"')
             return
 
+        packages = self.__collect_packages(lines, smell_pos)
+        versions = self.__resolve_versions(distro, serie, [package for _, package in packages], date)
+        pins = self.__validate_pins(image_info, versions)
+
+        # each line is rewritten once, with all its pinned packages
+        new_lines = dict()
+        for position, package in packages:
+            # Line cleaning
+            line = new_lines.get(position, lines[position].rstrip() + '\n')
+            new_lines[position] = line.replace(f"{package}", f"{pins.get(package, package)}", 1)
+        for position, line in new_lines.items():
+            lines[position] = line
+
+    def __collect_packages(self, lines: List[str], smell_pos: int) -> List[Tuple[int, str]]:
+        """
+        Collect the unpinned packages of the apt-get install command
+        :return: list of (line position, package name) pairs
+        """
+        packages = list()
+
         # Find apt-get position
         position = smell_pos - 1
         for line in lines[position:]:
@@ -97,15 +142,13 @@ class DL3008(Strategy):
                     next_line = lines[position]
                     words = next_line.strip().split(" ")
             elif self.__is_unpinned_package(word):
-                # Line cleaning
-                # lines[position] = lines[position].replace("\t", "    ")
-                lines[position] = lines[position].rstrip() + '\n'
-                pinned = self.__pin_package(image_info, distro, serie, word, date)
-                lines[position] = lines[position].replace(f"{word}", f"{pinned}", 1)
+                packages.append((position, word))
 
             if len(words) == 0:
                 break
 
+        return packages
+
     def __is_unpinned_package(self, package_name: str) -> bool:
         """
         Check if the given package name is unpinned.
@@ -120,29 +163,82 @@ class DL3008(Strategy):
     def __is_stop_word(self, stop_word: str) -> bool:
         return ';' in stop_word or '&' in stop_word or is_valid_dockerfile_command(stop_word)
 
-    def __pin_package(self, image_info: str, distro: str, serie: str, package_name: str, date: datetime) -> str:
-        pinned_package = package_name
-        version = get_package_binary_version(distro, serie, package_name, date)
+    def __resolve_versions(self, distro: str, serie: str, packages: List[str],
+                           date: datetime) -> Dict[str, Optional[str]]:
+        """
+        Look up the versions of all the packages at once, MAX_WORKERS at a time
+        :return: the version of each package, None if not found
+        """
+        def resolve(package_name: str) -> Optional[str]:
+            try:
+                return get_package_binary_version(distro, serie, package_name, date)
+            except Exception as e:
+                logger.error(f'!!! Cannot pin version to {package_name}. {e}')
+                return None
+
+        unique = list(dict.fromkeys(packages))
+        if not unique:
+            return dict()
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(unique))) as pool:
+            return dict(zip(unique, pool.map(resolve, unique)))
+
+    def __validate_pins(self, image_info: str, versions: Dict[str, Optional[str]]) -> Dict[str, str]:
+        """
+        Validate the pinned packages together: the PATCH release of each version is replaced by '*' and all the
+        packages are installed with a single build; the rejected ones are tried again with the MINOR release replaced.
+        :return: the accepted pin of each package, e.g. {'curl': 'curl=7.68.*'}
+        """
+        pins = dict()
+        candidates = dict()
+        for package_name, version in versions.items():
+            if version:
+                candidates[package_name] = version
+            else:
+                logger.error(f'!!! Cannot pin version to {package_name}. Package not found.')
 
-        if version:
-            rnum = 2
-            while rnum >= 0:
-                version = self.__format_version(version, rnum)
-                if not version:
-                    logger.error(f'!!! Cannot pin version to {package_name}.')
-                    return package_name
+        rnum = 2
+        while candidates and rnum > 0:
+            formatted = {package_name: self.__format_version(version, rnum)
+                         for package_name, version in candidates.items()}
+            rejected = self.__rejected_pins(image_info, [f'{name}={version}' for name, version in formatted.items()])
 
+            candidates = dict()
+            for package_name, version in formatted.items():
                 pinned_package = package_name + '=' + version
-                status = validate_package(image_info, pinned_package)
-                if status == 100:
-                    rnum -= 1
+                if pinned_package in rejected:
+                    candidates[package_name] = version
                 else:
+                    pins[package_name] = pinned_package
                     logger.info(f'Pinned: {pinned_package}')
-                    break
-        else:
-            logger.error(f'!!! Cannot pin version to {package_name}. Package not found.')
+            rnum -= 1
+
+        for package_name in candidates:
+            logger.error(f'!!! Cannot pin version to {package_name}.')
+        return pins
+
+    def __rejected_pins(self, image_info: str, pinned_packages: List[str]) -> Set[str]:
+        """
+        :return: the pinned packages that cannot be installed in the image. They are installed with a single build,
+            without the ones apt-get reports as not found until it succeeds; a build failing for another reason is
+            split in halves, down to the single packages
+        """
+        rejected = set()
+        pending = list(pinned_packages)
+        while pending:
+            unavailable = find_unavailable_packages(image_info, tuple(pending))
+            if unavailable is None:
+                if len(pending) == 1:
+                    return rejected | set(pending)
+                middle = len(pending) // 2
+                return rejected | self.__rejected_pins(image_info, pending[:middle]) | \
+                    self.__rejected_pins(image_info, pending[middle:])
+            if not unavailable:
+                break
+
+            rejected |= unavailable
+            pending = [pinned_package for pinned_package in pending if pinned_package not in unavailable]
 
-        return pinned_package
+        return rejected
 
     def __format_version(self, version: str, rnum: int) -> str:
         """
@@ -27,15 +27,14 @@ class DL3009(Strategy):
         subsequent instructions.
     """
 
+    conflicts = False
+
     def fix(self, dockerfile: Dockerfile, smell_pos: int) -> None:
         # Find latest "RUN apt-get install" position
         smelly_command = None
         command_end_pos = -1
-        for line in dockerfile.parsed_lines.values():
-            cmd = line.cmd
-            value = line.value[0]
-            if cmd == 'RUN' and \
-                    "apt-get" in value and " install " in value:
+        for line in dockerfile.index.runs_calling('apt-get'):
+            if " install " in line.value[0]:
                 smelly_command = line
                 command_end_pos = line.end_line - 1
 
@@ -82,4 +81,4 @@ class DL3009(Strategy):
         if not is_rm_lists_present:
             dockerfile.lines.insert(insert_pos, rm_command)
 
-        dockerfile.update_smells_dict()
+        dockerfile.record_edit()
@@ -22,11 +22,16 @@ class DL3015(Strategy):
     def fix(self, dockerfile: Dockerfile, smell_pos: int) -> None:
         lines = dockerfile.lines
 
-        # Find apt-get position and adding --no-install-recommends option
+        # Find apt-get position and adding --no-install-recommends option, until the end of the instruction
         position = smell_pos - 1
-        for line in lines[position:]:
-            if "apt-get" in line and " install " in line and "--no-install-recommends" not in line and not line.strip().startswith("#"):
-                lines[position] = lines[position].replace(" install ", " install --no-install-recommends ")
-            if "\\" in line:
+        while position < len(lines):
+            line = lines[position]
+            if line.strip().startswith("#"):
                 position += 1
+                continue
+            if "apt-get" in line and " install " in line and "--no-install-recommends" not in line:
+                lines[position] = line.replace(" install ", " install --no-install-recommends ")
+            if not line.rstrip().endswith("\\"):
+                break
+            position += 1
 
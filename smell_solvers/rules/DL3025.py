@@ -20,6 +20,8 @@ class DL3025(Strategy):
         The CMD or ENTRYPOINT instruction is formatted when fixing the smell by adding \n where && or ; are present
     """
 
+    conflicts = False
+
     def fix(self, dockerfile: Dockerfile, smell_pos: int) -> None:
         smelly_cmd = dockerfile.parsed_lines[smell_pos]
 
@@ -44,10 +46,7 @@ class DL3025(Strategy):
 
         new_cmd = ' '.join(args)
 
-        # replace old command
-        for i in range(smelly_cmd.end_line - smelly_cmd.start_line + 1):
-            del dockerfile.lines[smelly_cmd.start_line - 1]
-
-        dockerfile.lines.insert(smelly_cmd.start_line - 1, new_cmd + "\n")
+        # replace old command, one line per element
+        dockerfile.lines[smelly_cmd.start_line - 1:smelly_cmd.end_line] = (new_cmd + "\n").splitlines(keepends=True)
 
-        dockerfile.update_smells_dict()
+        dockerfile.record_edit()
@@ -17,6 +17,8 @@ class DL3048(Strategy):
         Invalid Label Key
     """
 
+    conflicts = False
+
     def fix(self, dockerfile: Dockerfile, smell_pos: int) -> None:
         smelly_cmd = dockerfile.parsed_lines[smell_pos]
 
@@ -48,9 +50,7 @@ class DL3048(Strategy):
 
         new_labels = "LABEL " + " \\\n    ".join(new_labels)
 
-        for i in range(smelly_cmd.start_line - 1, smelly_cmd.end_line):
-            dockerfile.lines[i] = ""
-
-        dockerfile.lines[smelly_cmd.start_line - 1] = new_labels + "\n"
+        # one element per line, so that the positions of the following smells can be remapped
+        dockerfile.lines[smelly_cmd.start_line - 1:smelly_cmd.end_line] = (new_labels + "\n").splitlines(keepends=True)
 
-        dockerfile.update_smells_dict()
+        dockerfile.record_edit()
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from logic.dockerfile_obj import Dockerfile
 from smell_solvers.strategy import Strategy
-from utils.docker_utils import COMMANDS, parse_dockerfile_str
+from utils.docker_utils import is_valid_dockerfile_command
 
 
 class DL3059(Strategy):
@@ -29,7 +29,7 @@ class DL3059(Strategy):
             if prev_line:
                 if prev_line.startswith("#") or prev_line.startswith("RUN --"):
                     break
-                elif prev_line.split(" ")[0] in COMMANDS:
+                elif is_valid_dockerfile_command(prev_line.split(" ")[0]):
                     if prev_line.startswith("RUN"):
                         prev_run_pos = i
                     else:
@@ -53,4 +53,4 @@ class DL3059(Strategy):
                 else:
                     break
 
-            dockerfile.update_smells_dict()
+            dockerfile.record_edit()
@@ -16,20 +16,26 @@ class DL4000(Strategy):
         "MAINTAINER is deprecated since Docker 1.13.0"
     """
 
+    conflicts = False
+
     def fix(self, dockerfile: Dockerfile, smell_pos: int) -> None:
-        command_pos = -1
+        commands = list()
         maintainers = list()
-        for line in dockerfile.parsed_lines.values():
-            if line.cmd.lower() == 'maintainer':
-                if command_pos == -1 or line.start_line - 1 < command_pos:
-                    command_pos = line.start_line - 1
-                for m in re.split(r'\s{2,}', line.value[0]):
-                    maintainers.append(dequote(m.strip()))
-                for i in range(line.start_line - 1, line.end_line):
-                    dockerfile.lines[i] = ""
-                dockerfile.lines[i] = "\n"
+        for line in dockerfile.index.instructions('MAINTAINER'):
+            commands.append(line)
+            for m in re.split(r'\s{2,}', line.value[0]):
+                maintainers.append(dequote(m.strip()))
 
         if maintainers:
-            dockerfile.lines[command_pos] = f'LABEL maintainer="{", ".join(maintainers)}"\n'
-            dockerfile.update_smells_dict()
+            first = commands[0]
+            # the first MAINTAINER becomes the LABEL, the others an empty line. Replaced from the bottom, so that the
+            # positions of the commands not replaced yet are still valid
+            for command in reversed(commands):
+                new_lines = ["\n"]
+                if command is first:
+                    new_lines = [f'LABEL maintainer="{", ".join(maintainers)}"\n']
+                    if command.end_line > command.start_line:
+                        new_lines.append("\n")
+                dockerfile.lines[command.start_line - 1:command.end_line] = new_lines
+            dockerfile.record_edit()
 
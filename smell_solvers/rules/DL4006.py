@@ -1,8 +1,10 @@
 from __future__ import annotations
 
 import subprocess
+from typing import List, Tuple
 
 from logic.dockerfile_obj import Dockerfile
+from logic.prefetch import Lookup
 from smell_solvers.strategy import Strategy
 from utils.docker_utils import validate_shell
 import logging as logger
@@ -20,23 +22,18 @@ class DL4006(Strategy):
         to ensure that an unexpected error prevents the build from inadvertently succeeding."
     """
 
+    def plan(self, dockerfile: Dockerfile, smell_pos: int) -> List[Lookup]:
+        near_from = dockerfile.index.base_image(smell_pos)
+        path, _ = self.__get_default_shell(near_from)
+        fallback = Lookup(validate_shell, (near_from, '/bin/sh'))
+        return [Lookup(validate_shell, (near_from, path), lambda valid: [] if valid else [fallback])]
+
     def fix(self, dockerfile: Dockerfile, smell_pos: int) -> None:
         command_pos = smell_pos - 1
         lines = dockerfile.lines
 
-        # Get nearest FROM
-        for line in reversed(lines[:smell_pos]):
-            if line.strip().upper().startswith('FROM'):
-                near_from = line.strip().split(" ")[1]
-
-        # set default shell and option
-        path = '/bin/bash'
-        option = '-o'
-
-        # set ash if alpine or busybox
-        if 'alpine' in near_from or 'busybox' in near_from:
-            path = '/bin/ash'
-            option = '-eo'
+        near_from = dockerfile.index.base_image(smell_pos)
+        path, option = self.__get_default_shell(near_from)
 
         logger.info("Validate shell {} for {}".format(path, near_from))
         if not validate_shell(near_from, path):
@@ -52,6 +49,12 @@ class DL4006(Strategy):
         new_line = f'SHELL ["{path}", "{option}", "pipefail", "-c"]' + '\n'
         lines.insert(command_pos, new_line)
 
-        dockerfile.update_smells_dict(ignore=['DL4006'])
+        dockerfile.record_edit(ignore=['DL4006'])
 
         # TODO: handle multi-stage Dockerfiles
+
+    def __get_default_shell(self, near_from: str) -> Tuple[str, str]:
+        # set ash if alpine or busybox, bash otherwise
+        if 'alpine' in near_from or 'busybox' in near_from:
+            return '/bin/ash', '-eo'
+        return '/bin/bash', '-o'
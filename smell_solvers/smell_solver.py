@@ -1,15 +1,9 @@
 from __future__ import annotations
 
-import sys
-from os import listdir
-from os.path import isfile, join
-from typing import List
-
 from logic.dockerfile_obj import Dockerfile
+from smell_solvers.registry import get_registry
 from smell_solvers.strategy import Strategy
 
-RULES_PATH = sys.path[0] + '/smell_solvers/rules'
-
 
 class SmellSolver:
     """
@@ -18,7 +12,7 @@ class SmellSolver:
 
     def __init__(self) -> None:
         self._strategy = None
-        self._available_strategies = self.__load_strategies()
+        self._registry = get_registry()
 
     @property
     def strategy(self) -> Strategy:
@@ -31,6 +25,13 @@ class SmellSolver:
         """
         self._strategy = strategy
 
+    def use_strategy(self, name: str) -> None:
+        """
+        Define the strategy of the smell to solve from its rule code
+        :param name: name of the strategy to use
+        """
+        self._strategy = self._registry.get(name)
+
     def fix_smell(self, dockerfile: Dockerfile, smell_pos: int) -> None:
         """
         Fix the smell (previously set) in a specific line position of the given Dockerfile
@@ -47,11 +48,4 @@ class SmellSolver:
         :param name: name of the strategy to check
         :return: True/False
         """
-        return name in self._available_strategies
-
-    def __load_strategies(self) -> List[str]:
-        """
-        Search all the available strategies in the 'rules' folder
-        :return: list of strings representing the existing strategies
-        """
-        return [f.split('.')[0] for f in listdir(RULES_PATH) if isfile(join(RULES_PATH, f))]
+        return self._registry.exists(name)
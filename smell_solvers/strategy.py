@@ -1,15 +1,30 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+from typing import List
 
 from logic.dockerfile_obj import Dockerfile
 
 
 class Strategy(ABC):
     """
-    Abstract Class of the strategy adopted to solve a smell
+    Abstract Class of the strategy adopted to solve a smell.
+    After editing the lines, a fix calls dockerfile.record_edit(). Set conflicts to False if the edits only touch the
+    lines of the smell, so that the fix can share a re-lint with the other fixes of a pass.
     """
 
+    conflicts = True
+
     @abstractmethod
     def fix(self, dockerfile: Dockerfile, smell_pos: int):
         pass
+
+    def plan(self, dockerfile: Dockerfile, smell_pos: int) -> List:
+        """
+        List the remote lookups (logic.prefetch.Lookup) that the fix of the smell will need, so that they can be
+        resolved in advance. Override it in the strategies that query remote services.
+        :param dockerfile: Dockerfile to fix
+        :param smell_pos: position of the line containing the smell
+        :return: list of Lookup objects
+        """
+        return []
@@ -0,0 +1,176 @@
+"""
+Benchmark of the Launchpad package version lookup of DL3008 (get_package_binary_version).
+
+It counts the getPublishedBinaries pages and response bytes of each lookup with the former query (all the series and
+architectures, 100 binaries per page, filtered by the client) and with the current one (filtered by distro arch series
+on the server, 300 binaries per page), and checks that both find the same versions.
+
+The responses are served from a fixture of published binaries: either one recorded from Launchpad with --record
+(network access needed), or a synthetic one shaped like the publications of widely built packages (libc6, openssl):
+a version per pocket, in each series and architecture. The figures of the synthetic fixture only check that the
+filtered query needs fewer pages: they are not the sizes of the Launchpad responses, quote the ones of a recorded
+fixture.
+
+Usage:
+    python test/bench_launchpad.py [fixture.json]
+    python test/bench_launchpad.py --record fixture.json package [package ...]
+"""
+from __future__ import annotations
+
+import datetime
+import json
+import random
+import sys
+from urllib.parse import quote
+
+from helpers import FakeResponse, check, query_params
+
+import utils.launchpad_api as launchpad_api
+from utils.launchpad_api import LAUNCHPAD_URL
+
+SERIES = ['noble', 'jammy', 'focal', 'bionic', 'xenial', 'trusty', 'oracular', 'plucky']
+ARCHITECTURES = ['amd64', 'arm64', 'armhf', 'i386', 'ppc64el', 's390x', 'riscv64']
+POCKETS = ['Release', 'Updates', 'Security', 'Proposed', 'Backports']
+PACKAGES = ['libc6', 'openssl', 'curl', 'git', 'python3', 'ca-certificates', 'tzdata', 'nginx']
+FORMER_PAGE_SIZE = 100
+
+
+def synthetic_fixture() -> dict:
+    """Published binaries of each package: a version per pocket, in each series and architecture"""
+    rng = random.Random(7)
+    fixture = dict()
+    for package in PACKAGES:
+        entries = list()
+        for s, serie in enumerate(SERIES):
+            released = datetime.datetime(2024, 4, 25) - datetime.timedelta(days=365 * s // 2)
+            for p, pocket in enumerate(POCKETS):
+                if p > 0 and rng.random() < 0.3:
+                    continue
+                published = released + datetime.timedelta(days=0 if p == 0 else rng.randint(1, 700), hours=p)
+                version = f'{len(package)}.{s}-{p}ubuntu{rng.randint(1, 9)}'
+                # an architecture-independent package is published in each architecture
+                for architecture in ARCHITECTURES[:4 if serie in ('xenial', 'trusty') else 7]:
+                    entries.append({
+                        'self_link': f'{LAUNCHPAD_URL}ubuntu/+archive/primary/+binarypub/{rng.randint(1, 10 ** 8)}',
+                        'resource_type_link': f'{LAUNCHPAD_URL}#binary_package_publishing_history',
+                        'display_name': f'{package} {version} in {serie} {architecture}',
+                        'binary_package_name': package,
+                        'binary_package_version': version,
+                        'distro_arch_series_link': f'{LAUNCHPAD_URL}ubuntu/{serie}/{architecture}',
+                        'component_name': 'main',
+                        'section_name': 'libs',
+                        'priority_name': 'REQUIRED',
+                        'pocket': pocket,
+                        'status': 'Published',
+                        'architecture_specific': False,
+                        'date_created': published.strftime('%Y-%m-%dT%H:%M:%S.%f+00:00'),
+                        'date_published': published.strftime('%Y-%m-%dT%H:%M:%S.%f+00:00'),
+                        'archive_link': f'{LAUNCHPAD_URL}ubuntu/+archive/primary',
+                    })
+        fixture[package] = entries
+    return fixture
+
+
+def record_fixture(path: str, packages: list) -> None:
+    """Record all the published binaries of the given packages, with the unfiltered query"""
+    fixture = dict()
+    for package in packages:
+        fixture[package] = list()
+        start = 0
+        while True:
+            response = launchpad_api.request_data(
+                f'{LAUNCHPAD_URL}ubuntu/+archive/primary?ws.start={start}&ws.size=300&ws.op=getPublishedBinaries'
+                f'&binary_name={quote(package)}&status=Published&exact_match=true&order_by_date=true').json()
+            fixture[package].extend(response['entries'])
+            start += 300
+            if 'next_collection_link' not in response:
+                break
+        print(f'{package}: {len(fixture[package])} published binaries')
+    with open(path, 'w') as file:
+        json.dump(fixture, file)
+
+
+class FixtureServer:
+    """getPublishedBinaries served from the fixture, counting the pages and bytes of the responses"""
+
+    def __init__(self, fixture: dict) -> None:
+        self.fixture = fixture
+        self.pages = 0
+        self.bytes = 0
+
+    def request_data(self, url: str):
+        query = query_params(url)
+        entries = self.fixture.get(query['binary_name'], [])
+        if 'distro_arch_series' in query:
+            entries = [entry for entry in entries if entry['distro_arch_series_link'] == query['distro_arch_series']]
+        entries = sorted(entries, key=lambda entry: entry['date_published'], reverse=True)
+        start, size = int(query['ws.start']), min(int(query['ws.size']), 300)
+        body = {'start': start, 'total_size': len(entries), 'entries': entries[start:start + size]}
+        if start + size < len(entries):
+            body['next_collection_link'] = url.replace(f'ws.start={start}', f'ws.start={start + size}')
+        response = FakeResponse(body)
+        self.pages += 1
+        self.bytes += len(response.text)
+        return response
+
+
+def former_lookup(server: FixtureServer, serie: str, package: str, date: datetime.datetime):
+    """The lookup replaced: every published binary of the package, filtered by the client"""
+    distro_arch_serie = LAUNCHPAD_URL + 'ubuntu/' + serie
+    start = 0
+    while True:
+        response = server.request_data(
+            f'{LAUNCHPAD_URL}ubuntu/+archive/primary?ws.start={start}&ws.size={FORMER_PAGE_SIZE}'
+            f'&ws.op=getPublishedBinaries&binary_name={package}&status=Published&exact_match=true'
+            f'&order_by_date=true').json()
+        for binary in response['entries']:
+            if distro_arch_serie not in binary['distro_arch_series_link']:
+                continue
+            published = datetime.datetime.strptime(binary['date_published'].split('T')[0], '%Y-%m-%d')
+            if date > published and binary['pocket'] not in ('Proposed', 'Backports'):
+                return binary['binary_package_version']
+        start += FORMER_PAGE_SIZE
+        if start >= response['total_size']:
+            return None
+
+
+def main() -> int:
+    if len(sys.argv) > 2 and sys.argv[1] == '--record':
+        record_fixture(sys.argv[2], sys.argv[3:] or PACKAGES)
+        return 0
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as file:
+            fixture = json.load(file)
+        source = sys.argv[1]
+    else:
+        fixture = synthetic_fixture()
+        source = 'synthetic fixture'
+
+    dates = [datetime.datetime(2025, 6, 1), datetime.datetime(2023, 1, 1), datetime.datetime(2020, 6, 1)]
+    lookups = [(serie, package, date) for package in fixture for serie in SERIES[:6] for date in dates]
+    print(f'{len(lookups)} lookups of {len(fixture)} packages ({source}, '
+          f'{sum(len(entries) for entries in fixture.values())} published binaries)')
+
+    former = FixtureServer(fixture)
+    expected = [former_lookup(former, serie, package, date) for serie, package, date in lookups]
+
+    current = FixtureServer(fixture)
+    launchpad_api.request_data = current.request_data
+    results = list()
+    for serie, package, date in lookups:
+        launchpad_api.get_package_binary_version.cache_clear()
+        results.append(launchpad_api.get_package_binary_version('ubuntu', serie, package, date))
+
+    for name, server in [('former', former), ('current', current)]:
+        print(f'\t{name + ":":9}{server.pages / len(lookups):6.2f} pages, {server.bytes / len(lookups) / 1024:8.1f} KiB '
+              f'per lookup ({server.pages} pages, {server.bytes / 1024 / 1024:.1f} MiB)')
+
+    if len(sys.argv) == 1:
+        print('\tsynthetic fixture: the figures are not the ones of Launchpad, record a fixture with --record')
+
+    differences = sum(a != b for a, b in zip(expected, results))
+    return check(f'same versions found, {differences} differences', not differences)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
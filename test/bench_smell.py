@@ -0,0 +1,71 @@
+"""
+Microbenchmark of the deserialization of the hadolint findings into Smell objects.
+
+It compares, on synthetic findings shaped like the hadolint JSON output:
+- the former Pykson JsonObject deserialization, if pykson is installed;
+- the slotted Smell.from_json.
+For each one it reports the time per finding and the memory retained by the built smells.
+
+Usage: python test/bench_smell.py [n_findings]
+"""
+from __future__ import annotations
+
+import sys
+import time
+import tracemalloc
+
+import helpers  # noqa: F401
+
+from logic.smell import Smell
+
+CODES = ['DL3008', 'DL3009', 'DL3015', 'DL3020', 'DL4000', 'SC2086']
+
+
+def make_findings(n: int) -> list:
+    return [{'code': CODES[i % len(CODES)], 'column': 1, 'file': '-', 'level': 'warning', 'line': i + 1,
+             'message': f'Synthetic finding number {i}'} for i in range(n)]
+
+
+def pykson_builder():
+    try:
+        from pykson import IntegerField, JsonObject, Pykson, StringField
+    except ImportError:
+        return None
+
+    class PyksonSmell(JsonObject):
+        line = IntegerField()
+        code = StringField()
+        message = StringField()
+
+    return lambda smell_json: Pykson().from_json(smell_json, PyksonSmell, accept_unknown=True)
+
+
+def measure(name: str, build, findings: list) -> None:
+    start = time.perf_counter()
+    for smell_json in findings:
+        build(smell_json)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    smells = [build(smell_json) for smell_json in findings]
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    n = len(smells)
+    print(f'{name:<18} {elapsed / n * 1e6:8.2f} us/finding {retained / n:8.1f} B/finding')
+
+
+def main(n: int) -> None:
+    findings = make_findings(n)
+    print(f'findings: {n}')
+
+    build = pykson_builder()
+    if build:
+        measure('pykson (before)', build, findings)
+    else:
+        print('pykson (before)    not installed, skipped')
+    measure('slotted (after)', Smell.from_json, findings)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
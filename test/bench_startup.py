@@ -0,0 +1,95 @@
+"""
+Startup benchmark of dockleaner.
+
+It measures, over several cold runs (a new Python process each time):
+- the import time of the dockleaner module;
+- the time to first output and the total time of a fix with a text-only rule (DL3020).
+It also reports the heavy modules loaded by the import, which should be none.
+
+The target applies to the time of the cold run over the start of a bare interpreter, measured the same way: the
+interpreter start (site and the .pth files of the installed packages) depends on the machine, not on dockleaner.
+
+Usage: python test/bench_startup.py [runs]
+"""
+from __future__ import annotations
+
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(THIS_DIR)
+DOCKLEANER = os.path.join(ROOT_DIR, 'dockleaner.py')
+EXAMPLE = os.path.join(THIS_DIR, 'DL3020', 'Example1')
+HEAVY_MODULES = ['docker', 'requests', 'backoff', 'dockerfile']
+TARGET_MS = 150
+
+IMPORT_SCRIPT = '''
+import sys, time
+start = time.perf_counter()
+import dockleaner
+elapsed = time.perf_counter() - start
+print(elapsed, ','.join(m for m in {} if m in sys.modules))
+'''.format(HEAVY_MODULES)
+
+
+def measure_import() -> tuple:
+    output = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT], cwd=ROOT_DIR, stdout=subprocess.PIPE,
+                            check=True).stdout.decode().split()
+    return float(output[0]), output[1] if len(output) > 1 else ''
+
+
+def measure_interpreter() -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], check=True)
+    return time.perf_counter() - start
+
+
+def measure_run(dockerfile: str) -> tuple:
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, DOCKLEANER, '-p', dockerfile, '-d', '2023-01-01',
+                                '--rule', 'DL3020', '--overwrite'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    process.stderr.readline()
+    first_output = time.perf_counter() - start
+    process.communicate()
+    return first_output, time.perf_counter() - start
+
+
+def main(runs: int) -> None:
+    import_times = list()
+    heavy = ''
+    for _ in range(runs):
+        elapsed, heavy = measure_import()
+        import_times.append(elapsed)
+
+    interpreter_times = [measure_interpreter() for _ in range(runs)]
+
+    first_outputs = list()
+    totals = list()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dockerfile = os.path.join(tmp_dir, 'Dockerfile')
+        for _ in range(runs):
+            shutil.copy(EXAMPLE, dockerfile)
+            first_output, total = measure_run(dockerfile)
+            first_outputs.append(first_output)
+            totals.append(total)
+
+    total_ms = statistics.median(totals) * 1000
+    interpreter_ms = statistics.median(interpreter_times) * 1000
+    own_ms = total_ms - interpreter_ms
+    print(f'runs: {runs}')
+    print(f'import time (median):     {statistics.median(import_times) * 1000:7.1f} ms')
+    print(f'heavy modules imported:   {heavy or "none"}')
+    print(f'time to first output:     {statistics.median(first_outputs) * 1000:7.1f} ms')
+    print(f'interpreter start:        {interpreter_ms:7.1f} ms')
+    print(f'DL3020 cold run (median): {total_ms:7.1f} ms, {own_ms:.1f} ms over the interpreter start '
+          f'[{"OK" if own_ms <= TARGET_MS else "SLOW"}, target {TARGET_MS} ms]')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -0,0 +1,102 @@
+"""
+Consistency check of the in-process detectors (logic/detectors.py) against hadolint.
+
+For each Dockerfile of the test corpus and of the cases below, or of the given paths, it compares the smells of the
+rules with a detector found by hadolint with the ones found by the detectors, and prints the differences.
+The exit status is 1 if any difference is found.
+
+Usage: python test/check_detectors.py [path ...]
+"""
+from __future__ import annotations
+
+import glob
+import json
+import os
+import subprocess
+import sys
+
+import helpers  # noqa: F401
+
+import dockerfile as dockerfile_parser
+
+from logic.detectors import DETECTORS, detect
+from logic.dockerfile_obj import INVALID_CODES
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# cases missing from the examples of the corpus
+CASES = {
+    'DL3042 stage built from a stage without pip cache': (
+        'FROM python:3.11 AS base\n'
+        'ENV PIP_NO_CACHE_DIR=1\n'
+        'FROM base AS build\n'
+        'RUN pip install flask\n'
+        'FROM build\n'
+        'RUN python -m pip install gunicorn\n'
+        'FROM python:3.11\n'
+        'RUN pip install requests\n'
+    ),
+}
+
+
+def corpus_files(paths: list) -> list:
+    files = list()
+    for path in paths or [THIS_DIR]:
+        if os.path.isdir(path):
+            files.extend(sorted(f for f in glob.glob(os.path.join(path, '**', '*'), recursive=True)
+                                if os.path.isfile(f) and '__pycache__' not in f
+                                and not f.endswith(('.py', '.rb', '.html', '.diff', '.json'))
+                                and not os.path.basename(f).startswith('.')))
+        else:
+            files.append(path)
+    return files
+
+
+def hadolint_smells(content: str) -> set:
+    output = subprocess.run(['hadolint', '-f', 'json', '-'], input=content.encode('utf-8'), stdout=subprocess.PIPE)
+    result = json.loads(output.stdout.decode('utf-8'))
+    if any(s['code'] in INVALID_CODES for s in result):
+        raise ValueError('hadolint cannot parse it')
+    return {(s['line'], s['code']) for s in result if s['code'] in DETECTORS}
+
+
+def detected_smells(content: str) -> set:
+    parsed_lines = {cmd.start_line: cmd for cmd in dockerfile_parser.parse_string(content)}
+    return {(s.line, s.code) for s in detect(parsed_lines, DETECTORS.keys())}
+
+
+def dockerfiles(paths: list):
+    """
+    :return: (name, content) of each Dockerfile to check
+    """
+    for path in corpus_files(paths):
+        with open(path, encoding='utf8') as file:
+            yield path, file.read()
+    if not paths:
+        yield from CASES.items()
+
+
+def main(paths: list) -> int:
+    checked = 0
+    differences = 0
+    for path, content in dockerfiles(paths):
+        try:
+            expected = hadolint_smells(content)
+            found = detected_smells(content)
+        except Exception as e:
+            print(f'SKIP\t{path}\t{e}')
+            continue
+
+        checked += 1
+        for line, code in sorted(expected - found):
+            print(f'MISSED\t{path}:{line}\t{code}')
+        for line, code in sorted(found - expected):
+            print(f'EXTRA\t{path}:{line}\t{code}')
+        differences += len(expected ^ found)
+
+    print(f'{checked} Dockerfiles checked, {differences} differences')
+    return 1 if differences else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
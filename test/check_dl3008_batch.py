@@ -0,0 +1,112 @@
+"""
+Check the batched DL3008 fix: the versions of all the packages of an install instruction are looked up together and
+validated with shared image builds. The lookups and the builds are simulated, and the fixed Dockerfile is compared
+with the one of the former per-package fix (one lookup, then one build per pin attempt, for each package).
+
+Usage: python3 test/check_dl3008_batch.py [n_packages]
+"""
+import datetime
+import sys
+import threading
+import time
+
+import helpers  # noqa: F401
+
+import smell_solvers.rules.DL3008 as dl3008
+from logic.dockerfile_obj import Dockerfile
+
+LOOKUP_LATENCY = 0.05
+
+
+class Simulation:
+    """Package versions and image builds: some packages accept only a MINOR pin, some cannot be pinned"""
+
+    def __init__(self) -> None:
+        self.lookups = 0
+        self.builds = 0
+        self._lock = threading.Lock()
+
+    def version(self, distro: str, serie: str, package: str, date: datetime.datetime) -> str:
+        time.sleep(LOOKUP_LATENCY)
+        with self._lock:
+            self.lookups += 1
+        number = int(package[3:])
+        return None if number % 13 == 5 else f'{number}.{number % 4}.{number % 9}-1ubuntu{number % 3}'
+
+    def build(self, image: str, packages: tuple):
+        """Install the packages with a single build, reporting the ones not found as apt-get does"""
+        with self._lock:
+            self.builds += 1
+        unavailable = set()
+        for pinned in packages:
+            name, version = pinned.split('=')
+            number = int(name[3:])
+            if number % 11 == 3 or number % 7 == 1 and version.count('.') > 1:
+                unavailable.add(pinned)
+            elif number == 2 and version.count('.') > 1 and len(packages) > 1:
+                # conflicts with the other packages: the build fails without naming it
+                return None
+        return frozenset(unavailable)
+
+
+def former_fix(lines, packages, simulation: Simulation, date):
+    """The per-package fix replaced by the batched one"""
+    format_version = dl3008.DL3008()._DL3008__format_version
+    for position, package in packages:
+        lines[position] = lines[position].rstrip() + '\n'
+        pinned = package
+        version = simulation.version('ubuntu', 'focal', package, date)
+        if version:
+            rnum = 2
+            while rnum >= 0:
+                version = format_version(version, rnum)
+                if not version:
+                    pinned = package
+                    break
+                pinned = package + '=' + version
+                if simulation.build('ubuntu:20.04', (pinned,)):
+                    rnum -= 1
+                else:
+                    break
+        lines[position] = lines[position].replace(package, pinned, 1)
+    return lines
+
+
+def main() -> int:
+    n_packages = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    names = [f'pkg{i}' for i in range(n_packages)]
+    rows = [' '.join(names[i:i + 6]) for i in range(0, n_packages, 6)]
+    content = 'FROM ubuntu:20.04\nRUN apt-get update && apt-get install -y --no-install-recommends \\\n    ' + \
+              ' \\\n    '.join(rows) + ' \\\n    && rm -rf /var/lib/apt/lists/*\n'
+    date = datetime.datetime(2023, 4, 12)
+
+    dockerfile = Dockerfile('Dockerfile', date, content, [])
+    smell_pos = next(pos for pos, smells in dockerfile.smells_dict.items() if any(s.code == 'DL3008' for s in smells))
+    strategy = dl3008.DL3008()
+
+    former = Simulation()
+    packages = strategy._DL3008__collect_packages(list(dockerfile.lines), smell_pos)
+    start = time.perf_counter()
+    expected = former_fix(list(dockerfile.lines), packages, former, date)
+    former_time = time.perf_counter() - start
+
+    batched = Simulation()
+    dl3008.get_distro_info = lambda image_info: 'ubuntu:focal'
+    dl3008.pkgs_repo_available = lambda distro, serie: True
+    dl3008.get_package_binary_version = batched.version
+    dl3008.find_unavailable_packages = batched.build
+    start = time.perf_counter()
+    strategy.fix(dockerfile, smell_pos)
+    batched_time = time.perf_counter() - start
+
+    same = list(dockerfile.lines) == expected
+    print(f'{"OK" if same else "FAIL"}\t{n_packages} packages: same fix as the per-package one')
+    print(f'\tper-package: {former.lookups} lookups, {former.builds} builds, {former_time:.2f}s')
+    print(f'\tbatched:     {batched.lookups} lookups, {batched.builds} builds, {batched_time:.2f}s')
+    if not same:
+        sys.stdout.writelines(dockerfile.lines)
+    return 0 if same else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
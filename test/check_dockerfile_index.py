@@ -0,0 +1,142 @@
+"""
+Check of the updates of the parsed lines and of the index of a Dockerfile (logic/dockerfile_obj.py and
+logic/dockerfile_index.py) by the edits of the fixes.
+
+After each edit recorded by the fixes of the text rules on the Dockerfiles of the test corpus, it compares the parsed
+lines and the index updated by the edit with the ones built from the edited content.
+It also counts the parses of the whole content and the index builds of a fix run on Dockerfiles with a growing number
+of "RUN cd ... && ..." smells (DL3003): the edits must not parse or index the Dockerfile again.
+
+Usage: python test/check_dockerfile_index.py [path ...]
+"""
+from __future__ import annotations
+
+import datetime
+import glob
+import logging
+import os
+import sys
+
+import helpers  # noqa: F401
+
+import dockerfile as dockerfile_parser
+
+import logic.dockerfile_index as dockerfile_index
+from logic.dockerfile_index import TOOLS, DockerfileIndex
+from logic.dockerfile_obj import Dockerfile, InvalidDockerfileError
+from logic.fix_engine import FixEngine
+from smell_solvers.registry import get_registry
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TEXT_RULES = ['DL3003', 'DL3009', 'DL3015', 'DL3020', 'DL3025', 'DL3048', 'DL3059', 'DL4000']
+DATE = datetime.datetime(2023, 1, 1)
+
+
+def corpus_files(paths: list) -> list:
+    if paths:
+        return paths
+    return sorted(f for rule in TEXT_RULES for f in glob.glob(os.path.join(THIS_DIR, rule, 'Example*'))
+                  if not f.endswith(('-fixed', '.html', '.diff', '.json')))
+
+
+def index_view(index: DockerfileIndex) -> tuple:
+    types = sorted({command.cmd.upper() for command in index.parsed_lines.values()})
+    return (index.stages, {cmd: index.instructions(cmd) for cmd in types},
+            {tool: index.runs_calling(tool) for tool in TOOLS})
+
+
+class EditChecker:
+    """Compares the parsed lines and the index with the ones of the content after each recorded edit"""
+
+    def __init__(self) -> None:
+        self.edits = 0
+        self.differences = list()
+        self._remap_smells = Dockerfile.remap_smells
+
+    def __enter__(self) -> EditChecker:
+        checker = self
+
+        def remap_smells(dockerfile: Dockerfile) -> None:
+            checker._remap_smells(dockerfile)
+            checker.check(dockerfile)
+
+        Dockerfile.remap_smells = remap_smells
+        return self
+
+    def __exit__(self, *args) -> None:
+        Dockerfile.remap_smells = self._remap_smells
+
+    def check(self, dockerfile: Dockerfile) -> None:
+        self.edits += 1
+        expected = {cmd.start_line: cmd for cmd in dockerfile_parser.parse_string(''.join(dockerfile.lines))}
+        if dockerfile.parsed_lines != expected:
+            self.differences.append(f'{dockerfile.filepath}: parsed lines after edit {self.edits}')
+        elif index_view(dockerfile.index) != index_view(DockerfileIndex(expected)):
+            self.differences.append(f'{dockerfile.filepath}: index after edit {self.edits}')
+
+
+def check_corpus(paths: list) -> int:
+    checked = 0
+    with EditChecker() as checker:
+        for path in corpus_files(paths):
+            for rules in [[rule] for rule in TEXT_RULES] + [TEXT_RULES]:
+                ignored = [code for code in get_registry().codes() if code not in rules]
+                try:
+                    dockerfile = Dockerfile(path, DATE, ignored_rules=ignored)
+                    # the strategies read the index from the first edit on
+                    dockerfile.index
+                    FixEngine(dockerfile, ignored).run()
+                except InvalidDockerfileError:
+                    continue
+                checked += 1
+
+    for difference in checker.differences:
+        print(f'FAIL\t{difference}')
+    print(f'{"OK" if not checker.differences else "FAIL"}\t{checked} fix runs, {checker.edits} edits, '
+          f'{len(checker.differences)} differences')
+    return len(checker.differences)
+
+
+def check_growth() -> int:
+    counts = {'parses': 0, 'builds': 0}
+    parse_string = dockerfile_parser.parse_string
+    init = DockerfileIndex.__init__
+
+    def counting_parse(content: str):
+        counts['parses'] += content.startswith('FROM')
+        return parse_string(content)
+
+    def counting_init(index: DockerfileIndex, parsed_lines) -> None:
+        counts['builds'] += 1
+        init(index, parsed_lines)
+
+    dockerfile_parser.parse_string = counting_parse
+    dockerfile_index.DockerfileIndex.__init__ = counting_init
+    failures = 0
+    try:
+        for n in [10, 40]:
+            counts.update(parses=0, builds=0)
+            content = 'FROM ubuntu:20.04\n' + ''.join(f'RUN cd /src/{i} && make\n' for i in range(n))
+            dockerfile = Dockerfile('-', DATE, content, [code for code in get_registry().codes() if code != 'DL3003'])
+            fixed = FixEngine(dockerfile, dockerfile.ignored_rules).run()
+            ok = counts['parses'] == 1 and counts['builds'] == 1 and fixed == n
+            failures += not ok
+            print(f'{"OK" if ok else "FAIL"}\t{n} DL3003 smells: {fixed} fixed, {counts["parses"]} parses of the '
+                  f'Dockerfile, {counts["builds"]} index builds')
+    finally:
+        dockerfile_parser.parse_string = parse_string
+        dockerfile_index.DockerfileIndex.__init__ = init
+    return failures
+
+
+def main(paths: list) -> int:
+    logging.disable(logging.INFO)
+    failures = check_corpus(paths)
+    if not paths:
+        failures += check_growth()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
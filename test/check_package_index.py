@@ -0,0 +1,181 @@
+"""
+Check the package index (utils.package_index): the package versions looked up in an index built from dated copies of
+the Ubuntu archive (Packages files) against the Launchpad lookup it replaces, the lookup time, and the lookups of
+worker processes sharing the index.
+
+The publications of a synthetic archive are served as Launchpad responses (status Published) and written as the
+Packages files of a snapshot directory per publication day.
+
+Usage: python3 test/check_package_index.py [n_packages]
+"""
+import datetime
+import gzip
+import lzma
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from helpers import FakeResponse, check, query_params
+
+import utils.launchpad_api as launchpad_api
+from utils.package_index import build_package_index, configure_package_index, get_package_index
+
+LAUNCHPAD = 'https://api.launchpad.net/1.0/'
+START = datetime.datetime(2020, 4, 23)
+SERIES = ['focal', 'jammy']
+COMPONENTS = ['main', 'universe']
+POCKETS = ['Release', 'Updates', 'Security', 'Proposed', 'Backports']
+SUFFIXES = {'Release': '', 'Updates': '-updates', 'Security': '-security', 'Proposed': '-proposed',
+            'Backports': '-backports'}
+
+
+def archive_history(n_packages: int):
+    """
+    Synthetic publications (day, series, pocket, package, version): a version in the release pocket, then updates in
+    the other pockets, each superseding the previous version of its pocket
+    """
+    rng = random.Random(3)
+    history = list()
+    for i in range(n_packages):
+        package = f'lib{i}-dev' if i % 5 == 0 else f'pkg{i}'
+        for serie in SERIES:
+            if serie == 'jammy' and i % 4 == 3:
+                continue
+            offset = 0 if serie == 'focal' else 730
+            history.append((offset, serie, 'Release', package, f'{i % 9}.{i % 4}-1'))
+            for update in range(rng.randint(0, 6)):
+                day = offset + 7 * rng.randint(1, 100)
+                pocket = POCKETS[1 + rng.randint(0, 3)]
+                history.append((day, serie, pocket, package, f'{i % 9}.{i % 4}-1ubuntu{day}.{update}'))
+    return sorted(history)
+
+
+def published_at(history, day: int):
+    """:return: the versions of each suite on the given day, the last published of each pocket"""
+    current = dict()
+    for published, serie, pocket, package, version in history:
+        if published <= day:
+            current[(serie, pocket, package)] = (published, version)
+    return current
+
+
+def write_archive(root: str, history, day: int) -> None:
+    """Write the dists/<suite> of the archive on the given day, as a dated snapshot directory"""
+    date = START + datetime.timedelta(days=day)
+    suites = dict()
+    for (serie, pocket, package), (_, version) in published_at(history, day).items():
+        suites.setdefault(serie + SUFFIXES[pocket], []).append((package, version))
+    for serie in SERIES:
+        for suffix in SUFFIXES.values():
+            suites.setdefault(serie + suffix, [])
+
+    for suite, packages in suites.items():
+        dists = os.path.join(root, date.strftime('%Y%m%dT%H%M%SZ'), 'ubuntu', 'dists', suite)
+        for c, component in enumerate(COMPONENTS):
+            directory = os.path.join(dists, component, 'binary-amd64')
+            os.makedirs(directory)
+            stanzas = ''.join(f'Package: {package}\nArchitecture: {"all" if package.startswith("lib") else "amd64"}\n'
+                              f'Version: {version}\nPriority: optional\nSection: misc\n'
+                              f'Description: package {package}\n multi-line description\n\n'
+                              for package, version in sorted(packages) if sum(map(ord, package)) % 2 == c)
+            opener = gzip.open if c == 0 else lzma.open
+            with opener(os.path.join(directory, 'Packages' + ('.gz' if c == 0 else '.xz')), 'wt') as file:
+                file.write(stanzas)
+        with open(os.path.join(dists, 'Release'), 'w') as file:
+            file.write(f'Origin: Ubuntu\nLabel: Ubuntu\nSuite: {suite}\nCodename: {suite.split("-")[0]}\n'
+                       f'Date: {date.strftime("%a, %d %b %Y 06:12:03 UTC")}\nArchitectures: amd64\n'
+                       f'Components: {" ".join(COMPONENTS)}\nMD5Sum:\n 0123 456 main/binary-amd64/Packages.gz\n')
+
+
+def fake_launchpad(history, day: int):
+    """Launchpad answering with the publications still published on the given day"""
+    current = published_at(history, day)
+
+    def request_data(url: str):
+        query = query_params(url)
+        entries = [{'distro_arch_series_link': f'{LAUNCHPAD}ubuntu/{serie}/amd64',
+                    'date_published': (START + datetime.timedelta(days=published)).strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+                    'pocket': pocket,
+                    'binary_package_version': version}
+                   for (serie, pocket, package), (published, version) in current.items()
+                   if package == query['binary_name']]
+        entries.sort(key=lambda entry: entry['date_published'], reverse=True)
+        start, size = int(query['ws.start']), int(query['ws.size'])
+        return FakeResponse({'total_size': len(entries), 'entries': entries[start:start + size]})
+    return request_data
+
+
+def lookups(packages, dates):
+    return [launchpad_api.get_package_binary_version('ubuntu', serie, package, date)
+            for serie in SERIES for package in packages for date in dates]
+
+
+def worker_lookups(index_path: str, packages, dates):
+    configure_package_index(index_path)
+    launchpad_api.request_data = None
+    return lookups(packages, dates)
+
+
+def main() -> int:
+    n_packages = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    tmp_dir = tempfile.mkdtemp(prefix='dockleaner-packages-')
+    history = archive_history(n_packages)
+    last_day = max(day for day, *_ in history)
+    # a snapshot of each publication day dates each version exactly
+    start = time.perf_counter()
+    for day in sorted({day for day, *_ in history}):
+        write_archive(os.path.join(tmp_dir, 'snapshots'), history, day)
+    print(f'\t{len(history)} publications, archive written in {time.perf_counter() - start:.2f}s')
+
+    packages = sorted({package for _, _, _, package, _ in history}) + ['not-in-archive']
+    dates = [START + datetime.timedelta(days=d) for d in range(-10, last_day + 30, 23)]
+    failures = 0
+
+    launchpad_api.request_data = fake_launchpad(history, last_day)
+    start = time.perf_counter()
+    online = lookups(packages, dates)
+    online_time = time.perf_counter() - start
+
+    index_path = os.path.join(tmp_dir, 'packages.dks')
+    start = time.perf_counter()
+    build_package_index([os.path.join(tmp_dir, 'snapshots')], index_path)
+    print(f'\tindex built in {time.perf_counter() - start:.2f}s')
+    launchpad_api.request_data = None
+    launchpad_api.get_package_binary_version.cache_clear()
+    configure_package_index(index_path)
+
+    start = time.perf_counter()
+    indexed = lookups(packages, dates)
+    index_time = time.perf_counter() - start
+
+    differences = [(i, a, b) for i, (a, b) in enumerate(zip(online, indexed)) if a != b]
+    for i, a, b in differences[:10]:
+        print(f'FAIL\tlookup {i}: Launchpad {a!r}, index {b!r}')
+    failures += check(f'{len(online)} lookups, {len(differences)} differences (Launchpad {online_time:.3f}s, '
+                      f'index {index_time:.3f}s, index file {os.path.getsize(index_path)} bytes)', not differences)
+
+    index = get_package_index()
+    keys = [(serie, package) for serie in SERIES for package in packages]
+    start = time.perf_counter()
+    for _ in range(10):
+        for serie, package in keys:
+            index.publications('ubuntu', serie, package)
+    print(f'\t{(time.perf_counter() - start) / (10 * len(keys)) * 1e6:.1f}us per uncached index lookup')
+
+    failures += check('the index covers the indexed series only',
+                      index.covers('ubuntu', 'focal') and not index.covers('ubuntu', 'bionic'))
+
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(worker_lookups, [index_path] * 4, [packages[i::4] for i in range(4)], [dates] * 4))
+    expected = [lookups(packages[i::4], dates) for i in range(4)]
+    failures += check('4 worker processes read the shared index', results == expected)
+
+    configure_package_index(None)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Check the registry lookup of the 'latest' equivalent tag (utils.registry_api) against a local registry stand-in.
+
+The stand-in serves the OCI distribution endpoints used by dockleaner: a bearer token challenge, the paginated tag
+list and the manifest HEAD requests with their Docker-Content-Digest header.
+
+Usage: python3 test/check_registry_api.py
+"""
+import hashlib
+import json
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import helpers  # noqa: F401
+
+import utils.http_client as http_client
+import utils.rate_limiter as rate_limiter
+from utils.dockerhub_api import configure_latest_tag_source, get_latest_tag
+from utils.registry_api import find_latest_tag, version_candidates
+
+TOKEN = 'secret-token'
+
+
+def digest(name: str) -> str:
+    return 'sha256:' + hashlib.sha256(name.encode('utf-8')).hexdigest()
+
+
+# repository -> tag -> digest
+REPOSITORIES = {
+    'library/node': dict(
+        [(f'{major}.{minor}.{patch}', digest(f'node-{major}.{minor}.{patch}'))
+         for major in range(14, 22) for minor in range(0, 10) for patch in range(0, 5)] +
+        [('latest', digest('node-21.9.4')), ('21', digest('node-21.9.4')), ('21.9', digest('node-21.9.4')),
+         ('current', digest('node-21.9.4')), ('lts', digest('node-20.9.4')), ('20', digest('node-20.9.4'))]),
+    'library/busybox': {'latest': digest('busybox-musl'), 'musl': digest('busybox-musl'), '1.36': digest('old')},
+}
+
+
+class RegistryStandIn(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    heads = 0
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/token':
+            return self.__send(200, json.dumps({'token': TOKEN, 'expires_in': 300}).encode())
+        if not self.__authorized():
+            return
+        repository, _, tail = url.path[len('/v2/'):].rpartition('/tags/')
+        if tail != 'list' or repository not in REPOSITORIES:
+            return self.__send(404)
+
+        tags = sorted(REPOSITORIES[repository])
+        size = int(query.get('n', ['100'])[0])
+        start = tags.index(query['last'][0]) + 1 if 'last' in query else 0
+        page = tags[start:start + size]
+        headers = dict()
+        if start + size < len(tags):
+            headers['Link'] = f'</v2/{repository}/tags/list?n={size}&last={page[-1]}>; rel="next"'
+        self.__send(200, json.dumps({'name': repository, 'tags': page}).encode(), headers)
+
+    def do_HEAD(self):
+        if not self.__authorized():
+            return
+        repository, _, reference = urlsplit(self.path).path[len('/v2/'):].rpartition('/manifests/')
+        RegistryStandIn.heads += 1
+        tag_digest = REPOSITORIES.get(repository, {}).get(reference)
+        if tag_digest is None:
+            return self.__send(404)
+        self.__send(200, headers={'Docker-Content-Digest': tag_digest})
+
+    def __authorized(self) -> bool:
+        if self.headers.get('Authorization') == f'Bearer {TOKEN}':
+            return True
+        realm = f'http://127.0.0.1:{self.server.server_port}/token'
+        self.__send(401, headers={'WWW-Authenticate': f'Bearer realm="{realm}",service="stand-in"'})
+        return False
+
+    def __send(self, status: int, body: bytes = b'', headers: dict = None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def main() -> int:
+    # the stand-in does not touch the caches of the real hosts
+    rate_limiter.configure_rate_limits(tempfile.mkdtemp(prefix='dockleaner-ratelimit-'))
+    http_client.configure_http_client(tempfile.mkdtemp(prefix='dockleaner-http-'))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RegistryStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    failures = 0
+    expected = [('library/node', '21.9.4'), ('library/busybox', None), ('library/missing', None)]
+    for repository, tag in expected:
+        RegistryStandIn.heads = 0
+        found = find_latest_tag(repository, base_url)
+        status = 'OK' if found == tag else 'FAIL'
+        failures += found != tag
+        print(f'{status}\t{repository}: {found} (expected {tag}), {RegistryStandIn.heads} manifest HEAD requests')
+
+    # through the option used by DL3006 and DL3007
+    configure_latest_tag_source('registry', base_url)
+    found = get_latest_tag('node')
+    failures += found != '21.9.4'
+    print(f'{"OK" if found == "21.9.4" else "FAIL"}\tget_latest_tag(node) with the registry source: {found}')
+
+    candidates = version_candidates(['3.1', 'latest', '3.10', '3', '3.9-slim', '10'])
+    if candidates != ['10', '3.10', '3.1', '3']:
+        failures += 1
+        print(f'FAIL\tversion_candidates order: {candidates}')
+
+    server.shutdown()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Check the Launchpad series table (utils.series_table): the indexed version/name lookup against the scan of the series
+collection it replaces, and the number of fetches of the collection across lookups, processes (the on-disk table),
+expiry and refresh.
+
+Usage: python3 test/check_series_table.py
+"""
+import sys
+import tempfile
+import time
+
+from helpers import check
+
+import utils.launchpad_api as launchpad_api
+import utils.series_table as series_table
+from utils.series_table import SeriesTable
+
+UBUNTU = [
+    ('plucky', '25.04'), ('oracular', '24.10'), ('noble', '24.04'), ('mantic', '23.10'), ('lunar', '23.04'),
+    ('kinetic', '22.10'), ('jammy', '22.04'), ('impish', '21.10'), ('hirsute', '21.04'), ('groovy', '20.10'),
+    ('focal', '20.04'), ('eoan', '19.10'), ('disco', '19.04'), ('cosmic', '18.10'), ('bionic', '18.04'),
+    ('artful', '17.10'), ('zesty', '17.04'), ('yakkety', '16.10'), ('xenial', '16.04'), ('wily', '15.10'),
+    ('vivid', '15.04'), ('utopic', '14.10'), ('trusty', '14.04'), ('saucy', '13.10'), ('raring', '13.04'),
+    ('quantal', '12.10'), ('precise', '12.04'), ('oneiric', '11.10'), ('natty', '11.04'), ('maverick', '10.10'),
+    ('lucid', '10.04'), ('karmic', '9.10'), ('jaunty', '9.04'), ('intrepid', '8.10'), ('hardy', '8.04'),
+    ('gutsy', '7.10'), ('feisty', '7.04'), ('edgy', '6.10'), ('dapper', '6.06'), ('breezy', '5.10'),
+    ('hoary', '5.04'), ('warty', '4.10'),
+]
+SERIES = [{'name': name, 'version': version, 'active': name in ('plucky', 'noble', 'jammy', 'focal')}
+          for name, version in UBUNTU]
+
+fetches = 0
+
+
+def fetch_series(distro: str):
+    global fetches
+    fetches += 1
+    return SERIES
+
+
+def scan(tag: str):
+    """The lookup replaced by the index"""
+    for serie_json in SERIES:
+        if tag in serie_json['version'] or serie_json['version'] in tag or tag in serie_json['name']:
+            return serie_json['name']
+    return None
+
+
+def main() -> int:
+    series_table.configure_series_table(tempfile.mkdtemp(prefix='dockleaner-series-'))
+    launchpad_api.fetch_distro_series = fetch_series
+    failures = 0
+
+    tags = [tag for name, version in UBUNTU for tag in (name, version, version + '.1', version + '.6', name[:3])]
+    tags += ['4.10', '10', '2', '04', 'rolling', 'devel', 'latest', '', 'f', '22.04.5', '8.04.4']
+    table = SeriesTable('ubuntu', SERIES)
+    mismatches = [tag for tag in tags if table.find(tag) != scan(tag)]
+    failures += check(f'indexed lookup of {len(tags)} tags matches the scan of the series'
+                      + (f', except {mismatches}' if mismatches else ''), not mismatches)
+
+    start = time.perf_counter()
+    for _ in range(200):
+        for tag in tags:
+            scan(tag)
+    scan_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(200):
+        for tag in tags:
+            table.find(tag)
+    index_time = time.perf_counter() - start
+    print(f'\t{200 * len(tags)} lookups: scan {scan_time * 1000:.1f}ms, index {index_time * 1000:.1f}ms')
+
+    # one fetch for all the lookups of the process
+    for _ in range(100):
+        launchpad_api.get_distro_serie('ubuntu', '20.04')
+        launchpad_api.pkgs_repo_available('ubuntu', 'focal')
+    failures += check(f'200 lookups in a process: {fetches} fetch', fetches == 1)
+    failures += check('pkgs_repo_available reads the active flag',
+                      launchpad_api.pkgs_repo_available('ubuntu', 'focal') and
+                      not launchpad_api.pkgs_repo_available('ubuntu', 'xenial'))
+
+    # a new process reads the table from the disk
+    series_table._tables.clear()
+    launchpad_api.get_distro_serie('ubuntu', 'jammy')
+    failures += check(f'lookup in a new process: {fetches - 1} fetch', fetches == 1)
+
+    # expired: fetched again
+    series_table._tables['ubuntu'].refreshed -= series_table.SERIES_TABLE_TTL + 1
+    launchpad_api.get_distro_serie('ubuntu', 'jammy')
+    failures += check(f'lookup after the expiry: {fetches - 1} fetch', fetches == 2)
+
+    # expired and Launchpad unreachable: the stale table is used
+    def unreachable(distro: str):
+        raise launchpad_api.LaunchpadAPIException()
+    launchpad_api.fetch_distro_series = unreachable
+    series_table._tables['ubuntu'].refreshed -= series_table.SERIES_TABLE_TTL + 1
+    failures += check('stale table used when Launchpad is unreachable',
+                      launchpad_api.get_distro_serie('ubuntu', '22.04') == 'jammy')
+    launchpad_api.fetch_distro_series = fetch_series
+
+    # a series released after the fetch: the table is fetched again, at most once per SERIES_TABLE_MISS_TTL
+    SERIES.insert(0, {'name': 'questing', 'version': '25.10', 'active': True})
+    series_table.refresh_series_table('ubuntu', lambda distro: SERIES[1:])
+    before = fetches
+    failures += check('recent unknown series: not fetched again',
+                      launchpad_api.get_distro_serie('ubuntu', 'questing') is None and fetches == before)
+    series_table._tables['ubuntu'].refreshed -= series_table.SERIES_TABLE_MISS_TTL + 1
+    failures += check('older unknown series: fetched again and found',
+                      launchpad_api.get_distro_serie('ubuntu', 'questing') == 'questing' and fetches == before + 1)
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""
+Check that the lookups of DL3006, DL3007 and DL3008 return the same results offline, from a snapshot, as online.
+
+The online lookups are served by synthetic DockerHub tag pages and Launchpad responses, then the same data is
+exported to a snapshot, imported, and the lookups run again with the network disabled.
+
+Usage: python3 test/check_snapshot.py
+"""
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+from helpers import FakeResponse, check, query_params
+
+import utils.dockerhub_api as dockerhub_api
+import utils.launchpad_api as launchpad_api
+import utils.series_table as series_table
+import utils.tag_index as tag_index
+from dockleaner_data import export_snapshot, import_snapshot
+from utils.docker_utils import get_distro_info
+from utils.snapshot import SnapshotError, configure_snapshot
+
+LAUNCHPAD = 'https://api.launchpad.net/1.0/'
+START = datetime.datetime(2016, 1, 1)
+
+
+def hub_tags(repository: str):
+    """Synthetic tag history: one version tag every 5 days, latest and the major tags follow the last version"""
+    tags = list()
+    for i in range(0, 360):
+        major, minor = 10 + i // 30, i % 30
+        pushed = START + datetime.timedelta(days=5 * i)
+        tags.append({'name': f'{major}.{minor}', 'pushed': pushed, 'digest': f'sha256:{repository}-{i}'})
+    last = tags[-1]
+    for name in ['latest', str(10 + 359 // 30)]:
+        tags.append({'name': name, 'pushed': last['pushed'] + datetime.timedelta(hours=1), 'digest': last['digest']})
+    return tags
+
+
+REPOSITORIES = {'library/ubuntu': hub_tags('ubuntu'), 'library/node': hub_tags('node')}
+
+
+def fake_page_fetcher(image_path: str):
+    def fetch_page(page: int, page_size: int) -> dict:
+        if image_path not in REPOSITORIES:
+            raise dockerhub_api.ImageNotFoundException()
+        tags = sorted(REPOSITORIES[image_path], key=lambda tag: tag['pushed'], reverse=True)
+        results = [{'name': tag['name'],
+                    'last_updated': tag['pushed'].strftime('%Y-%m-%dT%H:%M:%S.000000Z'),
+                    'tag_last_pushed': tag['pushed'].strftime('%Y-%m-%dT%H:%M:%S.000000Z'),
+                    'images': [{'architecture': 'amd64', 'os': 'linux', 'digest': tag['digest']}]}
+                   for tag in tags[(page - 1) * page_size:page * page_size]]
+        return {'count': len(tags), 'results': results, 'next': page * page_size < len(tags) or None}
+    return fetch_page
+
+
+SERIES = [{'name': 'jammy', 'version': '22.04', 'active': True},
+          {'name': 'focal', 'version': '20.04', 'active': True},
+          {'name': 'xenial', 'version': '16.04', 'active': False}]
+
+
+def publications(package: str):
+    """Synthetic publications, from the last published, in several series and pockets"""
+    entries = list()
+    for i in range(0, 240):
+        serie = SERIES[i % 3]['name']
+        pocket = ['Release', 'Updates', 'Security', 'Proposed', 'Backports'][i % 5]
+        published = START + datetime.timedelta(days=9 * (240 - i))
+        entries.append({'distro_arch_series_link': f'{LAUNCHPAD}ubuntu/{serie}/amd64',
+                        'date_published': published.strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+                        'pocket': pocket,
+                        'binary_package_version': f'{len(package)}.{240 - i}-0ubuntu{i % 7}'})
+    return entries
+
+
+def fake_request_data(url: str):
+    if url == f'{LAUNCHPAD}ubuntu/series':
+        return FakeResponse({'entries': SERIES})
+    if 'ws.op=getPublishedBinaries' in url:
+        query = query_params(url)
+        entries = publications(query['binary_name'])
+        start, size = int(query['ws.start']), int(query['ws.size'])
+        return FakeResponse({'total_size': len(entries), 'entries': entries[start:start + size]})
+    raise AssertionError(f'Unexpected request: {url}')
+
+
+def offline_request(*args):
+    raise AssertionError(f'Network request while offline: {args}')
+
+
+def clear_caches() -> None:
+    for func in [dockerhub_api.get_image_version, dockerhub_api.get_latest_tag, dockerhub_api._snapshot_tag_index,
+                 launchpad_api._snapshot_series_table, launchpad_api.get_package_binary_version, get_distro_info]:
+        func.cache_clear()
+    tag_index._indexes.clear()
+    series_table._tables.clear()
+
+
+def lookups():
+    """Run the lookups of the fixes, and return their results in order"""
+    results = list()
+    dates = [START + datetime.timedelta(days=d) for d in range(-30, 5 * 365 + 60, 17)]
+    for image in ['ubuntu', 'node', 'missing']:
+        for date in dates:
+            try:
+                results.append(dockerhub_api.get_image_version(image, date))
+            except dockerhub_api.ImageNotFoundException:
+                results.append('not found')
+        try:
+            results.append(dockerhub_api.get_latest_tag(image))
+        except dockerhub_api.ImageNotFoundException:
+            results.append('not found')
+
+    for image_info in ['ubuntu:20.04', 'ubuntu:jammy', 'ubuntu:16.04', 'ubuntu:latest']:
+        results.append(get_distro_info(image_info))
+    for serie in ['jammy', 'focal', 'xenial']:
+        results.append(launchpad_api.pkgs_repo_available('ubuntu', serie))
+        for package in ['curl', 'nginx', 'g++']:
+            for date in dates[::4]:
+                results.append(launchpad_api.get_package_binary_version('ubuntu', serie, package, date))
+    return results
+
+
+def main() -> int:
+    tmp_dir = tempfile.mkdtemp(prefix='dockleaner-snapshot-')
+    tag_index.configure_tag_index(os.path.join(tmp_dir, 'tags'))
+    series_table.configure_series_table(os.path.join(tmp_dir, 'series'))
+    dockerhub_api.tags_page_fetcher = fake_page_fetcher
+    launchpad_api.request_data = fake_request_data
+
+    failures = 0
+    start = time.perf_counter()
+    online = lookups()
+    online_time = time.perf_counter() - start
+
+    exported = os.path.join(tmp_dir, 'export.dks')
+    export_snapshot(exported, ['node', 'missing'], ['ubuntu:jammy', 'ubuntu:focal', 'ubuntu:xenial'],
+                    ['curl', 'nginx', 'g++'])
+    installed = os.path.join(tmp_dir, 'installed', 'snapshot.dks')
+    import_snapshot(exported, installed)
+
+    # no request can be sent from now on
+    dockerhub_api.tags_page_fetcher = offline_request
+    launchpad_api.request_data = offline_request
+    clear_caches()
+    configure_snapshot(installed)
+
+    start = time.perf_counter()
+    offline = lookups()
+    offline_time = time.perf_counter() - start
+
+    differences = [(i, a, b) for i, (a, b) in enumerate(zip(online, offline)) if a != b]
+    for i, a, b in differences[:10]:
+        print(f'FAIL\tlookup {i}: online {a!r}, offline {b!r}')
+    failures += check(f'{len(online)} lookups, {len(differences)} differences (online {online_time:.3f}s, '
+                      f'offline {offline_time:.3f}s, snapshot {os.path.getsize(installed)} bytes)',
+                      not differences and len(online) == len(offline))
+
+    try:
+        launchpad_api.get_package_binary_version('ubuntu', 'focal', 'not-exported', START)
+        raised = False
+    except launchpad_api.LaunchpadAPIException:
+        raised = True
+    failures += check('a lookup missing from the snapshot raises LaunchpadAPIException', raised)
+
+    corrupted = os.path.join(tmp_dir, 'corrupted.dks')
+    with open(exported, 'rb') as file:
+        data = bytearray(file.read())
+    data[len(data) // 2] ^= 0xff
+    with open(corrupted, 'wb') as file:
+        file.write(data)
+    try:
+        import_snapshot(corrupted, installed)
+        rejected = False
+    except SnapshotError:
+        rejected = True
+    failures += check('a corrupted snapshot is rejected', rejected)
+
+    configure_snapshot(None)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""
+Helpers shared by the check and benchmark scripts of this directory.
+
+Importing it puts the root of the repository on the module path, so that the scripts can be run from anywhere with
+python test/<script>.py and import the dockleaner modules.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sys
+from urllib.parse import unquote
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+
+class FakeResponse:
+    """Stand-in of a successful requests.Response carrying the given JSON body"""
+
+    status_code = 200
+
+    def __init__(self, body) -> None:
+        self._body = body
+        self._text = None
+
+    @property
+    def text(self) -> str:
+        """The body as sent on the wire"""
+        if self._text is None:
+            self._text = json.dumps(self._body)
+        return self._text
+
+    def json(self):
+        return self._body
+
+
+def query_params(url: str) -> dict:
+    """
+    :return: the decoded parameters of the query string of the given URL
+    """
+    return {key: unquote(value) for key, value in (part.split('=', 1) for part in url.split('?', 1)[1].split('&'))}
+
+
+def check(description: str, ok: bool) -> int:
+    """
+    Print the outcome of a check
+    :return: the number of failures, 0 or 1
+    """
+    print(f'{"OK" if ok else "FAIL"}\t{description}')
+    return 0 if ok else 1
@@ -16,7 +16,7 @@ Dir.chdir(THIS_DIR) do
         `rm "#{fixed}"`
     end
     
-    Dir.glob("**/*-log.html").each do |log|
+    Dir.glob("**/*-log.{html,diff,json}").each do |log|
         `rm "#{log}"`
     end
 
@@ -1,7 +1,17 @@
-import backoff
-import requests
+import functools
+import os
+import threading
+import time
+
 import logging as logger
-logger.getLogger('backoff').addHandler(logger.StreamHandler())
+
+# directory of the on-disk caches, next to the dockleaner modules whatever the working directory or the importer
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache')
+CACHE_TTL = 60 * 60
+CACHE_MAXSIZE = 4096
+
+# backoff is imported on the first request, to keep the startup fast
+_get_with_retry = None
 
 
 def dequote(s):
@@ -16,14 +26,65 @@ def dequote(s):
     return s
 
 
-@backoff.on_exception(
-    backoff.expo,
-    requests.exceptions.RequestException,
-    max_tries=5,
-    giveup=lambda e: e.response is not None and e.response.status_code < 500
-)
 def request_data(url: str):
-    return requests.get(url)
+    global _get_with_retry
+    if _get_with_retry is None:
+        _get_with_retry = _build_get_with_retry()
+    return _get_with_retry(url)
+
+
+def _build_get_with_retry():
+    import backoff
+    import requests
+    from utils.http_client import get_http_client
+    logger.getLogger('backoff').addHandler(logger.StreamHandler())
+
+    # shared client, so that connections are kept alive between requests and unchanged responses are revalidated
+    client = get_http_client()
+
+    @backoff.on_exception(
+        backoff.expo,
+        requests.exceptions.RequestException,
+        max_tries=5,
+        giveup=lambda e: e.response is not None and e.response.status_code < 500
+    )
+    def get_with_retry(url: str):
+        return client.get(url)
+
+    return get_with_retry
+
+
+def ttl_cache(ttl: float = CACHE_TTL, maxsize: int = CACHE_MAXSIZE):
+    """
+    Memoize the results of the decorated function for ttl seconds.
+    The cache is shared by all the threads of the process. Raised exceptions are not cached.
+    :param ttl: seconds after which a cached result expires
+    :param maxsize: maximum number of cached results. The oldest ones are dropped first
+    """
+    def decorator(func):
+        cache = dict()
+        lock = threading.Lock()
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            now = time.monotonic()
+            with lock:
+                entry = cache.get(args)
+            if entry is not None and now - entry[0] < ttl:
+                return entry[1]
+
+            value = func(*args)
+            with lock:
+                cache.pop(args, None)
+                cache[args] = (now, value)
+                while len(cache) > maxsize:
+                    del cache[next(iter(cache))]
+            return value
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
 
 
 def parse_line_indent(line: str) -> str:
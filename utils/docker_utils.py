@@ -1,19 +1,61 @@
 from __future__ import annotations
 
+import re
+import threading
 from io import BytesIO
-import docker
-import dockerfile as dockerfile_parser
+from uuid import uuid4
 from utils.cache_handler import retrieve_distro, update_images_cache
+from utils.common import ttl_cache
 from utils.launchpad_api import get_distro_serie
-from typing import Dict
+from typing import Dict, FrozenSet, Optional, Tuple
 import logging
 logger = logging.getLogger(__name__.split('.')[0])
 logger.setLevel(logging.DEBUG)
 
-COMMANDS = [c.upper() for c in dockerfile_parser.all_cmds()]
 KNOWN_DISTROS = ["ubuntu"]
 
+# apt-get errors naming the packages it cannot install
+_APT_VERSION_NOT_FOUND = re.compile(r"Version '([^']+)' for '([^']+)' was not found")
+_APT_UNABLE_TO_LOCATE = re.compile(r"Unable to locate package (\S+)")
+# error of a RUN step of a build (classic builder)
+_STEP_FAILED = re.compile(r"returned a non-zero code")
+# apt-get errors of the package mirror, not of the packages
+_APT_NETWORK_ERROR = re.compile(r"Failed to fetch|Temporary failure resolving|Could not resolve|Could not connect|"
+                                r"Connection timed out|Connection failed")
 
+_commands = None
+_client = None
+_client_lock = threading.Lock()
+
+
+class BuildInfrastructureError(Exception):
+    """
+    Raised when a validation build fails for a reason other than the instructions it validates: Docker daemon, image
+    registry or package mirror unavailable. Unlike the results of the validations, it is not cached
+    """
+    pass
+
+
+def get_docker_client() -> docker.DockerClient:
+    """
+    Get the docker client shared by the whole process.
+    The client is created, and the Docker daemon checked, on first use.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            import docker
+            try:
+                client = docker.from_env()
+                client.info()
+            except Exception:
+                logger.error("Docker daemon is not available. Please install and start Docker before running the tool.")
+                raise
+            _client = client
+        return _client
+
+
+@ttl_cache()
 def get_distro_info(image_info: str) -> str:
     """
     Retrieve, if known, the distribution info from the given image
@@ -51,7 +93,7 @@ def get_image_distro(_image: str) -> str:
     :return: the distribution info in the format <distro_name>:<distro_version>
              i.e. get_distro_info(myimage:mytag) return 'ubuntu:14.04'
     """
-    client = docker.from_env()
+    client = get_docker_client()
 
     # Check images cache
     # todo: not working, temporary disabled
@@ -121,6 +163,42 @@ def get_package_version(container, package) -> str:
     return result
 
 
+def build_and_remove(client: docker.DockerClient, dockerfile_str: str) -> None:
+    """
+    Build the given Dockerfile under a tag of its own, then remove the image. The validation builds run concurrently
+    (prefetch, batch and server threads) do not replace or remove the image of each other
+    :raise docker.errors.BuildError: if the build fails
+    """
+    tag = f'dockleaner-fix-{uuid4().hex}'
+    client.images.build(fileobj=BytesIO(dockerfile_str.encode("utf-8")), tag=tag, rm=True, forcerm=True)
+    client.images.remove(image=tag, force=True)
+
+
+def get_build_log(e: Exception) -> str:
+    """
+    :return: the error and the output of a failed build
+    """
+    return str(e) + '\n' + ''.join(chunk.get('stream', '') + chunk.get('error', '')
+                                   for chunk in getattr(e, 'build_log', None) or [] if isinstance(chunk, dict))
+
+
+def failed_step_log(e: Exception) -> str:
+    """
+    :param e: error of a validation build
+    :return: the build log, if the build failed because one of its RUN steps failed
+    :raise BuildInfrastructureError: if the build failed for another reason, e.g. the daemon, the pull of the base
+        image or the package mirror
+    """
+    from docker.errors import BuildError
+
+    build_log = get_build_log(e)
+    if not isinstance(e, BuildError) or not _STEP_FAILED.search(str(e)) or _APT_NETWORK_ERROR.search(build_log):
+        lines = build_log.strip().splitlines()
+        raise BuildInfrastructureError(lines[-1] if lines else type(e).__name__) from e
+    return build_log
+
+
+@ttl_cache()
 def validate_package(_image: str, package: str) -> int:
     """
     :param _image: name and tag of the image. Expected format <image_name>:<image_tag>
@@ -133,27 +211,59 @@ def validate_package(_image: str, package: str) -> int:
     print(result)
     return int(result.split(',')[0].split('exit_code=')[1])
     """
-    client = docker.from_env()
-
     dockerfile_str = 'FROM {}\nRUN apt-get update\nRUN yes | DEBIAN_FRONTEND=noninteractive apt-get install -yqq {}'.format(_image, package)
     try:
-        client.images.build(fileobj=BytesIO(dockerfile_str.encode("utf-8")), tag='fix', rm=True, forcerm=True)
-        client.images.remove(image='fix', force=True)
+        build_and_remove(get_docker_client(), dockerfile_str)
         return 0
     except Exception as e:
+        # only the failures of apt-get are cached
+        failed_step_log(e)
         logger.error(e)
         return 100
 
 
-def validate_shell(_image: str, shell_bin_path: str) -> int:
-    client = docker.from_env()
+@ttl_cache()
+def find_unavailable_packages(_image: str, packages: Tuple[str, ...]) -> Optional[FrozenSet[str]]:
+    """
+    Install all the given packages in the image with a single build
+    :param _image: name and tag of the image. Expected format <image_name>:<image_tag>
+    :param packages: packages to install, optionally pinned, e.g. ('curl=7.68.*', 'git')
+    :return: empty if the build succeeds, the packages that apt-get reports as not found (missing package or
+             version) if it fails because of them, or None if apt-get fails for another reason
+    :raise BuildInfrastructureError: if the build fails because of the daemon, the registry or the package mirror
+    """
+    dockerfile_str = 'FROM {}\nRUN apt-get update\nRUN yes | DEBIAN_FRONTEND=noninteractive apt-get install -yqq {}'.format(_image, ' '.join(packages))
+    try:
+        build_and_remove(get_docker_client(), dockerfile_str)
+        return frozenset()
+    except Exception as e:
+        build_log = failed_step_log(e)
+
+    unavailable = set()
+    for version, name in _APT_VERSION_NOT_FOUND.findall(build_log):
+        unavailable.add(f'{name}={version}')
+    for name in _APT_UNABLE_TO_LOCATE.findall(build_log):
+        unavailable.update(package for package in packages if package.split('=')[0] == name)
+    unavailable.intersection_update(packages)
+
+    if not unavailable:
+        logger.error(build_log.strip().splitlines()[-1] if build_log.strip() else 'Build failed')
+        return None
+    return frozenset(unavailable)
 
+
+@ttl_cache()
+def validate_shell(_image: str, shell_bin_path: str) -> int:
+    """
+    :return: True if the shell is found in the image
+    :raise BuildInfrastructureError: if the build fails for another reason than the shell not found
+    """
     dockerfile_str = 'FROM {}\nRUN which {}'.format(_image, shell_bin_path)
     try:
-        client.images.build(fileobj=BytesIO(dockerfile_str.encode("utf-8")), tag='fix', rm=True, forcerm=True)
-        client.images.remove(image='fix', force=True)
+        build_and_remove(get_docker_client(), dockerfile_str)
         return True
     except Exception as e:
+        failed_step_log(e)
         logger.error(e)
         return False
 
@@ -165,10 +275,15 @@ def is_valid_dockerfile_command(command: str) -> bool:
     :param command: name of the command
     :return: True/False
     """
-    return command in COMMANDS
+    global _commands
+    if _commands is None:
+        import dockerfile as dockerfile_parser
+        _commands = frozenset(c.upper() for c in dockerfile_parser.all_cmds())
+    return command in _commands
 
 
 def parse_dockerfile_str(dockerfile_str) -> Dict:
+    import dockerfile as dockerfile_parser
     parsed_dict = dict()
     for cmd in dockerfile_parser.parse_string(dockerfile_str):
         parsed_dict[cmd.start_line] = cmd
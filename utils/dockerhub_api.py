@@ -1,12 +1,24 @@
 from __future__ import annotations
 
-import datetime as Date
-import time
+import logging
 from datetime import datetime
-from utils.common import request_data
+from typing import Dict, Optional, Tuple
+from utils.common import request_data, ttl_cache
+from utils.registry_api import REGISTRY_URL, find_latest_tag
+from utils.snapshot import SnapshotReader, get_snapshot
+from utils.tag_index import PageFetcher, TagIndex, get_tag_index, save_tag_index
+logger = logging.getLogger(__name__.split('.')[0])
+logger.setLevel(logging.DEBUG)
 
-API_REQUEST_SLEEP = 2
+# sources of the 'latest' equivalent tag: the tags of DockerHub, or the manifests of the registry
+LATEST_TAG_SOURCES = ['hub', 'registry']
 
+# keys of the snapshot records, by repository path
+SNAPSHOT_TAGS_KEY = 'dockerhub/tags/{}'
+SNAPSHOT_LATEST_KEY = 'registry/latest/{}'
+
+_latest_tag_source = 'hub'
+_registry_url = REGISTRY_URL
 
 class DockerHubAPIException(Exception):
     def __init__(self, msg='DockerHub API request failed', *args, **kwargs):
@@ -33,60 +45,135 @@ def parse_image_path(image_name: str) -> str:
     return image_path
 
 
-def get_image_version(image_name: str, date: datetime) -> str:
+def tags_page_fetcher(image_path: str):
     """
-    Retrieve the version of the given image from dockerhub registry.
-
-    :param image_name: name of the image
-    :param date: date of image last push in the registry
-    :return: version of the image
+    Get a function fetching the pages of the tags of the given repository, from the last updated
+    :param image_path: repository path, e.g. library/ubuntu
     """
-
-    start_page = 1
-    checked_elements = 0
-    search_size = 25
-
-    image_path = parse_image_path(image_name)
-
-    api_url = 'https://hub.docker.com/v2/repositories/' + image_path + \
-              '/tags/?page_size=' + str(search_size) + '&page=' + str(start_page) + \
-              '&ordering=last_updated'
-    while api_url:
+    def fetch_page(page: int, page_size: int) -> dict:
+        api_url = f'https://hub.docker.com/v2/repositories/{image_path}/tags/?' \
+                  f'page_size={str(page_size)}' \
+                  f'&page={str(page)}' \
+                  f'&ordering=last_updated'
         try:
             response = request_data(api_url)
             if response.status_code == 404:
                 raise ImageNotFoundException()
             response = response.json()
-            api_url = response['next']
+        except ImageNotFoundException:
+            raise
         except Exception as e:
             raise DockerHubAPIException(e) from None
 
-        images = response['results']
-        images_number = response['count']
+        return response
+
+    return fetch_page
 
-        if images_number == 0:
-            raise ImageNotFoundException()
 
-        for image_json in images:
-            date_string = image_json['tag_last_pushed'].split('T')[0]
-            image_date = Date.datetime.strptime(date_string, '%Y-%m-%d')
+def get_repository_tags(image_path: str) -> Tuple[TagIndex, Optional[PageFetcher]]:
+    """
+    Get the tag index of a repository: the local one, refreshed from DockerHub, or the one of the snapshot when
+    the lookups run offline (see utils.snapshot)
+    :param image_path: repository path, e.g. library/ubuntu
+    :return: the tag index and the function fetching its missing pages, None if offline
+    """
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return _snapshot_tag_index(snapshot, image_path), None
+
+    fetch_page = tags_page_fetcher(image_path)
+    return get_tag_index(image_path, fetch_page), fetch_page
 
-            if date > image_date:
-                return image_json['name']
 
-        start_page += 1
-        checked_elements += search_size
+@ttl_cache()
+def _snapshot_tag_index(snapshot: SnapshotReader, image_path: str) -> TagIndex:
+    record = snapshot.get(SNAPSHOT_TAGS_KEY.format(image_path))
+    if record is None:
+        raise DockerHubAPIException(f'The tags of {image_path} are not in the snapshot {snapshot.path}')
+    if record['missing']:
+        raise ImageNotFoundException()
 
-        if checked_elements >= images_number:
-            return None
+    entries = {name: (pushed, updated, tuple(digests)) for name, pushed, updated, digests in record['tags']}
+    return TagIndex.from_entries(image_path, entries, record['count'])
 
-        time.sleep(API_REQUEST_SLEEP)
+
+def export_repository(image_name: str) -> Dict[str, object]:
+    """
+    Fetch everything the lookups of the given image need, for a snapshot: the whole tag history of the repository
+    and, with the 'registry' source, the latest equivalent tag found in the registry
+    :param image_name: name of the image
+    :return: the snapshot records, by key
+    """
+    image_path = parse_image_path(image_name)
+    fetch_page = tags_page_fetcher(image_path)
+    records = dict()
+    try:
+        index = get_tag_index(image_path, fetch_page)
+        index.fetch_all(fetch_page)
+    except ImageNotFoundException:
+        records[SNAPSHOT_TAGS_KEY.format(image_path)] = {'missing': True, 'count': 0, 'tags': []}
+        return records
+
+    if index.dirty:
+        save_tag_index(index)
+    tags = [[name, pushed, updated, list(digests)] for name, (pushed, updated, digests) in index.entries().items()]
+    records[SNAPSHOT_TAGS_KEY.format(image_path)] = {'missing': False, 'count': index.count, 'tags': tags}
+
+    if _latest_tag_source == 'registry':
+        try:
+            tag = find_latest_tag(image_path, _registry_url)
+            if tag:
+                records[SNAPSHOT_LATEST_KEY.format(image_path)] = tag
+        except Exception as e:
+            logger.warning(f'Cannot find the latest tag of {image_path} in the registry: {e}')
+    return records
 
 
+@ttl_cache()
+def get_image_version(image_name: str, date: datetime) -> str:
+    """
+    Retrieve the version of the given image from dockerhub registry.
+    The tags are looked up in the local tag index of the repository (utils.tag_index), which fetches only the pages
+    it misses, or in the snapshot if the lookups run offline.
+
+    :param image_name: name of the image
+    :param date: date of image last push in the registry
+    :return: version of the image
+    """
+    image_path = parse_image_path(image_name)
+    index, fetch_page = get_repository_tags(image_path)
+    if index.count == 0:
+        raise ImageNotFoundException()
+
+    version = index.latest_before(date, fetch_page)
+    if index.dirty:
+        save_tag_index(index)
+    return version
+
+
+def configure_latest_tag_source(source: str, registry_url: str = REGISTRY_URL) -> None:
+    """
+    Select how get_latest_tag finds the 'latest' equivalent tag
+    :param source: 'hub' to look for the tags with the digest of latest in the DockerHub tags, 'registry' to compare
+        the manifest digests of latest and of the version tags through the registry API (falling back to 'hub')
+    :param registry_url: URL of the registry used by the 'registry' source
+    """
+    global _latest_tag_source, _registry_url
+    if source not in LATEST_TAG_SOURCES:
+        raise ValueError(f'Unknown latest tag source: {source}')
+    _latest_tag_source = source
+    _registry_url = registry_url
+    get_latest_tag.cache_clear()
+
+
+@ttl_cache()
 def get_latest_tag(image_name):
     """
     Retrieve the latest tag 'equivalent' of the given image from dockerhub registry.
     i.e. get_latest_tag(ubuntu) return 'focal' [in date 22/04/2021]
+    The tags are looked up in the local tag index of the repository (utils.tag_index), which fetches only the pages
+    it misses, or first in the registry if selected with configure_latest_tag_source. With a snapshot, both come
+    from the snapshot.
 
     :param image_name: name of the image.
                        If it's an official image, the username 'library/' is not needed.
@@ -95,54 +182,34 @@ def get_latest_tag(image_name):
     """
 
     image_path = parse_image_path(image_name)
-
-    page = 1
-    page_size = 25
-    latest_found = False
-    latest_digests = []
-
-    alt_tag = None
-    api_url = f'https://hub.docker.com/v2/repositories/{image_path}/tags/?' \
-              f'page_size={str(page_size)}' \
-              f'&page={str(page)}' \
-              f'&ordering=last_updated'
-    while api_url:
+    snapshot = get_snapshot()
+    if _latest_tag_source == 'registry' and snapshot is not None:
+        tag = snapshot.get(SNAPSHOT_LATEST_KEY.format(image_path))
+        if tag:
+            return tag
+    elif _latest_tag_source == 'registry':
         try:
-            response = request_data(api_url)
-            if response.status_code == 404:
-                raise ImageNotFoundException()
-            response = response.json()
-            api_url = response['next']
+            tag = find_latest_tag(image_path, _registry_url)
+            if tag:
+                return tag
         except Exception as e:
-            raise DockerHubAPIException(e) from None
+            logger.warning(f'Cannot find the latest tag of {image_path} in the registry, using DockerHub: {e}')
 
-        results = response['results']
-        images_number = response['count']
+    index, fetch_page = get_repository_tags(image_path)
+    if index.count == 0:
+        return None
 
-        if images_number == 0:
+    tag = None
+    alt_tag = None
+    for digest in index.digests('latest', fetch_page):
+        # versioned tags first, the last pushed one
+        tag = index.find_tag(lambda name: name != 'latest' and name[0].isdigit(), digest, fetch_page)
+        if tag:
             break
+        if alt_tag is None:
+            # set versions-less tag if there are no alternatives
+            alt_tag = next((name for name in reversed(index.tags_with_digest(digest)) if name != 'latest'), None)
 
-        if not latest_found:
-            for result in results:
-                # Find the digest of latest image
-                if result['name'] == 'latest':
-                    latest_found = True
-                    for image in result['images']:
-                        if image['architecture'] == 'amd64' and image["os"] == "linux":
-                            latest_digests.append(image['digest'])
-                    break
-
-        for result in results:
-            # Find the tag with the previous found digests
-            temp_digests = []
-            for image in result['images']:
-                if image['digest'] in latest_digests and result['name'] != 'latest':
-                    if result['name'][0].isdigit():
-                        return result['name']
-                    else:
-                        alt_tag = result['name']  # set versions-less tag if there are no alternatives
-
-        page += 1
-        time.sleep(API_REQUEST_SLEEP)
-
-    return alt_tag
+    if index.dirty:
+        save_tag_index(index)
+    return tag or alt_tag
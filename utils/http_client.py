@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+from utils.common import CACHE_DIR
+from utils.rate_limiter import get_rate_limiter
+
+logger = logging.getLogger(__name__.split('.')[0])
+logger.setLevel(logging.DEBUG)
+
+HTTP_CACHE_DIR = os.path.join(CACHE_DIR, 'http')
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+# connections kept alive per host, and hosts with a pool
+POOL_MAXSIZE = 16
+POOL_HOSTS = 8
+# larger responses are not stored for revalidation
+MAX_STORED_BYTES = 1024 * 1024
+# a request rejected by the rate limit of the server is sent again at most these times
+MAX_RATE_LIMITED_RETRIES = 3
+
+
+class HttpStats(NamedTuple):
+    """Statistics of the HTTP client of the process"""
+    requests: int
+    connections: int
+    not_modified: int
+
+    @property
+    def reused(self) -> int:
+        """Requests sent on an already open connection"""
+        return max(0, self.requests - self.connections)
+
+
+class ResponseStore:
+    """
+    On-disk store of the responses having an ETag or a Last-Modified header, by URL, so that they can be revalidated
+    with a conditional request and read again from the disk when the server answers 304 Not Modified.
+    The entries are written atomically, so the store can be shared by concurrent processes.
+    """
+
+    def __init__(self, store_dir: str = HTTP_CACHE_DIR) -> None:
+        self._store_dir = store_dir
+
+    def get(self, url: str) -> Optional[Dict]:
+        """
+        :return: the stored entry of the URL (etag, last_modified, encoding and content), or None
+        """
+        try:
+            with open(self.__path(url), 'rb') as file:
+                entry = pickle.load(file)
+            return entry if entry.get('url') == url else None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f'Cannot read the stored response of {url}: {e}')
+            return None
+
+    def put(self, url: str, response) -> None:
+        """
+        Store a 200 response, if it can be revalidated
+        """
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified or len(response.content) > MAX_STORED_BYTES:
+            return
+
+        entry = {'url': url, 'etag': etag, 'last_modified': last_modified, 'encoding': response.encoding,
+                 'content': response.content}
+        path = self.__path(url)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as file:
+                pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f'Cannot store the response of {url}: {e}')
+
+    def __path(self, url: str) -> str:
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self._store_dir, key[-2:], key + '.pickle')
+
+
+class HttpClient:
+    """
+    HTTP client shared by the remote lookups: keep-alive connection pools per host, gzip, timeouts, and conditional
+    requests revalidating the stored responses (If-None-Match / If-Modified-Since). A 304 answer is returned as the
+    stored 200 response.
+    The requests to each host go through its rate limiter (utils.rate_limiter), shared with the other processes, and
+    the requests rejected with 429, or 503 with Retry-After, are sent again when the limiter allows it.
+    """
+
+    def __init__(self, store_dir: Optional[str] = HTTP_CACHE_DIR, connect_timeout: float = CONNECT_TIMEOUT,
+                 read_timeout: float = READ_TIMEOUT, pool_maxsize: int = POOL_MAXSIZE) -> None:
+        """
+        :param store_dir: directory of the response store. If None, the responses are not revalidated
+        """
+        # imported on the first client, to keep the startup fast
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self._session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=pool_maxsize)
+        self._session.mount('https://', self._adapter)
+        self._session.mount('http://', self._adapter)
+        self._session.headers['Accept-Encoding'] = 'gzip, deflate'
+        self._timeout = (connect_timeout, read_timeout)
+        self._store = ResponseStore(store_dir) if store_dir else None
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._not_modified = 0
+
+    def get(self, url: str, headers: Dict[str, str] = None):
+        """
+        :param url: URL to get
+        :param headers: additional headers of the request
+        :return: the requests.Response of the URL
+        """
+        entry = self._store.get(url) if self._store else None
+        headers = dict(headers or {})
+        if entry:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = self.__send('GET', url, headers)
+
+        not_modified = response.status_code == 304 and entry is not None
+        with self._lock:
+            self._not_modified += not_modified
+
+        if not_modified:
+            response.status_code = 200
+            response._content = entry['content']
+            response.encoding = entry['encoding']
+        elif response.status_code == 200 and self._store:
+            self._store.put(url, response)
+        return response
+
+    def head(self, url: str, headers: Dict[str, str] = None):
+        """
+        :param url: URL to check
+        :param headers: additional headers of the request
+        :return: the requests.Response of the HEAD request
+        """
+        return self.__send('HEAD', url, dict(headers or {}))
+
+    def __send(self, method: str, url: str, headers: Dict[str, str]):
+        limiter = get_rate_limiter(urlsplit(url).hostname or '')
+        for attempt in range(MAX_RATE_LIMITED_RETRIES + 1):
+            limiter.acquire()
+            response = self._session.request(method, url, headers=headers, timeout=self._timeout)
+            limiter.update(response.status_code, response.headers)
+            rate_limited = response.status_code == 429 or \
+                response.status_code == 503 and 'Retry-After' in response.headers
+            if not rate_limited:
+                break
+            logger.warning(f'Rate limited by {limiter.host} (HTTP {response.status_code}), attempt {attempt + 1}')
+
+        with self._lock:
+            self._requests += 1
+        return response
+
+    @property
+    def stats(self) -> HttpStats:
+        connections = 0
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+        with self._lock:
+            return HttpStats(self._requests, connections, self._not_modified)
+
+
+_client = None
+_client_lock = threading.Lock()
+_store_dir: Optional[str] = HTTP_CACHE_DIR
+
+
+def configure_http_client(store_dir: Optional[str] = HTTP_CACHE_DIR) -> None:
+    """
+    Select where the HTTP client of the process stores the responses to revalidate. The client is created again on
+    its next use
+    :param store_dir: directory of the response store. If None, no response is stored: the repeated lookups are only
+        answered by the in-process caches of the API modules
+    """
+    global _client, _store_dir
+    with _client_lock:
+        _store_dir = store_dir
+        _client = None
+
+
+def get_http_client() -> HttpClient:
+    """
+    :return: the HTTP client of the process, created on first use
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient(_store_dir)
+        return _client
+
+
+def log_http_stats() -> None:
+    """
+    Log the connection reuse and the revalidation hits of the HTTP client, if it was used
+    """
+    if _client is None:
+        return
+
+    stats = _client.stats
+    if stats.requests:
+        logger.info(f'HTTP: {stats.requests} requests on {stats.connections} connections '
+                    f'({stats.reused / stats.requests:.0%} reused), '
+                    f'{stats.not_modified} not modified ({stats.not_modified / stats.requests:.0%})')
@@ -1,13 +1,28 @@
 from __future__ import annotations
 
 import datetime as Date
+import logging
 import time
 from datetime import datetime
-import requests
+from typing import Callable, Dict, Iterator, List, Tuple
+from urllib.parse import quote
 from utils.dockerhub_api import get_latest_tag
-from utils.common import request_data
-import logging as logger
-logger.getLogger('backoff').addHandler(logger.StreamHandler())
+from utils.common import request_data, ttl_cache
+from utils.package_index import get_package_index
+from utils.series_table import SERIES_TABLE_MISS_TTL, SeriesTable, get_series_table, refresh_series_table
+from utils.snapshot import SnapshotReader, get_snapshot
+logger = logging.getLogger(__name__.split('.')[0])
+logger.setLevel(logging.DEBUG)
+
+# keys of the snapshot records
+SNAPSHOT_SERIES_KEY = 'launchpad/series/{}'
+SNAPSHOT_BINARIES_KEY = 'launchpad/binaries/{}/{}/{}'
+
+LAUNCHPAD_URL = 'https://api.launchpad.net/1.0/'
+# largest ws.size accepted by the Launchpad web service
+LAUNCHPAD_MAX_PAGE_SIZE = 300
+# architecture of the package publications looked up, the one of the fixed images
+LAUNCHPAD_ARCHITECTURE = 'amd64'
 
 
 class LaunchpadAPIException(Exception):
@@ -15,13 +30,11 @@ class LaunchpadAPIException(Exception):
         super().__init__(msg, *args, **kwargs)
 
 
-def get_distro_serie(distro: str, tag: str) -> str:
+def fetch_distro_series(distro: str) -> list:
     """
-    Retrieve the serie from the given distribution and tag.
-    i.e. get_distro_serie('ubuntu', '20.04') returns 'focal'
+    Fetch the series collection of the given distribution from Launchpad.
     """
-
-    api_url = 'https://api.launchpad.net/1.0/' + distro + '/series'
+    api_url = LAUNCHPAD_URL + distro + '/series'
 
     try:
         response = request_data(api_url)
@@ -29,11 +42,41 @@ def get_distro_serie(distro: str, tag: str) -> str:
     except Exception as e:
         raise LaunchpadAPIException() from None
 
-    series = response['entries']
+    return response['entries']
 
-    if series == 0: 
-        return None
-    
+
+def get_series_table_of(distro: str) -> SeriesTable:
+    """
+    Get the series table of the given distribution (utils.series_table): kept by the process and on disk and fetched
+    again once a week, or read from the snapshot when the lookups run offline.
+    """
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return _snapshot_series_table(snapshot, distro)
+
+    return get_series_table(distro, fetch_distro_series)
+
+
+@ttl_cache()
+def _snapshot_series_table(snapshot: SnapshotReader, distro: str) -> SeriesTable:
+    series = snapshot.get(SNAPSHOT_SERIES_KEY.format(distro))
+    if series is None:
+        raise LaunchpadAPIException(f'The series of {distro} are not in the snapshot {snapshot.path}')
+    return SeriesTable(distro, series)
+
+
+def get_distro_series(distro: str) -> list:
+    """
+    Retrieve the series collection of the given distribution: name, version and active flag of each series.
+    """
+    return get_series_table_of(distro).entries
+
+
+def get_distro_serie(distro: str, tag: str) -> str:
+    """
+    Retrieve the serie from the given distribution and tag.
+    i.e. get_distro_serie('ubuntu', '20.04') returns 'focal'
+    """
     # Get latest distro release tag
     if tag == 'latest':
         tag = get_latest_tag(distro)
@@ -41,13 +84,25 @@ def get_distro_serie(distro: str, tag: str) -> str:
     if '-' in tag:
         tag = tag.split('-')[0]
 
-    for serie_json in series:
-        if tag in serie_json['version'] or serie_json['version'] in tag or tag in serie_json['name']:
-            return serie_json['name']
-        
-    return None
+    return _series_lookup(distro, lambda table: table.find(tag))
+
+
+def _series_lookup(distro: str, lookup: Callable[[SeriesTable], object]):
+    """
+    Look up the series table of the given distribution. If nothing is found, the series are fetched again, at most
+    once every SERIES_TABLE_MISS_TTL seconds, in case the series was released after the table was fetched
+    """
+    table = get_series_table_of(distro)
+    result = lookup(table)
+    if result is None and get_snapshot() is None and time.time() - table.refreshed > SERIES_TABLE_MISS_TTL:
+        try:
+            result = lookup(refresh_series_table(distro, fetch_distro_series))
+        except LaunchpadAPIException as e:
+            logger.warning(f'Cannot refresh the series of {distro}: {e}')
+    return result
 
 
+@ttl_cache()
 def get_package_binary_version(distro: str, distro_series: str, binary_name: str, date: datetime) -> str:
     """
     Retrieve the version of the given package.
@@ -58,18 +113,55 @@ def get_package_binary_version(distro: str, distro_series: str, binary_name: str
     :param date: date of package release
     :return: version of the package
     """
+    snapshot = get_snapshot()
+    package_index = get_package_index()
+    if snapshot is not None:
+        publications = snapshot.get(SNAPSHOT_BINARIES_KEY.format(distro, distro_series, binary_name))
+        if publications is None:
+            raise LaunchpadAPIException(f'The versions of {binary_name} in {distro}/{distro_series} are not in '
+                                        f'the snapshot {snapshot.path}')
+    elif package_index is not None and package_index.covers(distro, distro_series):
+        # built from the Packages files of an archive mirror: a package missing from the index is not published
+        publications = package_index.publications(distro, distro_series, binary_name)
+    else:
+        publications = series_publications(get_published_binaries(distro, binary_name, distro_series), distro,
+                                           distro_series)
+
+    for date_string, pocket, version in publications:
+        parsed_date = Date.datetime.strptime(date_string, '%Y-%m-%d')
+        valid_pocket = (pocket != 'Proposed' and pocket != 'Backports')
+
+        if date > parsed_date and valid_pocket:
+            return version
 
+    return None
+
+
+def get_published_binaries(distro: str, binary_name: str, distro_series: str,
+                           architecture: str = LAUNCHPAD_ARCHITECTURE) -> Iterator[Dict]:
+    """
+    Retrieve the published binaries of the given package in the given distro arch series, from the last published.
+    The pages are requested while the binaries are consumed, so a lookup stopping at its first match requests only
+    the pages it reads.
+
+    :param distro: the distribution of the package
+    :param binary_name: name of the package
+    :param distro_series: the distro series of the binaries (e.g., focal)
+    :param architecture: the architecture of the binaries. The architecture-independent packages are published in
+        each architecture
+    """
     start_element = 0
-    search_size = 100
-    
-    while True:
-        # URL encoding 
-        binary_name = requests.utils.quote(binary_name)
+    search_size = LAUNCHPAD_MAX_PAGE_SIZE
+    # URL encoding
+    binary_name = quote(binary_name)
+    distro_arch_series = quote(LAUNCHPAD_URL + distro + '/' + distro_series + '/' + architecture, safe='')
 
-        api_url = 'https://api.launchpad.net/1.0/' + distro + '/+archive/primary?ws.start=' + str(start_element) \
+    while True:
+        api_url = LAUNCHPAD_URL + distro + '/+archive/primary?ws.start=' + str(start_element) \
                   + '&ws.size=' + str(search_size) \
                   + '&ws.op=getPublishedBinaries' \
                   + '&binary_name=' + binary_name \
+                  + '&distro_arch_series=' + distro_arch_series \
                   + '&status=Published' \
                   + '&exact_match=true' \
                   + '&order_by_date=true'
@@ -80,31 +172,49 @@ def get_package_binary_version(distro: str, distro_series: str, binary_name: str
         except Exception as e:
             raise LaunchpadAPIException() from None
 
-        binaries_number = response['total_size']
-        binaries = response['entries']
+        yield from response['entries']
 
-        if binaries_number == 0: 
-            return None
+        start_element = start_element + search_size
 
-        distro_arch_serie = 'https://api.launchpad.net/1.0/' + distro + '/' + distro_series
-        for binary_json in binaries:
-            if distro_arch_serie not in binary_json['distro_arch_series_link']:
-                continue
+        # the size of large collections is not computed, only their next page is linked
+        if 'total_size' in response:
+            if start_element >= response['total_size']:
+                return
+        elif 'next_collection_link' not in response:
+            return
 
-            date_string = binary_json['date_published'].split('T')[0]
-            parsed_date = Date.datetime.strptime(date_string, '%Y-%m-%d')
-            pocket = binary_json['pocket']
-            valid_pocket = (pocket != 'Proposed' and pocket != 'Backports')
 
-            if date > parsed_date and valid_pocket:
-                return binary_json['binary_package_version']
+def series_publications(binaries: Iterator[Dict], distro: str, distro_series: str) -> Iterator[Tuple[str, str, str]]:
+    """
+    Select the publications of the given distro series among the published binaries of a package
 
-        start_element = start_element + search_size
+    :param binaries: published binaries, from the last published
+    :return: (publication date "YYYY-MM-DD", pocket, version) of each publication in the series
+    """
+    distro_arch_serie = LAUNCHPAD_URL + distro + '/' + distro_series + '/'
+    for binary_json in binaries:
+        if distro_arch_serie not in binary_json['distro_arch_series_link']:
+            continue
 
-        if start_element >= binaries_number:
-            return None
-        
-        time.sleep(1)
+        yield binary_json['date_published'].split('T')[0], binary_json['pocket'], binary_json['binary_package_version']
+
+
+def export_series(distro: str) -> Dict[str, object]:
+    """
+    Fetch the series of the given distribution, for a snapshot
+    :return: the snapshot records, by key
+    """
+    return {SNAPSHOT_SERIES_KEY.format(distro): refresh_series_table(distro, fetch_distro_series).entries}
+
+
+def export_binaries(distro: str, distro_series: List[str], binary_name: str) -> Dict[str, object]:
+    """
+    Fetch all the publications of the given package in the given distro series, for a snapshot
+    :return: the snapshot records, by key
+    """
+    return {SNAPSHOT_BINARIES_KEY.format(distro, serie, binary_name):
+            list(series_publications(get_published_binaries(distro, binary_name, serie), distro, serie))
+            for serie in distro_series}
 
 
 def pkgs_repo_available(distro: str, distro_series: str) -> bool:
@@ -115,12 +225,8 @@ def pkgs_repo_available(distro: str, distro_series: str) -> bool:
     :param distro_series: the distro arch series of the given ubuntu distribution (e.g., precise, trusty, xenial, etc.
     :return: True if the distro is EOL, False otherwise
     """
-    api_url = 'https://api.launchpad.net/1.0/{}/{}'.format(distro, distro_series)
-
-    try:
-        response = request_data(api_url)
-        response = response.json()
-    except Exception as e:
-        raise LaunchpadAPIException() from None
+    active = _series_lookup(distro, lambda table: table.active(distro_series))
+    if active is None:
+        raise LaunchpadAPIException(f'Unknown series {distro}/{distro_series}')
 
-    return response['active']
\ No newline at end of file
+    return active
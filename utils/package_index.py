@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import datetime
+import gzip
+import logging
+import lzma
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from utils.common import CACHE_DIR
+from utils.snapshot import META_KEY, SnapshotError, SnapshotReader, write_snapshot
+
+logger = logging.getLogger(__name__.split('.')[0])
+logger.setLevel(logging.DEBUG)
+
+# written by "dockleaner_data.py build-package-index", used by "--package-index" without a path
+PACKAGE_INDEX_PATH = os.path.join(CACHE_DIR, 'packages.dks')
+PACKAGE_INDEX_KIND = 'package-index'
+PACKAGE_INDEX_KEY = 'packages/{}/{}/{}'
+ARCHITECTURES = ['amd64']
+# Packages files of a binary-<arch> directory, by preference
+PACKAGES_FILES = ['Packages', 'Packages.xz', 'Packages.gz']
+# pocket of each suite suffix, as named by Launchpad
+POCKETS = {'': 'Release', 'updates': 'Updates', 'security': 'Security', 'proposed': 'Proposed',
+           'backports': 'Backports'}
+
+
+class ArchiveCopy(NamedTuple):
+    """A copy of a suite of the archive (dists/<suite>) in a mirror or a snapshot directory"""
+    path: str
+    series: str
+    pocket: str
+    date: str
+
+
+def parse_release(path: str) -> Optional[ArchiveCopy]:
+    """
+    :param path: path of a Release file, e.g. <mirror>/dists/focal-updates/Release
+    :return: the suite copy described by the Release file, or None if it has no suite or date
+    """
+    fields = dict()
+    with open(path, encoding='utf-8', errors='replace') as file:
+        for line in file:
+            if not line.strip() or line[0].isspace():
+                # the checksums lists start after the fields of interest
+                if fields.get('Date'):
+                    break
+                continue
+            key, _, value = line.partition(':')
+            fields[key] = value.strip()
+
+    suite = fields.get('Suite') or os.path.basename(os.path.dirname(path))
+    if not fields.get('Date'):
+        return None
+    series, _, suffix = suite.partition('-')
+    if suffix not in POCKETS:
+        return None
+
+    # imported when indexing only, to keep the startup fast
+    from email.utils import parsedate_to_datetime
+    date = parsedate_to_datetime(fields['Date']).astimezone(datetime.timezone.utc).strftime('%Y-%m-%d')
+    return ArchiveCopy(os.path.dirname(path), series, POCKETS[suffix], date)
+
+
+def find_archive_copies(roots: List[str]) -> List[ArchiveCopy]:
+    """
+    :param roots: mirror or snapshot directories, searched for dists/<suite>/Release files
+    :return: the suite copies found, sorted by date
+    """
+    copies = list()
+    for root in roots:
+        for directory, dirs, files in os.walk(root):
+            dirs.sort()
+            if os.path.basename(os.path.dirname(directory)) == 'dists' and 'Release' in files:
+                copy = parse_release(os.path.join(directory, 'Release'))
+                if copy:
+                    copies.append(copy)
+                # the suite content is read through its Packages files
+                dirs[:] = []
+    return sorted(copies, key=lambda copy: (copy.date, copy.path))
+
+
+def read_packages(path: str) -> Iterator[Tuple[str, str, str]]:
+    """
+    :param path: Packages file, possibly compressed with gzip or xz
+    :return: (package, version, architecture) of each stanza
+    """
+    opener = gzip.open if path.endswith('.gz') else lzma.open if path.endswith('.xz') else open
+    package = version = architecture = None
+    with opener(path, 'rt', encoding='utf-8', errors='replace') as file:
+        for line in file:
+            if line.startswith('Package:'):
+                package = line[8:].strip()
+            elif line.startswith('Version:'):
+                version = line[8:].strip()
+            elif line.startswith('Architecture:'):
+                architecture = line[13:].strip()
+            elif not line.strip():
+                if package and version:
+                    yield package, version, architecture
+                package = version = architecture = None
+    if package and version:
+        yield package, version, architecture
+
+
+def packages_files(copy: ArchiveCopy, architectures: List[str]) -> List[str]:
+    """
+    :return: the Packages file of each component and architecture of the suite copy
+    """
+    files = list()
+    for component in sorted(os.listdir(copy.path)):
+        for architecture in architectures:
+            directory = os.path.join(copy.path, component, 'binary-' + architecture)
+            name = next((name for name in PACKAGES_FILES if os.path.isfile(os.path.join(directory, name))), None)
+            if name:
+                files.append(os.path.join(directory, name))
+    return files
+
+
+def build_package_index(roots: List[str], path: str = PACKAGE_INDEX_PATH, distro: str = 'ubuntu',
+                        architectures: List[str] = None) -> Dict:
+    """
+    Index the package versions of the Ubuntu archive copies found in the given mirror or snapshot directories.
+    As the Launchpad lookup it replaces (getPublishedBinaries with status Published), the index lists the versions
+    in the newest copy of each suite; the publication date of a version is the date of the oldest copy listing it.
+
+    :param roots: mirror or snapshot directories containing dists/<suite>/Release and Packages(.gz/.xz) files
+    :param path: path of the index file
+    :param distro: name of the distribution of the archive
+    :param architectures: architectures indexed
+    :return: the description of the index
+    """
+    start = time.perf_counter()
+    architectures = architectures or ARCHITECTURES
+    copies = find_archive_copies(roots)
+    if not copies:
+        raise SnapshotError(f'No dists/<suite>/Release file found in {", ".join(roots)}')
+
+    newest = dict()
+    for copy in copies:
+        newest[(copy.series, copy.pocket)] = copy
+
+    # (series, pocket, package, version, architecture) -> first publication date
+    first_seen: Dict[Tuple[str, str, str, str, str], str] = dict()
+    published = set()
+    files = 0
+    for copy in copies:
+        is_newest = newest[(copy.series, copy.pocket)] is copy
+        for packages_file in packages_files(copy, architectures):
+            files += 1
+            for package, version, architecture in read_packages(packages_file):
+                key = (copy.series, copy.pocket, package, version, architecture)
+                # copies are visited from the oldest
+                first_seen.setdefault(key, copy.date)
+                if is_newest:
+                    published.add(key)
+
+    by_package: Dict[str, List] = dict()
+    for key in published:
+        series, pocket, package, version, architecture = key
+        by_package.setdefault(PACKAGE_INDEX_KEY.format(distro, series, package), []).append(
+            [first_seen[key], pocket, version, architecture])
+
+    records = dict()
+    for key, publications in by_package.items():
+        # from the last published, as Launchpad orders them
+        publications.sort(key=lambda publication: (publication[0], publication[2]), reverse=True)
+        records[key] = publications
+
+    meta = {
+        'kind': PACKAGE_INDEX_KIND,
+        'created': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'distro': distro,
+        'series': sorted({copy.series for copy in copies}),
+        'architectures': architectures,
+        'suites': sorted({f'{copy.series}:{copy.pocket}' for copy in copies}),
+        'copies': len(copies),
+    }
+    records[META_KEY] = meta
+    size = write_snapshot(path, records)
+    logger.info(f'Indexed {len(published)} package versions of {len(records) - 1} packages from {files} Packages '
+                f'files of {len(copies)} suite copies to {path} ({size / 1024 / 1024:.1f} MiB) '
+                f'in {time.perf_counter() - start:.2f}s')
+    return meta
+
+
+class PackageIndex:
+    """
+    Read-only view of a package index file, memory-mapped, so the worker processes reading the same index share
+    its pages instead of copying it.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._reader = SnapshotReader(path)
+        meta = self._reader.meta
+        if meta.get('kind') != PACKAGE_INDEX_KIND:
+            raise SnapshotError(f'Not a package index: {path}')
+        self.path = path
+        self.distro = meta['distro']
+        self.series = frozenset(meta['series'])
+
+    def covers(self, distro: str, distro_series: str) -> bool:
+        """
+        :return: True if the index has the packages of the given series
+        """
+        return distro == self.distro and distro_series in self.series
+
+    def publications(self, distro: str, distro_series: str, binary_name: str) -> List[Tuple[str, str, str]]:
+        """
+        :return: (publication date "YYYY-MM-DD", pocket, version) of each published version of the package in the
+            given series, from the last published
+        """
+        return [(date, pocket, version) for date, pocket, version, _ in
+                self._reader.get(PACKAGE_INDEX_KEY.format(distro, distro_series, binary_name), [])]
+
+    def close(self) -> None:
+        self._reader.close()
+
+
+_index: Optional[PackageIndex] = None
+_index_lock = threading.Lock()
+
+
+def configure_package_index(path: Optional[str]) -> None:
+    """
+    Select the package index answering the package version lookups of the series it covers
+    :param path: path of the index file. If None, the lookups use Launchpad again
+    :raise SnapshotError: if the file is not a valid package index
+    """
+    global _index
+    index = PackageIndex(path) if path else None
+    with _index_lock:
+        _index = index
+    if index is not None:
+        logger.info(f'Using the package index {path} ({", ".join(sorted(index.series))})')
+
+
+def get_package_index() -> Optional[PackageIndex]:
+    """
+    :return: the package index selected with configure_package_index, or None
+    """
+    return _index
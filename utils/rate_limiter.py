@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows: the limiter is shared by the threads only
+    fcntl = None
+
+from utils.common import CACHE_DIR
+
+logger = logging.getLogger(__name__.split('.')[0])
+logger.setLevel(logging.DEBUG)
+
+RATE_LIMIT_DIR = os.path.join(CACHE_DIR, 'ratelimit')
+# requests per second and burst size of the known hosts, until their headers tell the actual quota
+HOST_RATES = {
+    'hub.docker.com': (0.5, 4),
+    'api.launchpad.net': (2.0, 8),
+}
+DEFAULT_RATE = (5.0, 10)
+MIN_RATE = 0.01
+# longest wait accepted from a Retry-After or X-RateLimit-Reset header
+MAX_WAIT = 15 * 60
+
+
+class RateLimiter:
+    """
+    Token bucket of the requests to a remote host. The state of the bucket is kept in a file locked during each
+    update, so all the processes (and threads) of the machine sending requests to the host share the same quota.
+    The rate adapts to the responses: Retry-After and X-RateLimit-Remaining/Reset block the bucket until the quota is
+    restored or spread the quota left until then, X-RateLimit-Limit with a window (e.g. "180;w=21600") sets the rate
+    when the quota left is unknown, and a 429 answer halves the rate until the following successful requests bring it
+    back.
+    """
+
+    def __init__(self, host: str, rate: float, burst: int, state_dir: Optional[str] = RATE_LIMIT_DIR) -> None:
+        """
+        :param host: remote host
+        :param rate: requests per second, until the responses tell the actual quota
+        :param burst: requests sent without waiting after an idle period
+        :param state_dir: directory of the state files. If None, the bucket is shared by the threads only
+        """
+        self.host = host
+        self._rate = rate
+        self._burst = burst
+        self._path = os.path.join(state_dir, re.sub(r'[^A-Za-z0-9.-]', '_', host) + '.json') if state_dir else None
+        self._lock = threading.Lock()
+        self._state = None
+        self.waited = 0.0
+
+    def acquire(self) -> float:
+        """
+        Wait until a request can be sent to the host, and take its token
+        :return: seconds waited
+        """
+        waited = 0.0
+        while True:
+            with self.__locked_state() as state:
+                now = time.time()
+                self.__refill(state, now)
+                if now < state['blocked_until']:
+                    wait = state['blocked_until'] - now
+                elif state['tokens'] >= 1:
+                    state['tokens'] -= 1
+                    self.waited += waited
+                    return waited
+                else:
+                    wait = (1 - state['tokens']) / state['rate']
+
+            wait = min(wait, MAX_WAIT)
+            logger.debug(f'Rate limit of {self.host}: waiting {wait:.2f}s')
+            time.sleep(wait)
+            waited += wait
+
+    def update(self, status_code: int, headers) -> None:
+        """
+        Adapt the bucket to the response of a request
+        :param status_code: HTTP status of the response
+        :param headers: headers of the response
+        """
+        retry_after = parse_retry_after(headers.get('Retry-After'))
+        limit, window = parse_limit(headers.get('X-RateLimit-Limit'))
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = parse_reset(headers.get('X-RateLimit-Reset'))
+
+        left = int(remaining.strip().split(';')[0]) if remaining and remaining.strip().split(';')[0].isdigit() else None
+
+        with self.__locked_state() as state:
+            now = time.time()
+            self.__refill(state, now)
+            if left is not None and reset is not None:
+                if left == 0:
+                    # no request until the quota is restored, then the default rate until the next headers
+                    state['blocked_until'] = max(state['blocked_until'], now + min(reset, MAX_WAIT))
+                    state['updated'] = state['blocked_until']
+                    state['tokens'] = 0
+                    state['rate'] = self._rate
+                else:
+                    # the quota left is spread until it is restored
+                    state['rate'] = max(MIN_RATE, left / max(1.0, reset))
+                    state['tokens'] = min(state['tokens'], left)
+            elif limit is not None and window:
+                state['rate'] = max(MIN_RATE, limit / window)
+            elif status_code < 400 and state['rate'] < self._rate:
+                # the rate halved by a 429 grows back to the default one
+                state['rate'] = min(self._rate, state['rate'] * 1.25)
+
+            if status_code == 429:
+                state['rate'] = max(MIN_RATE, state['rate'] / 2)
+                state['tokens'] = 0
+            if retry_after is not None:
+                state['blocked_until'] = max(state['blocked_until'], now + min(retry_after, MAX_WAIT))
+
+    def __refill(self, state: Dict, now: float) -> None:
+        if now < state['updated']:
+            # blocked: the bucket fills from the end of the block
+            return
+        elapsed = max(0.0, now - state['updated'])
+        state['tokens'] = min(self._burst, state['tokens'] + elapsed * state['rate'])
+        state['updated'] = now
+
+    def __initial_state(self) -> Dict:
+        return {'tokens': float(self._burst), 'updated': time.time(), 'rate': self._rate, 'blocked_until': 0.0}
+
+    @contextmanager
+    def __locked_state(self):
+        with self._lock:
+            if self._path is None or fcntl is None:
+                if self._state is None:
+                    self._state = self.__initial_state()
+                yield self._state
+                return
+
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            with open(self._path, 'a+') as file:
+                fcntl.flock(file, fcntl.LOCK_EX)
+                try:
+                    file.seek(0)
+                    try:
+                        state = json.loads(file.read())
+                    except ValueError:
+                        state = self.__initial_state()
+                    yield state
+                    file.seek(0)
+                    file.truncate()
+                    file.write(json.dumps(state))
+                    file.flush()
+                finally:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    :param value: Retry-After header, in seconds or as an HTTP date
+    :return: seconds to wait, or None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    # email (and socket) imported only for the rare HTTP dates, to keep the startup fast
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_limit(value: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """
+    :param value: X-RateLimit-Limit header, e.g. "180" or "180;w=21600"
+    :return: number of requests and window in seconds, if given
+    """
+    if not value:
+        return None, None
+    match = re.match(r'\s*(\d+)(?:\s*;\s*w=(\d+))?', value)
+    if not match:
+        return None, None
+    return int(match.group(1)), int(match.group(2)) if match.group(2) else None
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """
+    :param value: X-RateLimit-Reset header, as an epoch or as seconds from now
+    :return: seconds until the quota is restored, or None
+    """
+    if not value or not value.strip().isdigit():
+        return None
+    reset = int(value.strip())
+    # epochs are far larger than any window
+    return max(0.0, reset - time.time()) if reset > 10 ** 9 else float(reset)
+
+
+_limiters: Dict[str, RateLimiter] = dict()
+_limiters_lock = threading.Lock()
+_state_dir: Optional[str] = RATE_LIMIT_DIR
+
+
+def configure_rate_limits(state_dir: Optional[str] = RATE_LIMIT_DIR) -> None:
+    """
+    Select where the rate limiters of the process keep their state. The limiters already created are replaced
+    :param state_dir: directory of the state files shared with the other processes. If None, the buckets are kept in
+        memory and shared by the threads of the process only, and no file is written
+    """
+    global _state_dir
+    with _limiters_lock:
+        _state_dir = state_dir
+        _limiters.clear()
+
+
+def get_rate_limiter(host: str) -> RateLimiter:
+    """
+    :return: the rate limiter of the requests to the given host, created on first use
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            rate, burst = HOST_RATES.get(host, DEFAULT_RATE)
+            limiter = RateLimiter(host, rate, burst, _state_dir)
+            _limiters[host] = limiter
+        return limiter
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import urlencode, urljoin
+
+from utils.common import ttl_cache
+
+logger = logging.getLogger(__name__.split('.')[0])
+logger.setLevel(logging.DEBUG)
+
+REGISTRY_URL = 'https://registry-1.docker.io'
+MANIFEST_TYPES = ', '.join([
+    'application/vnd.oci.image.index.v1+json',
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.docker.distribution.manifest.v2+json',
+])
+# concurrent manifest checks, and most version tags checked per image
+MAX_WORKERS = 8
+MAX_CANDIDATES = 64
+TAGS_PAGE_SIZE = 1000
+# seconds a token is used when the registry does not tell its lifetime
+TOKEN_TTL = 60
+
+_VERSION_TAG = re.compile(r'^\d+(\.\d+)*$')
+_CHALLENGE_PARAM = re.compile(r'(\w+)="([^"]*)"')
+_NEXT_LINK = re.compile(r'<([^>]+)>\s*;\s*rel="?next"?')
+
+
+class RegistryAPIException(Exception):
+    def __init__(self, msg='Registry API request failed', *args, **kwargs):
+        super().__init__(msg, *args, **kwargs)
+
+
+class RegistryClient:
+    """
+    Client of the OCI distribution API of a registry (the Docker Hub registry by default).
+    The bearer tokens asked by the 401 challenges of the registry are requested from its token service and reused
+    for the following requests to the same repository. Registries without authentication work as well.
+    """
+
+    def __init__(self, base_url: str = REGISTRY_URL) -> None:
+        self._base_url = base_url.rstrip('/')
+        self._tokens: Dict[str, tuple] = dict()
+        self._lock = threading.Lock()
+
+    def manifest_digest(self, repository: str, reference: str) -> Optional[str]:
+        """
+        Get the digest of a manifest with a HEAD request, without downloading it
+        :param repository: repository path, e.g. library/ubuntu
+        :param reference: tag or digest
+        :return: the digest of the manifest (of the image index, for multi-platform images), or None if missing
+        """
+        url = f'{self._base_url}/v2/{repository}/manifests/{reference}'
+        response = self.__request('HEAD', url, repository, {'Accept': MANIFEST_TYPES})
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise RegistryAPIException(f'HEAD {url} returned {response.status_code}')
+        return response.headers.get('Docker-Content-Digest')
+
+    def tags(self, repository: str) -> List[str]:
+        """
+        :param repository: repository path, e.g. library/ubuntu
+        :return: all the tags of the repository
+        """
+        tags = list()
+        url = f'{self._base_url}/v2/{repository}/tags/list?n={TAGS_PAGE_SIZE}'
+        while url:
+            response = self.__request('GET', url, repository)
+            if response.status_code != 200:
+                raise RegistryAPIException(f'GET {url} returned {response.status_code}')
+            tags.extend(response.json().get('tags') or [])
+
+            match = _NEXT_LINK.search(response.headers.get('Link', ''))
+            url = urljoin(self._base_url, match.group(1)) if match else None
+        return tags
+
+    def __request(self, method: str, url: str, repository: str, headers: Dict[str, str] = None):
+        from utils.http_client import get_http_client
+        client = get_http_client()
+        headers = dict(headers or {})
+        send = client.head if method == 'HEAD' else client.get
+
+        token = self.__token(repository)
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        response = send(url, headers)
+
+        challenge = response.headers.get('WWW-Authenticate', '')
+        if response.status_code == 401 and challenge.lower().startswith('bearer'):
+            headers['Authorization'] = f'Bearer {self.__authenticate(challenge, repository)}'
+            response = send(url, headers)
+        return response
+
+    def __token(self, repository: str) -> Optional[str]:
+        with self._lock:
+            token, expires = self._tokens.get(repository, (None, 0))
+        return token if time.monotonic() < expires else None
+
+    def __authenticate(self, challenge: str, repository: str) -> str:
+        params = dict(_CHALLENGE_PARAM.findall(challenge))
+        realm = params.pop('realm', None)
+        if not realm:
+            raise RegistryAPIException(f'Invalid authentication challenge: {challenge}')
+        params.setdefault('scope', f'repository:{repository}:pull')
+
+        from utils.http_client import get_http_client
+        response = get_http_client().get(realm + '?' + urlencode(params))
+        if response.status_code != 200:
+            raise RegistryAPIException(f'Token request to {realm} returned {response.status_code}')
+        token_json = response.json()
+        token = token_json.get('token') or token_json.get('access_token')
+        if not token:
+            raise RegistryAPIException(f'No token returned by {realm}')
+
+        # renewed a bit before it expires
+        expires = time.monotonic() + max(1, int(token_json.get('expires_in') or TOKEN_TTL) - 10)
+        with self._lock:
+            self._tokens[repository] = (token, expires)
+        return token
+
+
+def version_candidates(tags: List[str], max_candidates: int = MAX_CANDIDATES) -> List[str]:
+    """
+    Select the tags that can be the version of the latest image: the plain version tags (e.g. 3, 3.11, 3.11.4),
+    from the highest version and, for equal versions, the most specific
+    :param tags: tags of the repository
+    :param max_candidates: most candidates returned
+    :return: the candidate tags, in check order
+    """
+    versions = [tag for tag in tags if _VERSION_TAG.match(tag)]
+    versions.sort(key=lambda tag: tuple(int(part) for part in tag.split('.')), reverse=True)
+    return versions[:max_candidates]
+
+
+_clients: Dict[str, RegistryClient] = dict()
+_clients_lock = threading.Lock()
+
+
+def get_registry_client(base_url: str = REGISTRY_URL) -> RegistryClient:
+    """
+    :return: the client of the registry at the given URL, created on first use
+    """
+    with _clients_lock:
+        client = _clients.get(base_url)
+        if client is None:
+            client = RegistryClient(base_url)
+            _clients[base_url] = client
+        return client
+
+
+@ttl_cache()
+def find_latest_tag(repository: str, base_url: str = REGISTRY_URL) -> Optional[str]:
+    """
+    Find the version tag with the same manifest digest as the latest tag, through the OCI distribution API.
+    The candidate tags are checked with concurrent HEAD requests, MAX_WORKERS at a time, from the highest version;
+    the search stops at the first group with a match.
+
+    :param repository: repository path, e.g. library/ubuntu
+    :param base_url: URL of the registry
+    :return: the version tag of the latest image, or None if no version tag matches
+    """
+    client = get_registry_client(base_url)
+    digest = client.manifest_digest(repository, 'latest')
+    if not digest:
+        return None
+
+    candidates = version_candidates(client.tags(repository))
+    checked = 0
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        for start in range(0, len(candidates), MAX_WORKERS):
+            group = candidates[start:start + MAX_WORKERS]
+            digests = list(pool.map(lambda tag: client.manifest_digest(repository, tag), group))
+            checked += len(group)
+            for tag, tag_digest in zip(group, digests):
+                if tag_digest == digest:
+                    logger.debug(f'Latest of {repository} is {tag}, found with {checked} manifest checks')
+                    return tag
+
+    logger.debug(f'No version tag of {repository} matches latest, {checked} manifests checked')
+    return None
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from utils.common import CACHE_DIR
+
+logger = logging.getLogger(__name__.split('.')[0])
+logger.setLevel(logging.DEBUG)
+
+SERIES_TABLE_DIR = os.path.join(CACHE_DIR, 'series')
+SERIES_TABLE_VERSION = 1
+# seconds after which the series are fetched again: they change about twice a year
+SERIES_TABLE_TTL = 7 * 24 * 60 * 60
+# seconds after which a lookup of an unknown series or version fetches the series again
+SERIES_TABLE_MISS_TTL = 60 * 60
+
+# fetch_series(distro) returns the entries of the series collection of the distribution, as returned by Launchpad
+SeriesFetcher = Callable[[str], List[Dict]]
+
+_MISSING = object()
+
+
+class SeriesTable:
+    """
+    Series of a distribution: name, version and active flag of each one, in the Launchpad order (newest first),
+    indexed by name and by the tags matching them, e.g. '20.04' and 'focal' -> 'focal'.
+    The index gives the same series as scanning the table for the first one whose version contains the tag, is
+    contained in the tag, or whose name contains the tag. The tags not indexed at build time are scanned once, and
+    then indexed as well.
+    """
+
+    def __init__(self, distro: str, entries: List[Dict], refreshed: float = None) -> None:
+        """
+        :param distro: name of the distribution, e.g. ubuntu
+        :param entries: series of the distribution, each one with the keys name, version and active
+        :param refreshed: time of the fetch of the entries. Now if not given
+        """
+        self.distro = distro
+        self.refreshed = time.time() if refreshed is None else refreshed
+        self.entries = [{'name': e['name'], 'version': e['version'], 'active': e['active']} for e in entries]
+        self._by_name = {entry['name']: entry for entry in self.entries}
+        self._index: Dict[str, Optional[str]] = dict()
+        for entry in self.entries:
+            for key in (entry['version'], entry['name']):
+                self._index[key] = self.__scan(key)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __getstate__(self) -> Dict:
+        return {'version': SERIES_TABLE_VERSION, 'distro': self.distro, 'refreshed': self.refreshed,
+                'entries': self.entries}
+
+    def __setstate__(self, state: Dict) -> None:
+        if state.get('version') != SERIES_TABLE_VERSION:
+            # outdated format: empty and stale, so it is fetched again
+            self.__init__(state['distro'], [], 0.0)
+            return
+        self.__init__(state['distro'], state['entries'], state['refreshed'])
+
+    def find(self, tag: str) -> Optional[str]:
+        """
+        :param tag: version or name of the series, e.g. '20.04' or 'focal'
+        :return: the name of the series matching the tag, or None
+        """
+        name = self._index.get(tag, _MISSING)
+        if name is _MISSING:
+            name = self.__scan(tag)
+            self._index[tag] = name
+        return name
+
+    def active(self, name: str) -> Optional[bool]:
+        """
+        :param name: name of the series, e.g. 'focal'
+        :return: whether the package repositories of the series are active, or None if the series is unknown
+        """
+        entry = self._by_name.get(name)
+        return entry['active'] if entry else None
+
+    def is_stale(self, ttl: float = SERIES_TABLE_TTL) -> bool:
+        return time.time() - self.refreshed > ttl
+
+    def __scan(self, tag: str) -> Optional[str]:
+        for entry in self.entries:
+            if tag in entry['version'] or entry['version'] in tag or tag in entry['name']:
+                return entry['name']
+        return None
+
+
+_tables: Dict[str, SeriesTable] = dict()
+_tables_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_table_dir: Optional[str] = SERIES_TABLE_DIR
+
+
+def configure_series_table(table_dir: Optional[str] = SERIES_TABLE_DIR) -> None:
+    """
+    Select where the series tables are stored. The tables already loaded by the process are kept
+    :param table_dir: directory of the stored tables. If None, the tables are kept in memory only
+    """
+    global _table_dir
+    _table_dir = table_dir
+
+
+def _table_path(distro: str) -> Optional[str]:
+    if _table_dir is None:
+        return None
+    return os.path.join(_table_dir, distro + '.pickle')
+
+
+def get_series_table(distro: str, fetch_series: SeriesFetcher, ttl: float = SERIES_TABLE_TTL) -> SeriesTable:
+    """
+    Get the series table of a distribution, kept by the process and on disk, and fetched again if older than ttl
+    seconds. If it cannot be fetched again, the stale table is used
+    :param distro: name of the distribution, e.g. ubuntu
+    :param fetch_series: function fetching the series collection of the distribution
+    :param ttl: seconds after which the series are fetched again
+    :return: the series table
+    """
+    table = _cached(distro)
+    if table is not None and not table.is_stale(ttl):
+        return table
+
+    # a single fetch when the lookups of several threads find the table missing or stale
+    with _refresh_lock:
+        table = _cached(distro)
+        if table is not None and not table.is_stale(ttl):
+            return table
+        if table is None or not len(table):
+            return refresh_series_table(distro, fetch_series)
+
+        try:
+            return refresh_series_table(distro, fetch_series)
+        except Exception as e:
+            logger.warning(f'Cannot refresh the series of {distro}, using the ones of '
+                           f'{time.strftime("%Y-%m-%d", time.localtime(table.refreshed))}: {e}')
+            # tried again after SERIES_TABLE_MISS_TTL, not by every lookup
+            table.refreshed = max(table.refreshed, time.time() - ttl + SERIES_TABLE_MISS_TTL)
+            return table
+
+
+def refresh_series_table(distro: str, fetch_series: SeriesFetcher) -> SeriesTable:
+    """
+    Fetch the series of a distribution, and replace its table in the process and on disk
+    :return: the new series table
+    """
+    table = SeriesTable(distro, fetch_series(distro))
+    with _tables_lock:
+        _tables[distro] = table
+    save_series_table(table)
+    logger.debug(f'Refreshed the series of {distro}: {len(table)} series')
+    return table
+
+
+def save_series_table(table: SeriesTable) -> None:
+    """
+    Store the series table on disk, replacing the previous one atomically
+    """
+    path = _table_path(table.distro)
+    if path is None:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            pickle.dump(table, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning(f'Cannot write the series of {table.distro}: {e}')
+
+
+def _cached(distro: str) -> Optional[SeriesTable]:
+    with _tables_lock:
+        table = _tables.get(distro)
+        if table is None:
+            table = _load(distro)
+            if table is not None:
+                _tables[distro] = table
+        return table
+
+
+def _load(distro: str) -> Optional[SeriesTable]:
+    path = _table_path(distro)
+    if path is None:
+        return None
+    try:
+        with open(path, 'rb') as file:
+            table = pickle.load(file)
+        return table if isinstance(table, SeriesTable) and table.distro == distro else None
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f'Cannot read the series of {distro}: {e}')
+        return None
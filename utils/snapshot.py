@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from bisect import bisect_left
+from typing import Any, Dict, Iterator, Optional
+
+from utils.common import CACHE_DIR
+
+logger = logging.getLogger(__name__.split('.')[0])
+logger.setLevel(logging.DEBUG)
+
+# installed by "dockleaner_data.py import-snapshot", used by "--snapshot" without a path
+SNAPSHOT_PATH = os.path.join(CACHE_DIR, 'snapshot.dks')
+SNAPSHOT_MAGIC = b'DKLSNAP\x00'
+SNAPSHOT_VERSION = 1
+META_KEY = 'meta'
+
+# magic, version, reserved, number of records, offset of the keys, offset of the index, crc32 of the body
+_HEADER = struct.Struct('<8sHHIQQI')
+# offset and length of the key, offset and length of the value
+_ENTRY = struct.Struct('<QIQI')
+
+
+class SnapshotError(Exception):
+    def __init__(self, msg='Invalid snapshot file', *args, **kwargs):
+        super().__init__(msg, *args, **kwargs)
+
+
+def write_snapshot(path: str, records: Dict[str, Any]) -> int:
+    """
+    Write the given records to a snapshot file, replacing it atomically.
+    Layout: header, values (zlib-compressed JSON), keys (UTF-8) and an index of fixed-size entries sorted by key,
+    so that a reader finds a record with a binary search on the memory-mapped file, without loading it.
+
+    :param path: path of the snapshot file
+    :param records: JSON-serializable values by key
+    :return: size of the file in bytes
+    """
+    keys = sorted(records.keys(), key=lambda key: key.encode('utf-8'))
+    values = bytearray()
+    value_spans = list()
+    for key in keys:
+        value = zlib.compress(json.dumps(records[key], separators=(',', ':')).encode('utf-8'), 9)
+        value_spans.append((_HEADER.size + len(values), len(value)))
+        values += value
+
+    keys_offset = _HEADER.size + len(values)
+    keys_blob = bytearray()
+    index = bytearray()
+    for key, (value_offset, value_length) in zip(keys, value_spans):
+        encoded = key.encode('utf-8')
+        index += _ENTRY.pack(keys_offset + len(keys_blob), len(encoded), value_offset, value_length)
+        keys_blob += encoded
+
+    body = bytes(values + keys_blob + index)
+    header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, len(keys), keys_offset,
+                          keys_offset + len(keys_blob), zlib.crc32(body))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(header)
+            file.write(body)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(header) + len(body)
+
+
+class SnapshotReader:
+    """
+    Read-only view of a snapshot file, memory-mapped: opening it reads only the header, and each lookup is a binary
+    search on the index entries followed by the decompression of a single value. The mapped pages are shared by all
+    the processes reading the same file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        try:
+            with open(path, 'rb') as file:
+                self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise SnapshotError(f'Empty snapshot file: {path}') from None
+
+        if len(self._mmap) < _HEADER.size:
+            raise SnapshotError(f'Truncated snapshot file: {path}')
+        magic, version, _, count, keys_offset, index_offset, crc = _HEADER.unpack_from(self._mmap, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise SnapshotError(f'Not a snapshot file: {path}')
+        if version != SNAPSHOT_VERSION:
+            raise SnapshotError(f'Unsupported snapshot version {version} (expected {SNAPSHOT_VERSION}): {path}')
+        if index_offset + count * _ENTRY.size != len(self._mmap):
+            raise SnapshotError(f'Truncated snapshot file: {path}')
+
+        self.version = version
+        self._count = count
+        self._index_offset = index_offset
+        self._crc = crc
+        self._keys = _KeyView(self)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, key: str) -> bool:
+        return self.__find(key) is not None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        :param key: key of the record
+        :param default: value returned if there is no such record
+        :return: the decoded value of the record
+        """
+        entry = self.__find(key)
+        if entry is None:
+            return default
+        _, _, value_offset, value_length = entry
+        return json.loads(zlib.decompress(self._mmap[value_offset:value_offset + value_length]).decode('utf-8'))
+
+    def keys(self, prefix: str = '') -> Iterator[str]:
+        """
+        :return: the keys starting with the given prefix, in order
+        """
+        encoded = prefix.encode('utf-8')
+        for i in range(bisect_left(self._keys, encoded), self._count):
+            key = self._keys[i]
+            if not key.startswith(encoded):
+                break
+            yield key.decode('utf-8')
+
+    @property
+    def meta(self) -> Dict:
+        """Description of the snapshot content, written by the export"""
+        return self.get(META_KEY, {})
+
+    def verify(self) -> None:
+        """
+        Check the checksum of the file and decode every record
+        :raise SnapshotError: if the file is corrupted
+        """
+        if zlib.crc32(self._mmap[_HEADER.size:]) != self._crc:
+            raise SnapshotError(f'Corrupted snapshot file (checksum mismatch): {self.path}')
+        for key in self.keys():
+            try:
+                self.get(key)
+            except (ValueError, zlib.error) as e:
+                raise SnapshotError(f'Corrupted record {key} in {self.path}: {e}') from None
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def _entry(self, i: int):
+        return _ENTRY.unpack_from(self._mmap, self._index_offset + i * _ENTRY.size)
+
+    def _key(self, i: int) -> bytes:
+        key_offset, key_length, _, _ = self._entry(i)
+        return self._mmap[key_offset:key_offset + key_length]
+
+    def __find(self, key: str):
+        encoded = key.encode('utf-8')
+        i = bisect_left(self._keys, encoded)
+        if i < self._count and self._keys[i] == encoded:
+            return self._entry(i)
+        return None
+
+
+class _KeyView:
+    """Sequence of the keys of a snapshot, read from the mapped file, for bisect"""
+
+    def __init__(self, reader: SnapshotReader) -> None:
+        self._reader = reader
+
+    def __len__(self) -> int:
+        return len(self._reader)
+
+    def __getitem__(self, i: int) -> bytes:
+        return self._reader._key(i)
+
+
+_snapshot: Optional[SnapshotReader] = None
+_snapshot_lock = threading.Lock()
+
+
+def configure_snapshot(path: Optional[str]) -> None:
+    """
+    Select the snapshot used by the DockerHub and Launchpad lookups, which then run offline
+    :param path: path of the snapshot file. If None, the lookups use the network again
+    :raise SnapshotError: if the file is not a valid snapshot
+    """
+    global _snapshot
+    reader = SnapshotReader(path) if path else None
+    with _snapshot_lock:
+        _snapshot = reader
+    if reader is not None:
+        meta = reader.meta
+        logger.info(f'Using the snapshot {path} ({len(reader)} records, created {meta.get("created", "?")})')
+
+
+def get_snapshot() -> Optional[SnapshotReader]:
+    """
+    :return: the snapshot selected with configure_snapshot, or None when the lookups use the network
+    """
+    return _snapshot
+
@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+import calendar
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.common import CACHE_DIR
+
+logger = logging.getLogger(__name__.split('.')[0])
+logger.setLevel(logging.DEBUG)
+
+TAG_INDEX_DIR = os.path.join(CACHE_DIR, 'tags')
+TAG_INDEX_VERSION = 1
+# seconds after which the newest tags are fetched again
+TAG_INDEX_TTL = 60 * 60
+PAGE_SIZE = 100
+
+# fetch_page(page, page_size) returns a page of tags ordered by last update, newest first, as returned by DockerHub
+PageFetcher = Callable[[int, int], Dict]
+
+
+def to_epoch(timestamp: str) -> int:
+    """
+    :param timestamp: DockerHub UTC timestamp, e.g. 2023-04-12T10:05:21.123456Z
+    :return: seconds since the epoch
+    """
+    return calendar.timegm(time.strptime(timestamp[:19], '%Y-%m-%dT%H:%M:%S'))
+
+
+class TagIndex:
+    """
+    Tag history of a DockerHub repository: tag names, push times as epochs and amd64/linux digests, stored in arrays
+    sorted by push time, plus a digest -> tags hash index.
+    DockerHub lists the tags from the last updated, so the index covers the tags updated after `covered_until`: the
+    older pages are fetched only when a query could be answered by a tag not indexed yet. refresh() fetches the newest
+    pages until it reaches tags already indexed.
+    """
+
+    def __init__(self, repository: str) -> None:
+        self.repository = repository
+        self.refreshed = 0.0
+        self.complete = False
+        self.count = None
+        # changed since it was loaded or saved
+        self.dirty = False
+        self._next_page = 1
+        self._covered_until = None
+        self._tags: Dict[str, Tuple[int, int, Tuple[str, ...]]] = dict()
+        self._names: List[str] = list()
+        self._pushed = array('q')
+        self._digests: List[Tuple[str, ...]] = list()
+        self._by_digest: Dict[str, List[int]] = dict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __getstate__(self) -> Dict:
+        return {'version': TAG_INDEX_VERSION, 'repository': self.repository, 'refreshed': self.refreshed,
+                'complete': self.complete, 'count': self.count, 'next_page': self._next_page,
+                'covered_until': self._covered_until, 'tags': self._tags}
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__init__(state['repository'])
+        if state.get('version') != TAG_INDEX_VERSION:
+            return
+        self.refreshed = state['refreshed']
+        self.complete = state['complete']
+        self.count = state['count']
+        self._next_page = state['next_page']
+        self._covered_until = state['covered_until']
+        self._tags = state['tags']
+        self.__rebuild()
+        self.dirty = False
+
+    def latest_before(self, date: datetime, fetch_page: PageFetcher = None) -> Optional[str]:
+        """
+        :param date: the tags pushed on the day of the date or later are excluded
+        :param fetch_page: function fetching the older pages when needed. If None, only the indexed tags are used
+        :return: the last pushed tag before the given date, or None
+        """
+        # tags are compared by push day, as DockerHub dates
+        threshold = calendar.timegm(date.date().timetuple())
+        if date.time() != datetime.min.time():
+            threshold += 24 * 60 * 60
+
+        with self._lock:
+            while True:
+                i = bisect_left(self._pushed, threshold) - 1
+                # a tag not indexed yet was last updated, and pushed, before covered_until
+                if i >= 0 and (self.complete or self._pushed[i] >= self._covered_until):
+                    return self._names[i]
+                if self.complete or fetch_page is None:
+                    return self._names[i] if i >= 0 else None
+                self.__fetch_older(fetch_page)
+
+    def tags_with_digest(self, digest: str) -> List[str]:
+        """
+        :return: the indexed tags having the given digest, from the last pushed
+        """
+        return [self._names[i] for i in reversed(self._by_digest.get(digest, []))]
+
+    def digests(self, tag: str, fetch_page: PageFetcher = None) -> Tuple[str, ...]:
+        """
+        :param tag: tag name
+        :param fetch_page: function fetching the older pages when the tag is not indexed yet
+        :return: the amd64/linux digests of the tag, empty if the tag does not exist
+        """
+        with self._lock:
+            while tag not in self._tags and not self.complete and fetch_page is not None:
+                self.__fetch_older(fetch_page)
+            entry = self._tags.get(tag)
+            return entry[2] if entry else tuple()
+
+    def find_tag(self, predicate: Callable[[str], bool], digest: str, fetch_page: PageFetcher = None) -> Optional[str]:
+        """
+        :return: the last pushed tag with the given digest matching the predicate, fetching older pages until one
+            is found. None if there is none
+        """
+        with self._lock:
+            while True:
+                for name in self.tags_with_digest(digest):
+                    if predicate(name):
+                        return name
+                if self.complete or fetch_page is None:
+                    return None
+                self.__fetch_older(fetch_page)
+
+    @classmethod
+    def from_entries(cls, repository: str, entries: Dict[str, Tuple[int, int, Tuple[str, ...]]],
+                     count: int) -> TagIndex:
+        """
+        Build a complete index from the entries of another one, e.g. read from a snapshot
+        :param repository: repository path, e.g. library/ubuntu
+        :param entries: (push epoch, update epoch, digests) of each tag, by name
+        :param count: number of tags reported by DockerHub
+        """
+        index = cls(repository)
+        index.refreshed = time.time()
+        index.complete = True
+        index.count = count
+        index._tags = dict(entries)
+        index.__rebuild()
+        index.dirty = False
+        return index
+
+    def entries(self) -> Dict[str, Tuple[int, int, Tuple[str, ...]]]:
+        """
+        :return: (push epoch, update epoch, digests) of each indexed tag, by name
+        """
+        with self._lock:
+            return dict(self._tags)
+
+    def fetch_all(self, fetch_page: PageFetcher) -> None:
+        """
+        Fetch the older pages until the whole tag history is indexed
+        """
+        with self._lock:
+            while not self.complete:
+                self.__fetch_older(fetch_page)
+
+    def is_stale(self, ttl: float = TAG_INDEX_TTL) -> bool:
+        return time.time() - self.refreshed > ttl
+
+    def refresh(self, fetch_page: PageFetcher) -> int:
+        """
+        Fetch the tags updated since the last refresh, from the newest page until an indexed tag is reached
+        :return: number of new or updated tags
+        """
+        with self._lock:
+            if self._covered_until is None:
+                # empty index: the first page starts it
+                return self.__fetch_older(fetch_page)
+
+            updated = 0
+            added = 0
+            page = 1
+            while True:
+                response = fetch_page(page, PAGE_SIZE)
+                self.count = response['count']
+                reached = False
+                for tag_json in response['results']:
+                    if self.__known(tag_json):
+                        reached = True
+                        break
+                    added += tag_json['name'] not in self._tags
+                    self.__add(tag_json)
+                    updated += 1
+
+                if reached or not response.get('next'):
+                    break
+                page += 1
+
+            # the new tags shifted the older tags to the next pages. Rounded down: a page may be fetched twice,
+            # but no tag is skipped
+            self._next_page += added // PAGE_SIZE
+            self.refreshed = time.time()
+            self.__rebuild()
+            logger.debug(f'Refreshed the tag index of {self.repository}: {updated} new tags')
+            return updated
+
+    def __fetch_older(self, fetch_page: PageFetcher) -> int:
+        # one page more from the resume point. The pushes since the last fetch only move tags to the first pages,
+        # so the older tags are shifted back, never skipped
+        response = fetch_page(self._next_page, PAGE_SIZE)
+        self.count = response['count']
+        results = response['results']
+        for tag_json in results:
+            self.__add(tag_json)
+            updated = to_epoch(tag_json.get('last_updated') or tag_json['tag_last_pushed'])
+            if self._covered_until is None or updated < self._covered_until:
+                self._covered_until = updated
+
+        self._next_page += 1
+        if not response.get('next') or not results:
+            self.complete = True
+        if not self.refreshed:
+            self.refreshed = time.time()
+        self.__rebuild()
+        return len(results)
+
+    def __known(self, tag_json: Dict) -> bool:
+        entry = self._tags.get(tag_json['name'])
+        return entry is not None and entry[1] == to_epoch(tag_json.get('last_updated') or tag_json['tag_last_pushed'])
+
+    def __add(self, tag_json: Dict) -> None:
+        updated = to_epoch(tag_json.get('last_updated') or tag_json['tag_last_pushed'])
+        pushed = to_epoch(tag_json['tag_last_pushed']) if tag_json.get('tag_last_pushed') else updated
+        digests = tuple(image['digest'] for image in tag_json.get('images') or []
+                        if image.get('architecture') == 'amd64' and image.get('os') == 'linux' and image.get('digest'))
+        self._tags[tag_json['name']] = (pushed, updated, digests)
+
+    def __rebuild(self) -> None:
+        self.dirty = True
+        entries = sorted(self._tags.items(), key=lambda item: (item[1][0], item[0]))
+        self._names = [name for name, _ in entries]
+        self._pushed = array('q', (entry[0] for _, entry in entries))
+        self._digests = [entry[2] for _, entry in entries]
+        self._by_digest = dict()
+        for i, digests in enumerate(self._digests):
+            for digest in digests:
+                self._by_digest.setdefault(digest, []).append(i)
+
+
+_indexes: Dict[str, TagIndex] = dict()
+_indexes_lock = threading.Lock()
+_index_dir: Optional[str] = TAG_INDEX_DIR
+
+
+def configure_tag_index(index_dir: Optional[str] = TAG_INDEX_DIR) -> None:
+    """
+    Select where the tag indexes are stored. The indexes already loaded by the process are kept
+    :param index_dir: directory of the stored indexes. If None, the indexes are kept in memory only
+    """
+    global _index_dir
+    _index_dir = index_dir
+
+
+def _index_path(repository: str) -> Optional[str]:
+    if _index_dir is None:
+        return None
+    return os.path.join(_index_dir, repository.replace('/', '__') + '.pickle')
+
+
+def get_tag_index(repository: str, fetch_page: PageFetcher, ttl: float = TAG_INDEX_TTL) -> TagIndex:
+    """
+    Get the tag index of a repository, loaded from the disk on first use and refreshed if older than ttl seconds
+    :param repository: repository path, e.g. library/ubuntu
+    :param fetch_page: function fetching a page of tags of the repository
+    :param ttl: seconds after which the newest tags are fetched again
+    :return: the tag index
+    """
+    with _indexes_lock:
+        index = _indexes.get(repository)
+        if index is None:
+            index = _load(repository) or TagIndex(repository)
+            _indexes[repository] = index
+
+    if index.is_stale(ttl) or not len(index) and not index.complete:
+        index.refresh(fetch_page)
+    return index
+
+
+def save_tag_index(index: TagIndex) -> None:
+    """
+    Store the tag index on disk, replacing the previous one atomically
+    """
+    path = _index_path(index.repository)
+    if path is None:
+        index.dirty = False
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            pickle.dump(index, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        index.dirty = False
+    except Exception as e:
+        logger.warning(f'Cannot write the tag index of {index.repository}: {e}')
+
+
+def _load(repository: str) -> Optional[TagIndex]:
+    path = _index_path(repository)
+    if path is None:
+        return None
+    try:
+        with open(path, 'rb') as file:
+            index = pickle.load(file)
+        return index if isinstance(index, TagIndex) and index.repository == repository else None
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f'Cannot read the tag index of {repository}: {e}')
+        return None